@@ -95,6 +95,12 @@ matrix:
   access_token: "$ACCESS_TOKEN"
   room_id: "$ROOM_ID"
 
+# Mesh node positions as CoT PLI (sink URLs as for gps_to_tak's TAK_SINKS)
+tak:
+  sinks: "udp://239.2.3.1:6969"
+  batch_interval: 5
+  node_ttl: 3600
+
 logging:
   level: INFO
 EOF
@@ -0,0 +1,276 @@
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from metrics import Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+SENSOR_READ_SECONDS = Histogram("reduit_sensor_read_seconds", "Duration of one sensor read.", ["sensor"])
+SENSOR_ERRORS = Counter("reduit_sensor_errors_total", "Failed sensor reads.", ["sensor"])
+SENSOR_TIMEOUTS = Counter("reduit_sensor_timeouts_total", "Polls that got no reading within the timeout.", ["sensor"])
+
+
+# --- Sensor Task ---
+class SensorTask:
+    """One sensor read on its own period. `read` returns a dict of fields (or None)."""
+
+    def __init__(self, name, read, interval, timeout=None, max_age=None, on_update=None):
+        self.name = name
+        self.read = read
+        self.interval = interval
+        self.timeout = timeout if timeout is not None else interval
+        # Values older than max_age are treated as stale in the merged snapshot
+        self.max_age = max_age if max_age is not None else max(3 * interval, interval + self.timeout)
+        self.on_update = on_update
+        # Reads run on a worker so a hung bus can be timed out; at most one is in flight
+        self._executor = None
+        self._inflight = None # (future, start) of a read that outlived its poll
+
+        self.values = {}
+        self.updated = 0.0 # monotonic time of last good read
+        self.reads = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.last_duration = 0.0
+        self.max_duration = 0.0
+        self._read_seconds = SENSOR_READ_SECONDS.labels(name)
+        # Counters are read from the task at scrape time
+        SENSOR_ERRORS.labels(name).set_function(lambda: self.errors)
+        SENSOR_TIMEOUTS.labels(name).set_function(lambda: self.timeouts)
+
+
+# --- Multi-Rate Acquisition Scheduler ---
+class AcquisitionScheduler:
+    """Runs every SensorTask on its own thread and deadline, so a slow read (e.g. the
+    750 ms DS18B20 conversion) never delays a fast one. Consumers call snapshot()."""
+
+    def __init__(self):
+        self.tasks = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def add(self, task):
+        self.tasks[task.name] = task
+        return task
+
+    def start(self):
+        for task in self.tasks.values():
+            t = threading.Thread(target=self._run_task, args=(task,), name=f"sensor-{task.name}", daemon=True)
+            t.start()
+            self._threads.append(t)
+            logger.info(f"Sensor '{task.name}' scheduled every {task.interval}s (timeout {task.timeout}s)")
+
+    def stop(self):
+        self._stop.set()
+
+    def poll(self, task):
+        """Reads one task once and publishes the result. The read runs on the task's worker
+        and is given up on after task.timeout (counted as a timeout); a hung read can't be
+        interrupted, so later polls wait on that same read instead of starting another."""
+        if task._inflight is None:
+            if task._executor is None:
+                task._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"sensor-read-{task.name}")
+            task._inflight = (task._executor.submit(task.read), time.monotonic())
+        future, t0 = task._inflight
+        try:
+            values = future.result(timeout=task.timeout)
+        except FutureTimeout:
+            task.timeouts += 1
+            if task.timeouts == 1 or task.timeouts % 100 == 0:
+                logger.warning(f"Sensor '{task.name}' read still running after {time.monotonic() - t0:.1f}s "
+                               f"(timeout {task.timeout}s, {task.timeouts}x)")
+            return None
+        except Exception as e:
+            values = None
+            task.errors += 1
+            if task.errors == 1 or task.errors % 100 == 0:
+                logger.warning(f"Sensor '{task.name}' read failed ({task.errors}x): {e}")
+        task._inflight = None
+        duration = time.monotonic() - t0
+        task._read_seconds.observe(duration)
+        task.last_duration = duration
+        task.max_duration = max(task.max_duration, duration)
+
+        if values is not None:
+            with self._lock:
+                task.values = values
+                task.updated = time.monotonic()
+                task.reads += 1
+            if task.on_update:
+                try:
+                    task.on_update(values)
+                except Exception as e:
+                    logger.error(f"Sensor '{task.name}' handler failed: {e}")
+        return values
+
+    def _run_task(self, task):
+        next_due = time.monotonic()
+        while not self._stop.is_set():
+            self.poll(task)
+
+            # Fixed-rate deadlines; if we fell behind, skip the missed slots
+            next_due += task.interval
+            now = time.monotonic()
+            if next_due < now:
+                next_due = now + task.interval - ((now - next_due) % task.interval)
+            self._stop.wait(next_due - now)
+
+    def snapshot(self, defaults=None):
+        """Merges the latest fresh values of all sensors into one dict.
+        Sensors past their max_age are listed in 'stale_sensors' and keep the defaults."""
+        data = dict(defaults or {})
+        stale = []
+        now = time.monotonic()
+        with self._lock:
+            for task in self.tasks.values():
+                if task.updated and now - task.updated <= task.max_age:
+                    data.update(task.values)
+                else:
+                    stale.append(task.name)
+        data['stale_sensors'] = stale
+        return data
+
+    def stats(self):
+        now = time.monotonic()
+        return {name: {
+            'reads': t.reads, 'errors': t.errors, 'timeouts': t.timeouts,
+            'last_ms': t.last_duration * 1000.0, 'max_ms': t.max_duration * 1000.0,
+            'age_s': (now - t.updated) if t.updated else None,
+        } for name, t in self.tasks.items()}
+
+
+# --- Main Loop Ticker ---
+LOOP_LATENESS_SECONDS = Histogram("reduit_loop_tick_lateness_seconds", "Delay of each main loop tick past its deadline.")
+
+
+class Tick:
+    """One main loop tick: its deadline and when it actually fired (monotonic and wall)."""
+    __slots__ = ('index', 'deadline', 'monotonic', 'wall', 'late')
+
+    def __init__(self, index, deadline, monotonic, wall, late):
+        self.index = index
+        self.deadline = deadline
+        self.monotonic = monotonic
+        self.wall = wall
+        self.late = late
+
+
+class SampleTicker:
+    """Fixed-rate ticks for the main loop on monotonic deadlines.
+
+    Deadlines sit on a grid (previous deadline + interval), so the period doesn't grow
+    with the loop's own work. When a tick fires a whole interval or more late, 'skip'
+    drops the missed slots and stays on the grid; 'catch_up' runs them back-to-back,
+    unless it is max_catch_up slots behind. Wall time is derived from the monotonic
+    clock: small differences to the system clock are absorbed gradually, and a step
+    (NTP / RTC setting the clock) re-anchors it once and is counted.
+    """
+
+    POLICIES = ("skip", "catch_up")
+
+    def __init__(self, interval, clock, policy="skip", max_catch_up=3, miss_tolerance=0.1, step_threshold=1.0):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown tick policy {policy!r} (expected one of {self.POLICIES})")
+        self.interval = interval
+        self.clock = clock
+        self.policy = policy
+        self.max_catch_up = max_catch_up
+        self.miss_tolerance = miss_tolerance # Fraction of the interval a tick may be late
+        self.step_threshold = step_threshold # Seconds of wall clock difference treated as a step
+        self.next_deadline = None
+        self._last_deadline = None
+        self._last_tick = None
+        self._last_interval = interval # In force when the last tick fired
+        self._anchor_mono = None
+        self._anchor_wall = None
+
+        # Stats
+        self.ticks = 0
+        self.missed = 0      # Ticks that fired later than the tolerance
+        self.skipped = 0     # Slots dropped by the skip policy (or when too far behind)
+        self.overruns = 0    # Loop bodies that took longer than one interval
+        self.clock_steps = 0
+        self.last_late = 0.0
+        self.max_late = 0.0
+
+    def set_interval(self, interval):
+        """The next tick is due one new interval after the last one, not after the old
+        interval has run out; if that has already passed (a shorter interval set late in
+        the period), it is due now. Rescheduling doesn't count as lateness."""
+        if interval == self.interval: return
+        self.interval = interval
+        if self._last_deadline is not None:
+            self.next_deadline = max(self._last_deadline + interval, self.clock.monotonic())
+
+    def remaining(self):
+        """Seconds until the next tick is due (<= 0 when it is due now)."""
+        if self.next_deadline is None: return 0.0
+        return self.next_deadline - self.clock.monotonic()
+
+    def wait(self, idle=None):
+        """Blocks until the next deadline and returns its Tick. idle(timeout) is called
+        while time remains (e.g. to handle commands) and may return early; the deadline
+        is re-read after every call, so interval changes apply immediately."""
+        if self._last_tick is not None and self.clock.monotonic() - self._last_tick > self._last_interval:
+            self.overruns += 1
+        while True:
+            remaining = self.remaining()
+            if remaining <= 0: break
+            if idle: idle(remaining)
+            else: time.sleep(remaining)
+        return self.tick()
+
+    def tick(self):
+        """Fires the due tick now and schedules the next one."""
+        now = self.clock.monotonic()
+        deadline = now if self.next_deadline is None else self.next_deadline
+        late = max(0.0, now - deadline)
+        limit = self.max_catch_up if self.policy == "catch_up" else 1
+        if late >= self.interval * limit:
+            slots = int(late // self.interval)
+            self.skipped += slots
+            self.next_deadline = deadline + (slots + 1) * self.interval
+        else:
+            self.next_deadline = deadline + self.interval
+        if late > self.interval * self.miss_tolerance:
+            self.missed += 1
+        LOOP_LATENESS_SECONDS.observe(late)
+        self.last_late = late
+        self.max_late = max(self.max_late, late)
+        self._last_deadline = deadline
+        self._last_tick = now
+        self._last_interval = self.interval
+        self.ticks += 1
+        return Tick(self.ticks, deadline, now, self.wall_time(now), late)
+
+    def wall_time(self, mono):
+        """Epoch time for a monotonic timestamp, immune to small system clock corrections."""
+        wall = self.clock.time()
+        if self._anchor_mono is None:
+            self._anchor_mono, self._anchor_wall = mono, wall
+        derived = self._anchor_wall + (mono - self._anchor_mono)
+        offset = wall - derived
+        if abs(offset) > self.step_threshold:
+            self.clock_steps += 1
+            logger.warning(f"System clock stepped by {offset:+.1f}s, re-anchoring sample timestamps")
+            self._anchor_mono, self._anchor_wall = mono, wall
+            return wall
+        # Slew towards the system clock by 1% of the difference per tick
+        self._anchor_wall += offset * 0.01
+        return derived + offset * 0.01
+
+    def stats(self):
+        return {
+            'interval': self.interval,
+            'policy': self.policy,
+            'ticks': self.ticks,
+            'missed': self.missed,
+            'skipped': self.skipped,
+            'overruns': self.overruns,
+            'clock_steps': self.clock_steps,
+            'last_late_ms': self.last_late * 1000.0,
+            'max_late_ms': self.max_late * 1000.0,
+        }
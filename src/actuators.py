@@ -0,0 +1,277 @@
+import os
+import glob
+import time
+import logging
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from metrics import Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+ACTUATOR_SECONDS = Histogram("reduit_actuator_seconds", "Duration of one actuator read-compare-write.", ["actuator"])
+ACTUATOR_ERRORS = Counter("reduit_actuator_errors_total", "Failed or timed-out actuator actions.", ["actuator"])
+
+CPUFREQ_GLOB = "/sys/devices/system/cpu/cpu[0-9]*/cpufreq/scaling_governor"
+SERVICEACCOUNT_DIR = "/var/run/secrets/kubernetes.io/serviceaccount"
+
+
+# --- Actuators ---
+class Actuator:
+    """One piece of system state. `ensure(value)` reads the current value first and only
+    writes the difference; it returns True if something was changed."""
+
+    name = "actuator"
+
+    def read(self):
+        raise NotImplementedError
+
+    def write(self, value):
+        raise NotImplementedError
+
+    def ensure(self, value):
+        if self.read() == value:
+            return False
+        self.write(value)
+        return True
+
+    def invalidate(self):
+        """Forget any cached state (e.g. after the device was re-plugged)."""
+
+
+class CpuGovernor(Actuator):
+    """Writes scaling_governor for every core directly through sysfs."""
+
+    name = "cpu_governor"
+
+    def __init__(self, pattern=CPUFREQ_GLOB):
+        self.paths = sorted(glob.glob(pattern))
+
+    def _read_all(self):
+        values = {}
+        for path in self.paths:
+            with open(path, "r") as f:
+                values[path] = f.read().strip()
+        return values
+
+    def read(self):
+        values = set(self._read_all().values())
+        return values.pop() if len(values) == 1 else None # None: cores disagree
+
+    def write(self, value, paths=None):
+        for path in self.paths if paths is None else paths:
+            with open(path, "w") as f:
+                f.write(value)
+
+    def ensure(self, value):
+        if not self.paths:
+            raise RuntimeError("no cpufreq governors found")
+        # Per core, so a partially applied switch is completed without rewriting the rest
+        stale = [path for path, current in self._read_all().items() if current != value]
+        if stale: self.write(value, stale)
+        return bool(stale)
+
+
+class WifiPowerSave(Actuator):
+    """802.11 power save has no sysfs knob; it is only reachable over nl80211, so this still
+    calls `iw`, but remembers the applied state and does not fork again while it holds."""
+
+    name = "wifi_powersave"
+
+    def __init__(self, interface, timeout=3.0):
+        self.interface = interface
+        self.timeout = timeout
+        self._state = None
+
+    def read(self):
+        return self._state
+
+    def write(self, value):
+        state = "on" if value else "off"
+        subprocess.run(["iw", "dev", self.interface, "set", "power_save", state],
+                       check=True, capture_output=True, timeout=self.timeout)
+        self._state = value
+
+    def invalidate(self):
+        self._state = None
+
+
+class WifiLink(Actuator):
+    """The WiFi adapter's USB power and link. Waking it takes seconds (the device has to
+    enumerate before the link can come up), which is why it runs on the engine's pool; the
+    steps themselves are supplied by the caller. The state is not cached, so every request
+    runs its sequence again (re-binding a wedged adapter)."""
+
+    name = "wifi_link"
+
+    def __init__(self, up, down):
+        self.up = up
+        self.down = down
+
+    def read(self):
+        return None
+
+    def write(self, value):
+        (self.up if value else self.down)()
+
+
+class KubeClient:
+    """Minimal in-cluster Kubernetes API client: one pooled HTTPS session authenticated
+    with the pod's service account token."""
+
+    def __init__(self, sa_dir=SERVICEACCOUNT_DIR, timeout=3.0):
+        host = os.getenv("KUBERNETES_SERVICE_HOST")
+        port = os.getenv("KUBERNETES_SERVICE_PORT", "443")
+        if not host or not os.path.exists(os.path.join(sa_dir, "token")):
+            raise RuntimeError("not running in a Kubernetes pod")
+        if ":" in host: host = f"[{host}]"
+        self.base_url = f"https://{host}:{port}"
+        self.sa_dir = sa_dir
+        self.timeout = timeout
+        import requests # Only needed in the pod; kubectl / simulated runs never load it
+        self.session = requests.Session()
+        self.session.verify = os.path.join(sa_dir, "ca.crt")
+        self._load_token()
+
+    def _load_token(self):
+        # Projected tokens are rotated by the kubelet; reloaded whenever the API answers 401
+        with open(os.path.join(self.sa_dir, "token"), "r") as f:
+            self.session.headers["Authorization"] = f"Bearer {f.read().strip()}"
+
+    def request(self, method, path, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        resp = self.session.request(method, self.base_url + path, **kwargs)
+        if resp.status_code == 401:
+            self._load_token()
+            resp = self.session.request(method, self.base_url + path, **kwargs)
+        resp.raise_for_status()
+        return resp.json()
+
+    @staticmethod
+    def _scale_path(namespace, deployment):
+        return f"/apis/apps/v1/namespaces/{namespace}/deployments/{deployment}/scale"
+
+    def get_replicas(self, namespace, deployment):
+        return self.request("GET", self._scale_path(namespace, deployment))['spec'].get('replicas', 0)
+
+    def set_replicas(self, namespace, deployment, replicas):
+        self.request("PATCH", self._scale_path(namespace, deployment),
+                     json={'spec': {'replicas': replicas}},
+                     headers={'Content-Type': 'application/merge-patch+json'})
+
+
+class DeploymentScale(Actuator):
+    """Replica count of a deployment, via the API server when running in-cluster and via
+    kubectl (state cached, so it only forks on a change) when running on the host."""
+
+    def __init__(self, deployment, namespace="default", client=None, timeout=10.0):
+        self.deployment = deployment
+        self.namespace = namespace
+        self.client = client
+        self.timeout = timeout
+        self.name = f"scale:{deployment}"
+        self._replicas = None
+
+    def read(self):
+        if self.client:
+            return self.client.get_replicas(self.namespace, self.deployment)
+        return self._replicas
+
+    def write(self, value):
+        if self.client:
+            self.client.set_replicas(self.namespace, self.deployment, value)
+        else:
+            subprocess.run(["kubectl", "scale", "deployment", self.deployment,
+                            f"--replicas={value}", "-n", self.namespace],
+                           check=True, capture_output=True, timeout=self.timeout)
+            self._replicas = value
+
+
+class MemoryActuator(Actuator):
+    """Holds its value in memory; stands in for real actuators on simulated hardware."""
+
+    def __init__(self, name, value=None):
+        self.name = name
+        self.value = value
+
+    def read(self):
+        return self.value
+
+    def write(self, value):
+        self.value = value
+
+
+# --- Engine ---
+class ActuatorEngine:
+    """Applies a desired state across actuators concurrently, each bounded by a timeout.
+
+    `apply()` returns immediately; once every action has finished (or timed out) the
+    optional callback receives {name: 'changed' | 'unchanged' | 'timeout' | 'error: ...'}."""
+
+    def __init__(self, timeout=10.0, max_workers=4):
+        self.timeout = timeout
+        self.actuators = {}
+        self._locks = {}
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="actuator")
+        # Separate so collectors never wait for a slot behind the actions they are waiting on
+        self._collector = ThreadPoolExecutor(max_workers=1, thread_name_prefix="actuator-collect")
+
+        # Stats
+        self.applied = 0
+        self.changes = 0
+        self.errors = 0
+        self.last_duration_ms = 0.0
+
+    def register(self, actuator):
+        self.actuators[actuator.name] = actuator
+        self._locks[actuator.name] = threading.Lock()
+        return actuator
+
+    def _ensure(self, actuator, value):
+        # Serialised per actuator so overlapping mode switches can't interleave writes
+        with self._locks[actuator.name], ACTUATOR_SECONDS.labels(actuator.name).time():
+            return actuator.ensure(value)
+
+    def apply(self, desired, callback=None):
+        """desired: {actuator name: value}. Unknown names are reported as errors."""
+        start = time.monotonic()
+        futures = {}
+        results = {}
+        for name, value in desired.items():
+            actuator = self.actuators.get(name)
+            if actuator is None:
+                results[name] = "error: unknown actuator"
+                continue
+            futures[name] = self._pool.submit(self._ensure, actuator, value)
+        self.applied += 1
+        return self._collector.submit(self._collect, futures, results, start, callback)
+
+    def _collect(self, futures, results, start, callback):
+        done, _ = wait(futures.values(), timeout=self.timeout)
+        for name, future in futures.items():
+            if future not in done:
+                results[name] = "timeout"
+            elif future.exception() is not None:
+                results[name] = f"error: {future.exception()}"
+            else:
+                results[name] = "changed" if future.result() else "unchanged"
+        for name, result in results.items():
+            if result == "changed":
+                self.changes += 1
+            elif result != "unchanged":
+                self.errors += 1
+                ACTUATOR_ERRORS.labels(name).inc()
+                logger.error(f"Actuator {name} failed: {result}")
+        self.last_duration_ms = (time.monotonic() - start) * 1000.0
+        logger.info(f"Actuators applied in {self.last_duration_ms:.0f} ms: {results}")
+        if callback:
+            try:
+                callback(results)
+            except Exception as e:
+                logger.error(f"Actuator callback failed: {e}")
+        return results
+
+    def stats(self):
+        return {'applied': self.applied, 'changes': self.changes, 'errors': self.errors,
+                'last_duration_ms': self.last_duration_ms}
@@ -0,0 +1,141 @@
+import time
+import queue
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+# --- Buzzer Player ---
+class BuzzerPlayer:
+    """Plays beep patterns on its own thread so callers never sleep."""
+
+    def __init__(self, set_output, max_pending=8):
+        self.set_output = set_output # callable(bool)
+        self._patterns = queue.Queue(maxsize=max_pending)
+        self._thread = threading.Thread(target=self._run, name="buzzer", daemon=True)
+        self._thread.start()
+
+    def play(self, duration=0.1, count=1, gap=0.1):
+        """Queues `count` beeps of `duration` seconds. Dropped if the player is backed up."""
+        try:
+            self._patterns.put_nowait((duration, count, gap))
+        except queue.Full:
+            pass
+
+    def _run(self):
+        while True:
+            duration, count, gap = self._patterns.get()
+            for i in range(count):
+                try:
+                    self.set_output(True)
+                    time.sleep(duration)
+                finally:
+                    self.set_output(False)
+                if i < count - 1: time.sleep(gap)
+            time.sleep(gap) # Keep consecutive patterns distinguishable
+
+
+# --- Alert Dispatcher ---
+class AlertDispatcher:
+    """Queues alerts and delivers them from a background thread.
+
+    Bursts arriving within `coalesce_window` go out as one message, alerts with a key
+    are rate-limited per key, and failed sends are retried with exponential backoff."""
+
+    def __init__(self, send, coalesce_window=2.0, key_interval=60.0,
+                 max_pending=200, retry_min=2.0, retry_max=300.0):
+        self.send = send # callable(str), raises on failure
+        self.coalesce_window = coalesce_window
+        self.key_interval = key_interval
+        self.retry_min = retry_min
+        self.retry_max = retry_max
+
+        self._queue = queue.Queue()
+        self._pending = deque(maxlen=max_pending) # undelivered lines, oldest first
+        self._last_sent = {} # key -> monotonic time
+        self._suppressed = {} # key -> count since last delivery
+        self._idle = threading.Event()
+        self._idle.set()
+        self._idle_lock = threading.Lock()
+
+        self.sent = 0
+        self.failures = 0
+        self.suppressed_total = 0
+        self._thread = threading.Thread(target=self._run, name="alert-dispatch", daemon=True)
+        self._thread.start()
+
+    def post(self, message, key=None, min_interval=None):
+        """Non-blocking. Alerts sharing a key are sent at most once per min_interval."""
+        with self._idle_lock:
+            self._queue.put((message, key, self.key_interval if min_interval is None else min_interval))
+            self._idle.clear()
+
+    def flush(self, timeout=5.0):
+        """Waits (bounded) until everything queued has been delivered; used before shutdown."""
+        return self._idle.wait(timeout)
+
+    def _set_idle(self):
+        with self._idle_lock:
+            if self._queue.empty(): self._idle.set()
+
+    def depth(self):
+        return self._queue.qsize() + len(self._pending)
+
+    def _admit(self, message, key, min_interval):
+        if key is not None:
+            now = time.monotonic()
+            if now - self._last_sent.get(key, -min_interval - 1) < min_interval:
+                self._suppressed[key] = self._suppressed.get(key, 0) + 1
+                self.suppressed_total += 1
+                return
+            self._last_sent[key] = now
+            skipped = self._suppressed.pop(key, 0)
+            if skipped:
+                message = f"{message} (+{skipped} similar suppressed)"
+        if len(self._pending) == self._pending.maxlen:
+            logger.warning("Alert backlog full, dropping oldest alert.")
+        self._pending.append(message)
+
+    def _run(self):
+        retry_delay = self.retry_min
+        next_attempt = 0.0
+        while True:
+            # Wait for work; with a backlog, only until the next retry is due
+            timeout = max(0.0, next_attempt - time.monotonic()) if self._pending else None
+            try:
+                self._admit(*self._queue.get(timeout=timeout))
+            except queue.Empty:
+                pass
+
+            # Coalesce a burst into one message
+            window_end = time.monotonic() + self.coalesce_window
+            while True:
+                remaining = window_end - time.monotonic()
+                if remaining <= 0: break
+                try:
+                    self._admit(*self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            if not self._pending:
+                self._set_idle()
+                continue
+            if time.monotonic() < next_attempt:
+                continue
+
+            batch = list(self._pending)
+            try:
+                self.send("\n".join(batch))
+            except Exception as e:
+                self.failures += 1
+                logger.error(f"Alert delivery failed ({len(batch)} queued), retry in {retry_delay:.0f}s: {e}")
+                next_attempt = time.monotonic() + retry_delay
+                retry_delay = min(retry_delay * 2, self.retry_max)
+                continue
+            for _ in batch: self._pending.popleft()
+            self.sent += 1
+            retry_delay = self.retry_min
+            next_attempt = 0.0
+            self._set_idle()
@@ -0,0 +1,132 @@
+import os
+import json
+import time
+import logging
+from bisect import bisect_left
+
+logger = logging.getLogger(__name__)
+
+# Resting open-circuit voltage of a 12.8 V (4S) LiFePO4 pack -> state of charge
+LIFEPO4_OCV = [
+    (10.00, 0.00), (12.00, 0.09), (12.50, 0.14), (12.80, 0.17), (12.90, 0.30),
+    (13.00, 0.40), (13.10, 0.60), (13.20, 0.70), (13.30, 0.90), (13.40, 0.99), (13.60, 1.00),
+]
+
+
+def soc_from_ocv(volts, table=LIFEPO4_OCV):
+    """Linear interpolation in the OCV table."""
+    vs = [v for v, _ in table]
+    if volts <= vs[0]: return table[0][1]
+    if volts >= vs[-1]: return table[-1][1]
+    i = bisect_left(vs, volts)
+    (v0, s0), (v1, s1) = table[i - 1], table[i]
+    return s0 + (s1 - s0) * (volts - v0) / (v1 - v0)
+
+
+# --- State of Charge Estimator ---
+class SocEstimator:
+    """O(1)-per-sample SoC estimate: coulomb counting on battery current, pulled towards the
+    OCV curve only after the pack has rested, and only where the LiFePO4 curve is steep
+    enough to be informative (the 20-90 % plateau is nearly flat). State survives restarts."""
+
+    def __init__(self, capacity_ah, state_file, rest_current_a=2.0, rest_time_s=600.0,
+                 full_volts=14.2, full_current_a=2.0, charge_efficiency=0.99,
+                 power_tau_s=1800.0, save_interval_s=300.0):
+        self.capacity_ah = capacity_ah
+        self.state_file = state_file
+        self.rest_current_a = rest_current_a
+        self.rest_time_s = rest_time_s
+        self.full_volts = full_volts
+        self.full_current_a = full_current_a
+        self.charge_efficiency = charge_efficiency
+        self.power_tau_s = power_tau_s
+        self.save_interval_s = save_interval_s
+
+        self.soc = None # 0..1
+        self.avg_watts = 0.0 # Long-term average battery power (+ charging / - discharging)
+        self.volts = 0.0
+        self._last_t = None
+        self._rest_since = None
+        self._last_save = None
+        self._load()
+
+    # --- Persistence ---
+    def _load(self):
+        try:
+            with open(self.state_file, "r") as f:
+                state = json.load(f)
+            self.soc = min(1.0, max(0.0, float(state['soc'])))
+            self.avg_watts = float(state.get('avg_watts', 0.0))
+            logger.info(f"Restored SoC {self.soc * 100:.1f}% (saved {time.time() - state.get('saved', 0):.0f}s ago)")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"Could not restore SoC state: {e}")
+
+    def save(self, now=None):
+        if self.soc is None: return
+        try:
+            tmp = self.state_file + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump({'soc': self.soc, 'avg_watts': self.avg_watts, 'saved': time.time()}, f)
+            os.replace(tmp, self.state_file)
+        except Exception as e:
+            logger.warning(f"Could not persist SoC state: {e}")
+        self._last_save = time.monotonic() if now is None else now
+
+    # --- Update ---
+    def update(self, volts, amps, now=None):
+        """Feeds one battery reading (amps > 0 = charging)."""
+        now = time.monotonic() if now is None else now
+        if volts < 5.0: return # No valid reading
+        self.volts = volts
+        if self.soc is None:
+            # Cold start without saved state: best guess from the voltage
+            self.soc = soc_from_ocv(volts)
+            logger.info(f"Initial SoC from voltage: {self.soc * 100:.0f}% @ {volts:.2f}V")
+
+        dt = 0.0 if self._last_t is None else min(now - self._last_t, 60.0)
+        self._last_t = now
+
+        # 1. Coulomb counting
+        eff = self.charge_efficiency if amps > 0 else 1.0
+        self.soc += amps * eff * dt / 3600.0 / self.capacity_ah
+
+        # 2. Full-charge sync: absorption voltage with tapering current
+        if volts >= self.full_volts and 0 <= amps < self.full_current_a:
+            self.soc = 1.0
+
+        # 3. Rest correction towards the OCV curve
+        if abs(amps) < self.rest_current_a:
+            if self._rest_since is None: self._rest_since = now
+            if now - self._rest_since >= self.rest_time_s:
+                target = soc_from_ocv(volts)
+                weight = 0.01 if 0.2 <= target <= 0.9 else 0.1
+                self.soc += (target - self.soc) * weight * min(dt, 10.0) / 10.0
+        else:
+            self._rest_since = None
+
+        self.soc = min(1.0, max(0.0, self.soc))
+
+        # 4. Long-term average power for the runtime forecast (EMA)
+        if dt > 0:
+            alpha = dt / (self.power_tau_s + dt)
+            self.avg_watts += (volts * amps - self.avg_watts) * alpha
+
+        if self._last_save is None:
+            self._last_save = now
+        elif now - self._last_save >= self.save_interval_s:
+            self.save(now)
+
+    # --- Outputs ---
+    def remaining_wh(self):
+        return (self.soc or 0.0) * self.capacity_ah * (self.volts or 12.8)
+
+    def runtime_hours(self):
+        """Hours until empty at the average discharge rate; None while charging."""
+        if self.soc is None or self.avg_watts >= -0.1: return None
+        return self.remaining_wh() / -self.avg_watts
+
+    def time_to_full_hours(self):
+        if self.soc is None or self.avg_watts <= 0.1: return None
+        return (1.0 - self.soc) * self.capacity_ah * (self.volts or 12.8) / self.avg_watts
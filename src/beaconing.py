@@ -0,0 +1,115 @@
+"""Adaptive position reporting (SmartBeaconing, as in APRS trackers).
+
+Instead of one report per GPS fix, a report goes out when the position is worth telling:
+
+- moving: every `fast_rate` s at or above `fast_speed`, stretching linearly to `slow_rate`
+  as the speed drops towards `slow_speed`; earlier when the course turns by more than
+  `min_turn_angle + turn_slope / speed(km/h)` degrees (corner pegging, at most every
+  `min_turn_time` s)
+- stationary (below `slow_speed`, or above it for fewer than `moving_fixes` fixes in a row,
+  which filters GPS speed jitter): a heartbeat every `heartbeat` s, plus one report when
+  the box stops and one when it has drifted more than `min_distance` m from the last one
+- always: on the first fix, and when more than `max_distance` m away from the last report
+
+The CoT stale time follows the interval in force (`stale_factor` x the next report at the
+latest), so a parked box stays on the map between heartbeats and a moving one goes grey
+soon after it stops reporting.
+"""
+import math
+import logging
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_M = 6371000.0
+REASONS = ('first', 'interval', 'turn', 'distance', 'stopped', 'heartbeat')
+
+
+def distance_m(lat1, lon1, lat2, lon2):
+    """Equirectangular approximation; accurate to well under 1% at beaconing distances."""
+    x = math.radians(lon2 - lon1) * math.cos(math.radians((lat1 + lat2) * 0.5))
+    y = math.radians(lat2 - lat1)
+    return math.hypot(x, y) * EARTH_RADIUS_M
+
+
+def course_change(a, b):
+    """Smallest angle between two courses, in degrees."""
+    d = abs(a - b) % 360.0
+    return 360.0 - d if d > 180.0 else d
+
+
+class SmartBeacon:
+    def __init__(self, slow_speed=1.0, fast_speed=20.0, slow_rate=120.0, fast_rate=10.0,
+                 min_turn_angle=20.0, turn_slope=240.0, min_turn_time=5.0,
+                 heartbeat=600.0, min_distance=50.0, max_distance=1000.0, stale_factor=3.0, moving_fixes=2):
+        self.slow_speed = slow_speed # m/s, below is stationary
+        self.fast_speed = fast_speed # m/s
+        self.slow_rate = slow_rate   # s
+        self.fast_rate = fast_rate   # s
+        self.min_turn_angle = min_turn_angle
+        self.turn_slope = turn_slope # deg * km/h
+        self.min_turn_time = min_turn_time
+        self.heartbeat = heartbeat
+        self.min_distance = min_distance
+        self.max_distance = max_distance
+        self.stale_factor = stale_factor
+        self.moving_fixes = moving_fixes
+
+        self._last = None # (t, lat, lon, course) of the last report
+        self._moving = False
+        self._fast_fixes = 0 # Consecutive fixes at or above slow_speed
+        self.interval = heartbeat # Longest expected gap until the next report
+
+        # Stats
+        self.fixes = 0
+        self.sent = {reason: 0 for reason in REASONS}
+
+    def rate(self, speed):
+        """Report interval for a speed (m/s) while moving."""
+        if speed >= self.fast_speed:
+            return self.fast_rate
+        return min(self.slow_rate, self.fast_rate * self.fast_speed / speed)
+
+    def update(self, t, lat, lon, speed=0.0, course=0.0):
+        """Feeds one fix (t in seconds, speed in m/s, course in degrees). Returns the reason
+        to report it (one of REASONS), or None to skip it."""
+        self.fixes += 1
+        reason = self._decide(t, lat, lon, speed, course)
+        if reason:
+            self._last = (t, lat, lon, course)
+            self.sent[reason] += 1
+        return reason
+
+    def _decide(self, t, lat, lon, speed, course):
+        self._fast_fixes = self._fast_fixes + 1 if speed >= self.slow_speed else 0
+        moving = self._fast_fixes >= self.moving_fixes
+        was_moving, self._moving = self._moving, moving
+        self.interval = self.rate(speed) if moving else self.heartbeat
+        if self._last is None:
+            return 'first'
+        t0, lat0, lon0, course0 = self._last
+        elapsed = t - t0
+        moved = distance_m(lat0, lon0, lat, lon)
+        if moved > self.max_distance:
+            return 'distance'
+        if not moving:
+            if was_moving:
+                return 'stopped'
+            if moved > self.min_distance:
+                return 'distance'
+            return 'heartbeat' if elapsed >= self.heartbeat else None
+        if elapsed >= self.interval:
+            return 'interval'
+        threshold = self.min_turn_angle + self.turn_slope / (speed * 3.6)
+        if elapsed >= self.min_turn_time and course_change(course, course0) > threshold:
+            return 'turn'
+        return None
+
+    @property
+    def stale(self):
+        """CoT stale period (s) for a report sent now."""
+        return self.interval * self.stale_factor
+
+    def stats(self):
+        total = sum(self.sent.values())
+        return {'fixes': self.fixes, 'sent': total, 'ratio': self.fixes / total if total else 1.0,
+                'reasons': dict(self.sent), 'interval': self.interval}
@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+"""Hardware-free benchmark of the power monitor's main loop.
+
+Replays recorded (or synthetic) telemetry through fake drivers on a virtual clock and
+runs the real sensor handlers and process_sample() for every loop iteration, at the
+mode-dependent sample interval. Reports per-iteration latency, alert / auto-mode
+decision timing and memory growth over the simulated span.
+
+    python benchmark.py --days 14
+    python benchmark.py --recording /var/log/reduit_power --repeat 4 --json result.json
+    python benchmark.py --days 14 --baseline result.json   # exit 1 on regression
+    python benchmark.py --startup                          # import / plugin start-up cost
+    python benchmark.py --cot --entities 200               # CoT encode cost / size per event
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import tempfile
+import subprocess
+import tracemalloc
+
+import numpy as np
+
+
+def rss_bytes():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+class Samples:
+    """Preallocated timing buffer, so the harness itself doesn't show up as memory growth."""
+
+    def __init__(self, size):
+        self.values = np.full(size, 0.0) # Written now, so its pages are resident before the run
+        self.count = 0
+
+    def append(self, value):
+        if self.count < len(self.values):
+            self.values[self.count] = value
+            self.count += 1
+
+
+def percentiles(samples):
+    if not samples.count:
+        return {}
+    arr = samples.values[:samples.count] * 1000.0
+    return {'count': len(arr), 'mean_ms': float(arr.mean()), 'p50_ms': float(np.percentile(arr, 50)),
+            'p95_ms': float(np.percentile(arr, 95)), 'p99_ms': float(np.percentile(arr, 99)),
+            'max_ms': float(arr.max())}
+
+
+class RecordingDispatcher:
+    """Collects alerts instead of sending them (same post() signature as AlertDispatcher)."""
+
+    def __init__(self):
+        self.count = 0
+        self.keys = {}
+
+    def post(self, message, key=None, min_interval=None):
+        self.count += 1
+        self.keys[key] = self.keys.get(key, 0) + 1
+
+    def flush(self, timeout=5.0):
+        return True
+
+    def depth(self):
+        return 0
+
+
+def timed(fn, samples):
+    def wrapper(*args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            samples.append(time.perf_counter() - t0)
+    return wrapper
+
+
+def run(records, repeat=1, trace=False, memory_every_s=86400.0):
+    # Everything the monitor writes goes to a scratch directory; must be set before import
+    workdir = tempfile.mkdtemp(prefix="reduit-bench-")
+    os.environ.update({
+        'REDUIT_HARDWARE': 'replay',
+        'REDUIT_STATUS_PATH': os.path.join(workdir, "status"),
+        'TELEMETRY_LOG_DIR': os.path.join(workdir, "telemetry"),
+        'SOC_STATE_FILE': os.path.join(workdir, "soc.json"),
+        'INFLUX_SPOOL_DIR': os.path.join(workdir, "spool"),
+        'MATRIX_SYNC_TOKEN_FILE': os.path.join(workdir, "next_batch"),
+        'INFLUX_TOKEN': '', 'MATRIX_ACCESS_TOKEN': '',
+    })
+    import hardware
+    import replay
+    import power_monitor as pm
+
+    clock = replay.ReplayClock(float(records['timestamp'][0]))
+    hardware.set_clock(clock)
+    source = replay.ReplaySource(records, clock, repeat=repeat)
+
+    pm.setup_gpio()
+    pm.GPIO.bind_input(pm.PIN_LID_SENSOR, lambda: source.row['lid_open'])
+    pm.temp_sensor = replay.ReplayThermSensor(source, 'ds18b20')
+    pm.alert_dispatcher = alerts = RecordingDispatcher()
+    scheduler = pm.build_scheduler(replay.replay_sensors(source))
+    # Same ticker as main(); work takes no virtual time, so ticks are never late here
+    ticker = pm.sample_ticker = pm.SampleTicker(pm.current_sample_interval, clock, policy=pm.SAMPLE_TICK_POLICY)
+
+    # Decision stages are timed by wrapping the module-level functions process_sample calls
+    size = int((source.end - source.start) / min(pm.SAMPLE_INTERVAL_ACTIVE, pm.SAMPLE_INTERVAL_ECO)) + 2
+    threshold_times, auto_times, loop_times, read_times = (Samples(size) for _ in range(4))
+    pm.check_sensor_thresholds = timed(pm.check_sensor_thresholds, threshold_times)
+    pm.check_auto_mode = timed(pm.check_auto_mode, auto_times)
+
+    next_due = {name: 0.0 for name in scheduler.tasks}
+    memory = []
+    next_memory = 0.0
+    modes = {}
+    if trace: tracemalloc.start()
+    trace_start = tracemalloc.take_snapshot() if trace else None
+
+    wall_start = time.perf_counter()
+    iterations = 0
+    while not source.done:
+        tick = ticker.tick()
+        now = tick.monotonic
+        t0 = time.perf_counter()
+        # Sensor tasks that are due in virtual time (each at its own rate)
+        for name, task in scheduler.tasks.items():
+            if next_due[name] <= now:
+                scheduler.poll(task)
+                next_due[name] = now + task.interval
+        t1 = time.perf_counter()
+        pm.process_sample(scheduler.snapshot(pm.SNAPSHOT_DEFAULTS), tick)
+        t2 = time.perf_counter()
+        read_times.append(t1 - t0)
+        loop_times.append(t2 - t0)
+        iterations += 1
+        modes[pm.current_mode] = modes.get(pm.current_mode, 0) + 1
+
+        if now >= next_memory:
+            memory.append((now / 86400.0, rss_bytes()))
+            next_memory = now + memory_every_s
+        clock.advance(max(0.0, ticker.remaining()))
+    wall = time.perf_counter() - wall_start
+    memory.append((clock.monotonic() / 86400.0, rss_bytes()))
+
+    simulated_days = clock.monotonic() / 86400.0
+    (d0, m0), (d1, m1) = memory[0], memory[-1]
+    result = {
+        'iterations': iterations,
+        'simulated_days': simulated_days,
+        'wall_s': wall,
+        'speedup': clock.monotonic() / wall if wall else None,
+        'loop': percentiles(loop_times),
+        'sensor_reads': percentiles(read_times),
+        'thresholds': percentiles(threshold_times),
+        'auto_mode': percentiles(auto_times),
+        'memory': {
+            'rss_start_mb': m0 / 1e6, 'rss_end_mb': m1 / 1e6,
+            'growth_mb_per_week': (m1 - m0) / 1e6 / max(d1 - d0, 1e-9) * 7.0,
+            'samples': [(round(d, 2), round(m / 1e6, 2)) for d, m in memory],
+        },
+        'alerts': alerts.count,
+        'alert_keys': {str(k): v for k, v in alerts.keys.items()},
+        'mode_iterations': modes,
+        'final_soc_pct': (pm.soc_estimator.soc or 0.0) * 100.0,
+        'compression': pm.compressor.stats() if pm.compressor else None,
+        'ticker': ticker.stats(),
+    }
+    if trace:
+        top = tracemalloc.take_snapshot().compare_to(trace_start, 'lineno')[:10]
+        result['memory']['top_growth'] = [str(stat) for stat in top]
+        tracemalloc.stop()
+    return result
+
+
+# Heavy dependencies that should only be loaded when their plugin is in use
+HEAVY_MODULES = ("influxdb_client", "requests", "numpy", "smbus2", "w1thermsensor", "RPi")
+
+_STARTUP_PROBE = """
+import sys, time, json
+t0 = time.perf_counter()
+import power_monitor as pm
+t1 = time.perf_counter()
+pm.init_plugins()
+t2 = time.perf_counter()
+rss = {}
+with open("/proc/self/status") as f:
+    for line in f:
+        key, _, value = line.partition(":")
+        if key in ("VmRSS", "VmHWM"): rss[key] = int(value.split()[0]) * 1024
+print(json.dumps({'import_s': t1 - t0, 'init_s': t2 - t1, 'rss': rss['VmRSS'], 'peak_rss': rss['VmHWM'],
+                  'modules': [m for m in %r if m in sys.modules]}))
+"""
+
+
+def startup(runs=5):
+    """Imports power_monitor and starts its plugins in fresh interpreters (the way the pod
+    starts), with the current environment's configuration. Returns the median run."""
+    env = dict(os.environ)
+    workdir = tempfile.mkdtemp(prefix="reduit-startup-")
+    env.setdefault('REDUIT_HARDWARE', 'replay')
+    env.setdefault('REDUIT_STATUS_PATH', os.path.join(workdir, "status"))
+    env.setdefault('INFLUX_SPOOL_DIR', os.path.join(workdir, "spool"))
+    env.setdefault('SOC_STATE_FILE', os.path.join(workdir, "soc.json"))
+    here = os.path.dirname(os.path.abspath(__file__))
+    results = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        out = subprocess.run([sys.executable, "-c", _STARTUP_PROBE % (HEAVY_MODULES,)], cwd=here, env=env,
+                             capture_output=True, text=True, check=True).stdout
+        result = json.loads(out.strip().splitlines()[-1])
+        result['process_s'] = time.perf_counter() - t0
+        results.append(result)
+    results.sort(key=lambda r: r['process_s'])
+    return results[len(results) // 2]
+
+
+def _legacy_cot(status_reader, uid, callsign, lat, lon, hae, speed, course):
+    """gps_to_tak's encoder before cot.py (datetime formatting, status read and f-string per event)."""
+    from datetime import datetime, timezone
+    now = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+    stale_iso = datetime.fromtimestamp(datetime.now(timezone.utc).timestamp() + 120, timezone.utc) \
+        .strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+    remarks = "Le Reduit: Online"
+    d = status_reader.read()
+    if d and d['stale']:
+        remarks = f"Le Reduit: Online (power monitor silent for {d['age'] / 60:.0f} min)"
+    elif d:
+        remarks = (f"🔋 {d['soc_pct']:.0f}% {d['system_volts']:.1f}V {d['net_watts']:.0f}W | "
+                   f"🌡️ {d['temperature']:.0f}C | 💡 {d['lux']:.0f}lx | {'🔓 OPEN' if d['lid_open'] else '🔒'}")
+    xml = f"""<?xml version='1.0' standalone='yes'?>
+<event version="2.0" uid="{uid}" type="a-f-G-U-C" time="{now}" start="{now}" stale="{stale_iso}" how="m-g">
+    <point lat="{lat}" lon="{lon}" hae="{hae}" ce="9999999" le="9999999"/>
+    <detail>
+        <contact callsign="{callsign}"/>
+        <track course="{course}" speed="{speed}"/>
+        <remarks>{remarks}</remarks>
+    </detail>
+</event>"""
+    return xml.encode('utf-8')
+
+
+def cot(events=50000, entities=100):
+    """Encode cost per CoT event, round-robin over `entities` encoders sharing one remarks
+    cache, against the previous per-event encoder. The status channel is republished every
+    100 ms of the benchmark's wall time, so the remarks cache sees real updates."""
+    from status_channel import StatusWriter, StatusReader
+    from cot import CotEncoder, TakProtoEncoder, TelemetryRemarks
+    path = os.path.join(tempfile.mkdtemp(prefix="reduit-cot-"), "status")
+    writer, reader = StatusWriter(path), StatusReader(path)
+    status = {'soc_pct': 87.0, 'system_volts': 13.1, 'net_watts': 12.0, 'temperature': 24.0,
+              'lux': 0.0, 'lid_open': False}
+    writer.publish(status, "tactical")
+    remarks = TelemetryRemarks(reader)
+    encoders = [CotEncoder(f"mesh-{i:04x}", f"NODE-{i}") for i in range(entities)]
+    proto_encoders = [TakProtoEncoder(f"mesh-{i:04x}", f"NODE-{i}") for i in range(entities)]
+    rng = np.random.default_rng(1)
+    fixes = [(46.9 + rng.random() * 0.1, 7.4 + rng.random() * 0.1, 540.0 + rng.random() * 10,
+              rng.random() * 3.0, rng.random() * 360.0) for _ in range(1024)]
+
+    def measure(encode):
+        next_publish, size = time.monotonic() + 0.1, 0
+        t0 = time.perf_counter()
+        for i in range(events):
+            if time.monotonic() >= next_publish:
+                writer.publish(status, "tactical")
+                next_publish += 0.1
+            size += len(encode(i, *fixes[i & 1023]))
+        return (time.perf_counter() - t0) / events, size / events
+
+    new_s, new_bytes = measure(lambda i, *fix: encoders[i % entities].encode(*fix, remarks=remarks.get()))
+    proto_s, proto_bytes = measure(lambda i, *fix: proto_encoders[i % entities].encode(*fix, remarks=remarks.get()))
+    old_s, old_bytes = measure(lambda i, *fix: _legacy_cot(reader, f"mesh-{i % entities:04x}", f"NODE-{i % entities}", *fix))
+    writer.close()
+    return {'events': events, 'entities': entities,
+            'encode_us': new_s * 1e6, 'legacy_encode_us': old_s * 1e6,
+            'bytes': new_bytes, 'legacy_bytes': old_bytes,
+            'protobuf_encode_us': proto_s * 1e6, 'protobuf_bytes': proto_bytes,
+            'remarks_refreshes': remarks.refreshes, 'remarks_hits': remarks.hits}
+
+
+def compare(result, baseline, tolerance):
+    """Returns the list of metrics that regressed beyond the tolerance."""
+    regressions = []
+    for stage in ('loop', 'thresholds', 'auto_mode'):
+        for metric in ('p50_ms', 'p95_ms'):
+            old, new = baseline.get(stage, {}).get(metric), result[stage].get(metric)
+            if old and new and new > old * (1.0 + tolerance):
+                regressions.append(f"{stage}.{metric}: {old:.3f} -> {new:.3f}")
+    old = baseline.get('memory', {}).get('growth_mb_per_week')
+    new = result['memory']['growth_mb_per_week']
+    if old is not None and new > max(old, 0.0) * (1.0 + tolerance) + 1.0:
+        regressions.append(f"memory.growth_mb_per_week: {old:.2f} -> {new:.2f}")
+    return regressions
+
+
+def report(result):
+    print(f"Simulated {result['simulated_days']:.1f} days in {result['wall_s']:.1f}s "
+          f"({result['speedup']:.0f}x real time), {result['iterations']} iterations")
+    for stage in ('loop', 'sensor_reads', 'thresholds', 'auto_mode'):
+        s = result[stage]
+        if s:
+            print(f"  {stage:<13} mean {s['mean_ms']:.3f} | p50 {s['p50_ms']:.3f} | p95 {s['p95_ms']:.3f} | "
+                  f"p99 {s['p99_ms']:.3f} | max {s['max_ms']:.3f} ms")
+    m = result['memory']
+    print(f"  memory        RSS {m['rss_start_mb']:.1f} -> {m['rss_end_mb']:.1f} MB "
+          f"({m['growth_mb_per_week']:+.2f} MB/week)")
+    for line in m.get('top_growth', []):
+        print(f"    {line}")
+    print(f"  alerts {result['alerts']} {result['alert_keys']} | modes {result['mode_iterations']} | "
+          f"final SoC {result['final_soc_pct']:.0f}%")
+    c = result.get('compression')
+    if c:
+        fields = " ".join(f"{name} {ratio:.1f}x" for name, ratio in c['fields'].items())
+        print(f"  compression   {c['ratio']:.1f}x values, {c['row_ratio']:.1f}x records | {fields}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay telemetry through the power monitor loop and benchmark it.")
+    parser.add_argument("--recording", help="Telemetry log directory or CSV (default: synthetic data)")
+    parser.add_argument("--days", type=float, default=7.0, help="Days of synthetic data")
+    parser.add_argument("--interval", type=float, default=5.0, help="Synthetic sample interval (s)")
+    parser.add_argument("--repeat", type=int, default=1, help="Play the recording N times back-to-back")
+    parser.add_argument("--tracemalloc", action="store_true", help="Report the top allocation growth (slower)")
+    parser.add_argument("--json", help="Write the result to this file")
+    parser.add_argument("--baseline", help="Compare against a previous --json result")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative regression")
+    parser.add_argument("--startup", action="store_true", help="Measure start-up time and RSS instead")
+    parser.add_argument("--cot", action="store_true", help="Measure CoT event encoding instead")
+    parser.add_argument("--entities", type=int, default=100, help="Distinct CoT entities for --cot")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    if args.startup:
+        r = startup()
+        print(f"Start-up: process {r['process_s'] * 1000:.0f} ms (import {r['import_s'] * 1000:.0f} ms, "
+              f"plugins {r['init_s'] * 1000:.0f} ms) | RSS {r['rss'] / 1e6:.1f} MB (peak {r['peak_rss'] / 1e6:.1f} MB)")
+        print(f"  heavy modules loaded: {', '.join(r['modules']) or 'none'}")
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(r, f, indent=2)
+        return
+
+    if args.cot:
+        r = cot(entities=args.entities)
+        print(f"CoT encode ({r['events']} events, {r['entities']} entities): {r['encode_us']:.2f} us/event, "
+              f"{r['bytes']:.0f} B | previous encoder {r['legacy_encode_us']:.2f} us/event, "
+              f"{r['legacy_bytes']:.0f} B ({r['legacy_encode_us'] / r['encode_us']:.1f}x)")
+        print(f"  TAK protocol v1 (mesh framing): {r['protobuf_encode_us']:.2f} us/event, {r['protobuf_bytes']:.0f} B "
+              f"({1.0 - r['protobuf_bytes'] / r['bytes']:.0%} smaller than XML)")
+        print(f"  remarks rebuilt {r['remarks_refreshes']}x, cached {r['remarks_hits']}x")
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(r, f, indent=2)
+        return
+
+    # Configured before power_monitor is imported, so its basicConfig() leaves this in place
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+    import replay
+    records = replay.load_recording(args.recording) if args.recording else \
+        replay.synthesize(days=args.days, interval=args.interval)
+    result = run(records, repeat=args.repeat, trace=args.tracemalloc)
+    report(result)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(result, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""Per-field deadband and swinging-door compression of the telemetry stream.
+
+Sits between the sampling loop and the storage / uplink sinks: a field's value is only
+passed on when it leaves its tolerance band, or when its keepalive is due, so a flat
+signal costs one point per keepalive instead of one per sample.
+
+- deadband: emits when the value moves more than `tolerance` from the last emitted one.
+- sdt (swinging door): emits the points needed to redraw the signal as straight lines
+  that stay within `tolerance` of every sample. The archived point is the sample before
+  the one that opened the door, so it comes out one sample late, with its own timestamp.
+"""
+import math
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Deadband:
+    def __init__(self, tolerance):
+        self.tolerance = tolerance
+        self.value = None
+
+    def offer(self, t, v):
+        """Returns the (t, v) points to archive for this sample."""
+        if self.value is None or abs(v - self.value) > self.tolerance:
+            self.value = v
+            return ((t, v),)
+        return ()
+
+    def force(self, t, v):
+        """Marks (t, v) as archived (keepalive)."""
+        self.value = v
+
+    def pending(self):
+        return None
+
+
+class SwingingDoor:
+    def __init__(self, tolerance):
+        self.tolerance = tolerance
+        self.anchor = None # Last archived point
+        self.prev = None   # Last sample, archived if the next one opens the door
+        self.slope_hi = math.inf
+        self.slope_lo = -math.inf
+
+    def offer(self, t, v):
+        if self.anchor is None:
+            self.force(t, v)
+            return ((t, v),)
+        t0, v0 = self.anchor
+        dt = t - t0
+        if dt <= 0:
+            return ()
+        hi = min(self.slope_hi, (v + self.tolerance - v0) / dt)
+        lo = max(self.slope_lo, (v - self.tolerance - v0) / dt)
+        if lo <= hi:
+            self.slope_hi, self.slope_lo = hi, lo
+            self.prev = (t, v)
+            return ()
+        # Doors opened: the previous sample ends the segment and anchors the next one
+        archived = self.prev
+        tp, vp = archived
+        dt = t - tp
+        self.anchor = archived
+        self.slope_hi = (v + self.tolerance - vp) / dt
+        self.slope_lo = (v - self.tolerance - vp) / dt
+        self.prev = (t, v)
+        return (archived,)
+
+    def force(self, t, v):
+        self.anchor = (t, v)
+        self.prev = None
+        self.slope_hi, self.slope_lo = math.inf, -math.inf
+
+    def pending(self):
+        """The last sample if it isn't archived yet (needed to close the last segment)."""
+        return self.prev
+
+
+COMPRESSORS = {'deadband': Deadband, 'sdt': SwingingDoor}
+
+
+class TelemetryCompressor:
+    """Runs one compressor per configured field over whole sample dicts.
+
+    process() returns the records to store as (ts, row, fields) tuples, oldest first: `row`
+    is the sample the values come from and `fields` the field names to write from it. A
+    point archived late comes with the sample it was taken from, which is not necessarily
+    the previous one (the field may have been missing since). Fields that aren't
+    configured are never compressed; they ride along with every record taken from the
+    current sample but don't cause one on their own.
+    """
+
+    def __init__(self, config, keepalive=300.0, carry=()):
+        """config: {field: (kind, tolerance)} with kind 'deadband' or 'sdt'."""
+        self.config = dict(config)
+        self.keepalive = keepalive
+        self.carry = list(carry)
+        self._compressors = {name: COMPRESSORS[kind](tolerance) for name, (kind, tolerance) in self.config.items()}
+        self._last_emit = {name: None for name in self.config}
+        self._rows = {name: None for name in self.config} # (ts, row) of each field's last sample
+
+        # Stats
+        self.values_in = {name: 0 for name in self.config}
+        self.values_out = {name: 0 for name in self.config}
+        self.rows_in = 0
+        self.rows_out = 0
+
+    def process(self, ts, data):
+        now_fields, held = [], {} # held: earlier ts -> (row, fields) for points archived late
+        keepalive = self.keepalive
+        last_emit = self._last_emit
+        rows = self._rows
+        for name, comp in self._compressors.items():
+            v = data.get(name)
+            if v is None: continue
+            v = float(v)
+            if v != v: continue
+            self.values_in[name] += 1
+            last = last_emit[name]
+            if last is not None and ts - last >= keepalive:
+                # Close the open segment first, or the samples since its anchor are lost
+                if comp.pending() is not None:
+                    self._hold(held, name)
+                comp.force(ts, v)
+                now_fields.append(name)
+                last_emit[name] = ts
+            else:
+                for t, _ in comp.offer(ts, v):
+                    if t == ts:
+                        now_fields.append(name)
+                    else:
+                        self._hold(held, name)
+                    last_emit[name] = t
+            rows[name] = (ts, data)
+
+        records = [(t, row, fields) for t, (row, fields) in sorted(held.items(), key=lambda item: item[0])]
+        if now_fields:
+            records.append((ts, data, now_fields + [name for name in self.carry if data.get(name) is not None]))
+        self._count(records)
+        self.rows_in += 1
+        return records
+
+    def _hold(self, held, name):
+        """Adds `name` to the record for the sample its pending point came from."""
+        t, row = self._rows[name]
+        held.setdefault(t, (row, []))[1].append(name)
+
+    def flush(self):
+        """Records for the samples still held back by swinging-door compressors, e.g. before
+        shutdown. Afterwards the next sample starts fresh segments."""
+        held = {}
+        for name, comp in self._compressors.items():
+            pending = comp.pending()
+            if pending is None: continue
+            self._hold(held, name)
+            comp.force(*pending)
+            self._last_emit[name] = pending[0]
+        records = [(t, row, fields) for t, (row, fields) in sorted(held.items(), key=lambda item: item[0])]
+        self._count(records)
+        return records
+
+    def _count(self, records):
+        for _, _, fields in records:
+            self.rows_out += 1
+            for name in fields:
+                if name in self.values_out:
+                    self.values_out[name] += 1
+
+    def ratio(self, name=None):
+        """Values in per value out (overall or for one field); 1.0 until something went out."""
+        if name is None:
+            vin, vout = sum(self.values_in.values()), sum(self.values_out.values())
+        else:
+            vin, vout = self.values_in[name], self.values_out[name]
+        return vin / vout if vout else 1.0
+
+    def stats(self):
+        return {
+            'ratio': self.ratio(),
+            'row_ratio': self.rows_in / self.rows_out if self.rows_out else 1.0,
+            'rows_in': self.rows_in,
+            'rows_out': self.rows_out,
+            'fields': {name: self.ratio(name) for name in self.config},
+        }
@@ -0,0 +1,216 @@
+"""Cursor-on-Target (CoT) event encoding for the TAK bridges.
+
+Everything about an event that doesn't change between fixes (uid, type, callsign, the
+XML around the values) is escaped and laid out once per entity in CotEncoder, so encoding
+a fix is one string format plus one UTF-8 encode. Timestamps reuse the formatted
+"YYYY-MM-DDTHH:MM:SS" of the current second, and the telemetry remarks are only rebuilt
+when the power monitor publishes a new status.
+
+TakProtoEncoder produces the same events as TAK Protocol Version 1 (a protobuf
+TakMessage), framed for mesh (UDP) or streaming (TCP) transport. The handful of message
+fields a PLI needs are written directly in protobuf wire format, so no generated code or
+protobuf runtime is required.
+"""
+import time
+import struct
+import logging
+from xml.sax.saxutils import quoteattr, escape
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TYPE = "a-f-G-U-C" # Friendly - Ground - Unit - Combat
+DEFAULT_STALE = 120.0      # seconds
+UNKNOWN = "9999999"        # CoT "no error estimate" for ce / le (metres)
+
+
+# --- Time ---
+class CotClock:
+    """ISO 8601 UTC timestamps as CoT wants them, with the date/time part cached per second."""
+
+    def __init__(self):
+        self._prefixes = {}
+
+    def iso(self, ts):
+        sec = int(ts)
+        prefix = self._prefixes.get(sec)
+        if prefix is None:
+            if len(self._prefixes) > 16: # Only "now" and "now + stale" are ever hot
+                self._prefixes.clear()
+            prefix = self._prefixes[sec] = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(sec))
+        return f"{prefix}.{int((ts - sec) * 1e6):06d}Z"
+
+cot_clock = CotClock()
+
+
+# --- Encoder ---
+class CotEncoder:
+    """PLI (position) events for one entity; the static parts are precompiled at construction."""
+
+    def __init__(self, uid, callsign, cot_type=DEFAULT_TYPE, how="m-g", stale=DEFAULT_STALE, clock=cot_clock):
+        self.uid = uid
+        self.callsign = callsign
+        self.cot_type = cot_type
+        self.stale = stale
+        self.clock = clock
+        # % placeholders: time, start, stale, lat, lon, hae, ce, le, course, speed, remarks
+        self._template = (
+            "<?xml version='1.0' standalone='yes'?>"
+            f"<event version=\"2.0\" uid={self._attr(uid)} type={self._attr(cot_type)} "
+            "time=\"%s\" start=\"%s\" stale=\"%s\" "
+            f"how={self._attr(how)}>"
+            "<point lat=\"%.7f\" lon=\"%.7f\" hae=\"%.1f\" ce=\"%s\" le=\"%s\"/>"
+            f"<detail><contact callsign={self._attr(callsign)}/>"
+            "<track course=\"%.1f\" speed=\"%.2f\"/>%s</detail></event>"
+        )
+
+    @staticmethod
+    def _attr(value):
+        # Attribute values are built into a %-template, so literal % must be doubled
+        return quoteattr(str(value)).replace("%", "%%")
+
+    def encode(self, lat, lon, hae=0.0, speed=0.0, course=0.0, remarks="", now=None, stale=None,
+               ce=UNKNOWN, le=UNKNOWN):
+        """Returns the event as UTF-8 bytes. `remarks` must already be an XML element (see
+        remarks_element()); `stale` overrides the encoder's stale period in seconds."""
+        if now is None:
+            now = time.time()
+        t = self.clock.iso(now)
+        return (self._template % (
+            t, t, self.clock.iso(now + (self.stale if stale is None else stale)),
+            lat, lon, hae, ce, le, course, speed, remarks,
+        )).encode('utf-8')
+
+
+# --- TAK Protocol Version 1 ---
+# Field keys ((number << 3) | wire type) of the takproto messages used here
+# TakMessage: cotEvent=2 | CotEvent: type=1 uid=5 sendTime=6 startTime=7 staleTime=8 how=9
+# lat=10 lon=11 hae=12 ce=13 le=14 detail=15 | Detail: xmlDetail=1 contact=2 track=7
+# Contact: callsign=2 | Track: speed=1 course=2
+_POINT = struct.Struct("<BdBdBdBdBd")   # lat, lon, hae, ce, le (doubles)
+_TRACK = struct.Struct("<BBBdBd")       # Detail.track (length 18) -> speed, course
+MESH_HEADER = b"\xbf\x01\xbf"        # Magic, protocol version 1, magic
+STREAM_MAGIC = b"\xbf"                 # Followed by the varint message length
+
+def _varint(n):
+    out = bytearray()
+    while n > 0x7f:
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+    out.append(n)
+    return bytes(out)
+
+def _length_delimited(key, payload):
+    return bytes((key,)) + _varint(len(payload)) + payload
+
+
+class TakProtoEncoder:
+    """Same PLI events as CotEncoder (same encode() arguments) as TAK Protocol v1 protobuf.
+    `framing` is "mesh" (UDP multicast) or "stream" (TCP/TLS to a TAK server)."""
+
+    def __init__(self, uid, callsign, cot_type=DEFAULT_TYPE, how="m-g", stale=DEFAULT_STALE, framing="mesh"):
+        if framing not in ("mesh", "stream"):
+            raise ValueError(f"Unknown TAK protocol framing: {framing}")
+        self.uid = uid
+        self.callsign = callsign
+        self.cot_type = cot_type
+        self.stale = stale
+        self.framing = framing
+        self._head = _length_delimited(0x0a, cot_type.encode('utf-8')) + \
+            _length_delimited(0x2a, uid.encode('utf-8'))
+        self._how = _length_delimited(0x4a, how.encode('utf-8'))
+        self._contact = _length_delimited(0x12, _length_delimited(0x12, callsign.encode('utf-8')))
+        self._remarks = None
+        self._xml_detail = b""
+
+    def encode(self, lat, lon, hae=0.0, speed=0.0, course=0.0, remarks="", now=None, stale=None,
+               ce=UNKNOWN, le=UNKNOWN):
+        """Returns the framed TakMessage. `remarks` is the XML element CotEncoder takes; it is
+        carried as the event's xmlDetail."""
+        if now is None:
+            now = time.time()
+        if remarks is not self._remarks:
+            self._remarks = remarks
+            self._xml_detail = _length_delimited(0x0a, remarks.encode('utf-8')) if remarks else b""
+        ms = int(now * 1000)
+        t = _varint(ms)
+        detail = b"".join((self._xml_detail, self._contact, _TRACK.pack(0x3a, 18, 0x09, speed, 0x11, course)))
+        event = b"".join((
+            self._head, b"\x30", t, b"\x38", t,
+            b"\x40", _varint(ms + int((self.stale if stale is None else stale) * 1000)), self._how,
+            _POINT.pack(0x51, lat, 0x59, lon, 0x61, hae, 0x69, float(ce), 0x71, float(le)),
+            b"\x7a", _varint(len(detail)), detail,
+        ))
+        message = b"\x12" + _varint(len(event)) + event
+        if self.framing == "mesh":
+            return MESH_HEADER + message
+        return STREAM_MAGIC + _varint(len(message)) + message
+
+
+# Wire encodings selectable per sink
+ENCODERS = {'xml': CotEncoder, 'protobuf': TakProtoEncoder}
+
+
+def remarks_element(text):
+    return f"<remarks>{escape(text)}</remarks>" if text else ""
+
+
+# --- Telemetry Remarks ---
+def reading(value, spec):
+    """One status reading formatted with `spec`, or "?" if the monitor didn't have it."""
+    return "?" if value is None else format(value, spec)
+
+
+def format_status(d):
+    """Remarks text for a power monitor status dict (as returned by StatusReader.read())."""
+    if d['stale']:
+        return f"Le Reduit: Online (power monitor silent for {d['age'] / 60:.0f} min)"
+    lid = "?" if d['lid_open'] is None else "🔓 OPEN" if d['lid_open'] else "🔒"
+    return (f"🔋 {reading(d['soc_pct'], '.0f')}% {reading(d['system_volts'], '.1f')}V "
+            f"{reading(d['net_watts'], '.0f')}W | "
+            f"🌡️ {reading(d['temperature'], '.0f')}C | "
+            f"💡 {reading(d['lux'], '.0f')}lx | "
+            f"{lid}")
+
+
+class TelemetryRemarks:
+    """Caches the escaped <remarks> element built from the status channel. It is rebuilt when
+    the monitor publishes (sequence number changes), when the cached status turns stale,
+    and once a minute while it is stale (the "silent for N min" counter)."""
+
+    def __init__(self, reader, default="Le Reduit: Online", formatter=format_status, stale_refresh=60.0):
+        self.reader = reader
+        self.default = default
+        self.formatter = formatter
+        self.stale_refresh = stale_refresh
+        self._seq = None
+        self._expires = 0.0
+        self._element = remarks_element(default)
+
+        # Stats
+        self.hits = 0
+        self.refreshes = 0
+
+    def get(self, now=None):
+        if now is None:
+            now = time.time()
+        try:
+            seq = self.reader.sequence()
+        except Exception as e:
+            logger.debug(f"Status sequence read failed: {e}")
+            seq = None
+        if seq is not None and seq == self._seq and now < self._expires:
+            self.hits += 1
+            return self._element
+        self.refreshes += 1
+        text, expires = self.default, now + 1.0 # Monitor not up yet: look again in a second
+        try:
+            d = self.reader.read()
+            if d:
+                text = self.formatter(d)
+                expires = now + self.stale_refresh if d['stale'] else d['updated'] + self.reader.max_age
+                seq = d['version']
+        except Exception as e:
+            logger.debug(f"Status read failed: {e}")
+        self._seq, self._expires = seq, expires
+        self._element = remarks_element(text)
+        return self._element
@@ -1,103 +1,113 @@
 #!/usr/bin/env python3
-import socket
 import time
 import uuid
 import os
-import json
+import asyncio
 import logging
-from gps3 import gps3
-from datetime import datetime, timezone
+from gpsd_client import GpsdClient
+from status_channel import StatusReader
+from cot import TelemetryRemarks, UNKNOWN
+from tak_publisher import CotPublisher, parse_sinks, tls_context
+from beaconing import SmartBeacon, REASONS
+from metrics import Counter, Gauge, Histogram, start_metrics_server
 
 # --- Config ---
 TAK_IP = os.getenv("TAK_IP", "239.2.3.1") # Multicast Default
 TAK_PORT = int(os.getenv("TAK_PORT", "6969"))
+# Wire encoding of the default sink: "xml" (CoT XML, every client) or "protobuf" (TAK Protocol v1,
+# ATAK 4.1+ / WinTAK / iTAK; less than half the size of the XML)
+TAK_PROTOCOL = os.getenv("TAK_PROTOCOL", "xml")
+# Every destination, each with its own queue (see tak_publisher.parse_sinks), e.g.
+# "udp://239.2.3.1:6969,tls://opentakserver.lan:8089?protocol=protobuf&queue=256"
+TAK_SINKS = os.getenv("TAK_SINKS", f"udp://{TAK_IP}:{TAK_PORT}?protocol={TAK_PROTOCOL}")
+# Client certificate for tls:// sinks (PEM; OpenTAKServer issues them as .p12)
+TAK_TLS_CERT = os.getenv("TAK_TLS_CERT")
+TAK_TLS_KEY = os.getenv("TAK_TLS_KEY")
+TAK_TLS_CA = os.getenv("TAK_TLS_CA")
+TAK_TLS_VERIFY_HOSTNAME = os.getenv("TAK_TLS_VERIFY_HOSTNAME", "1") == "1"
+# "smart": report on distance / turns / speed-dependent intervals, heartbeat while parked
+# (see beaconing.py); "every": one report per gpsd fix, stale after 2 minutes
+TAK_BEACON = os.getenv("TAK_BEACON", "smart")
+TAK_HEARTBEAT_S = float(os.getenv("TAK_HEARTBEAT_S", "600")) # Stationary report interval
+TAK_FAST_RATE_S = 10.0   # Report interval at TAK_FAST_SPEED and above
+TAK_FAST_SPEED = 20.0    # m/s (72 km/h)
+TAK_SLOW_RATE_S = 120.0  # Longest report interval while moving
+TAK_SLOW_SPEED = 1.0     # m/s; slower counts as stationary (GPS jitter)
 GPSD_HOST = os.getenv("GPSD_HOST", "127.0.0.1")
 GPSD_PORT = int(os.getenv("GPSD_PORT", "2947"))
+GPSD_MAX_AGE_S = float(os.getenv("GPSD_MAX_AGE_S", "2.0")) # Older (buffered) fixes are dropped
 CALLSIGN = os.getenv("TAK_CALLSIGN", "LE_REDUIT")
 UUID = os.getenv("TAK_UUID", f"reduit-{uuid.getnode()}")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9103")) # Prometheus exporter, 0 disables
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - TAK - %(message)s')
 logger = logging.getLogger("tak_bridge")
 
-def get_iso_time():
-    # CoT requires ISO 8601 UTC
-    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+# Power monitor telemetry (shared memory, no file parsing per fix)
+status_reader = StatusReader()
 
-def build_cot_xml(lat, lon, hae, speed, course):
-    # Basic PLI (Position Location Information) CoT
-    now = get_iso_time()
-    # Stale in 2 minutes
-    stale_time = (datetime.now(timezone.utc).timestamp() + 120)
-    stale_iso = datetime.fromtimestamp(stale_time, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
-    
-    # a-f-G-E-V-C: Friendly - Ground - Equipment - Vehicle - Civilian (Example)
-    # a-u-G: Unknown Ground (Default if unsure)
-    # Let's use Friendly Ground Unit
-    type_str = "a-f-G-U-C" 
-    
-    # Read Telemetry from Power Monitor
-    remarks = "Le Reduit: Online"
+# --- Metrics ---
+STAGE_SECONDS = Histogram("reduit_tak_stage_seconds", "Per-fix processing time.", ["stage"])
+ERRORS = Counter("reduit_tak_errors_total", "Failures per operation.", ["op"])
+LAST_FIX = Gauge("reduit_tak_last_fix_timestamp_seconds", "Wall time of the last position fix sent.")
+BEACONS = Counter("reduit_tak_beacons_total", "Position reports sent, by SmartBeaconing trigger.", ["reason"])
+FIXES_SKIPPED = Counter("reduit_tak_fixes_skipped_total", "GPS fixes not reported (SmartBeaconing).")
+_publish_seconds = STAGE_SECONDS.labels("publish")
+
+remarks = TelemetryRemarks(status_reader)
+
+beacon = SmartBeacon(slow_speed=TAK_SLOW_SPEED, fast_speed=TAK_FAST_SPEED, slow_rate=TAK_SLOW_RATE_S,
+                     fast_rate=TAK_FAST_RATE_S, heartbeat=TAK_HEARTBEAT_S) if TAK_BEACON == "smart" else None
+if beacon:
+    for reason in REASONS:
+        BEACONS.labels(reason).set_function(lambda r=reason: beacon.sent[r])
+    FIXES_SKIPPED.set_function(lambda: beacon.fixes - sum(beacon.sent.values()))
+
+def build_publisher():
+    tls = tls_context(TAK_TLS_CERT, TAK_TLS_KEY, TAK_TLS_CA, TAK_TLS_VERIFY_HOSTNAME) if "tls://" in TAK_SINKS else None
+    return CotPublisher(parse_sinks(TAK_SINKS, tls))
+
+def report_fix(publisher, fix):
+    """Decides whether a fix is reported and queues it on every sink."""
+    stale = None
+    if beacon:
+        if not beacon.update(time.monotonic(), fix.lat, fix.lon, fix.speed, fix.course):
+            return
+        stale = beacon.stale
+    # Basic PLI (Position Location Information) with power monitor telemetry as remarks
     try:
-        if os.path.exists("/tmp/reduit_status.json"):
-            with open("/tmp/reduit_status.json", "r") as f:
-                d = json.load(f)
-                remarks = (f"🔋 {d.get('system_volts',0):.1f}V {d.get('net_watts',0):.0f}W | "
-                           f"🌡️ {d.get('temperature',0):.0f}C | "
-                           f"💡 {d.get('lux',0):.0f}lx | "
-                           f"{'🔓 OPEN' if d.get('lid_open') else '🔒'}")
-    except: pass
+        with _publish_seconds.time():
+            publisher.publish(UUID, CALLSIGN, fix.lat, fix.lon, fix.hae, fix.speed, fix.course, remarks.get(), stale,
+                              ce=UNKNOWN if fix.ce is None else f"{fix.ce:.1f}",
+                              le=UNKNOWN if fix.le is None else f"{fix.le:.1f}")
+        LAST_FIX.set(time.time())
+        logger.debug(f"Queued CoT: {fix.lat}, {fix.lon}")
+    except Exception as e:
+        ERRORS.labels("publish").inc()
+        logger.error(f"Publish failed: {e}")
 
-    xml = f"""<?xml version='1.0' standalone='yes'?>
-<event version="2.0" uid="{UUID}" type="{type_str}" time="{now}" start="{now}" stale="{stale_iso}" how="m-g">
-    <point lat="{lat}" lon="{lon}" hae="{hae}" ce="9999999" le="9999999"/>
-    <detail>
-        <contact callsign="{CALLSIGN}"/>
-        <track course="{course}" speed="{speed}"/>
-        <remarks>{remarks}</remarks>
-    </detail>
-</event>"""
-    return xml.encode('utf-8')
+async def run():
+    publisher = build_publisher()
+    gpsd = GpsdClient(GPSD_HOST, GPSD_PORT, max_age=GPSD_MAX_AGE_S)
+    logger.info(f"Starting TAK GPS Bridge. Sending to {', '.join(s.name for s in publisher.sinks)} "
+                f"({TAK_BEACON} beaconing)")
+    # gpsd reader and sinks share this loop; every sink sends from its own queue, so a
+    # stalled TAK server never delays multicast, and fixes are handled as they arrive
+    tasks = [asyncio.create_task(publisher.run(), name="tak-sinks"),
+             asyncio.create_task(gpsd.run(), name="gpsd")]
+    try:
+        async for fix in gpsd.positions():
+            report_fix(publisher, fix)
+    finally:
+        for task in tasks:
+            task.cancel()
 
 def main():
-    logger.info(f"Starting TAK GPS Bridge. Sending to {TAK_IP}:{TAK_PORT}")
-    
-    # Setup UDP Socket
-    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
-    sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 2)
-    
-    # Setup GPSD Client
-    gps_socket = gps3.GPSDSocket()
-    data_stream = gps3.DataStream()
-    
+    start_metrics_server(METRICS_PORT)
     try:
-        gps_socket.connect(host=GPSD_HOST, port=GPSD_PORT)
-        gps_socket.watch()
-        
-        for new_data in gps_socket:
-            if new_data:
-                data_stream.unpack(new_data)
-                
-                # Check for TPV (Time Position Velocity) data
-                if data_stream.TPV['lat'] != 'n/a':
-                    lat = float(data_stream.TPV['lat'])
-                    lon = float(data_stream.TPV['lon'])
-                    alt = float(data_stream.TPV['alt']) if data_stream.TPV['alt'] != 'n/a' else 0.0
-                    speed = float(data_stream.TPV['speed']) if data_stream.TPV['speed'] != 'n/a' else 0.0
-                    track = float(data_stream.TPV['track']) if data_stream.TPV['track'] != 'n/a' else 0.0
-                    
-                    xml_payload = build_cot_xml(lat, lon, alt, speed, track)
-                    
-                    try:
-                        sock.sendto(xml_payload, (TAK_IP, TAK_PORT))
-                        logger.debug(f"Sent CoT: {lat}, {lon}")
-                    except Exception as e:
-                        logger.error(f"Send failed: {e}")
-                        
-            time.sleep(1) # Rate limit? GPSD usually sends 1Hz
-            
-    except Exception as e:
-        logger.error(f"GPSD Error: {e}")
-        time.sleep(5)
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        logger.info("Stopping TAK GPS Bridge...")
 
 if __name__ == "__main__":
     main()
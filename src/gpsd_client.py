@@ -0,0 +1,201 @@
+import json
+import time
+import random
+import asyncio
+import logging
+from collections import deque
+from datetime import datetime
+
+from metrics import Counter, Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+FIXES = Counter("reduit_gpsd_fixes_total", "TPV reports with a position received from gpsd.")
+FIXES_DROPPED = Counter("reduit_gpsd_fixes_dropped_total", "Fixes not handed on.", ["reason"])
+RECONNECTS = Counter("reduit_gpsd_reconnects_total", "Connections made to gpsd.")
+CONNECTED = Gauge("reduit_gpsd_connected", "1 while connected to gpsd.")
+SATELLITES = Gauge("reduit_gpsd_satellites_used", "Satellites used in the last SKY report.")
+FIX_LAG_SECONDS = Histogram("reduit_gpsd_fix_lag_seconds", "Fix time to hand-over, above the usual lag.",
+                            buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0))
+
+WATCH = b'?WATCH={"enable":true,"json":true}\n'
+
+
+class Fix:
+    """One TPV position report. Altitude is height above the ellipsoid (what CoT wants);
+    ce / le are gpsd's 95% horizontal / vertical error estimates in metres, or None."""
+    __slots__ = ('time', 'mode', 'lat', 'lon', 'hae', 'speed', 'course', 'ce', 'le')
+
+    def __init__(self, time, mode, lat, lon, hae, speed, course, ce, le):
+        self.time = time
+        self.mode = mode
+        self.lat = lat
+        self.lon = lon
+        self.hae = hae
+        self.speed = speed
+        self.course = course
+        self.ce = ce
+        self.le = le
+
+    @classmethod
+    def from_tpv(cls, report):
+        """Returns a Fix for a TPV report with a 2D/3D position and time, else None."""
+        if report.get('mode', 0) < 2 or 'lat' not in report or 'time' not in report:
+            return None
+        # gpsd >= 3.20 reports altHAE / altMSL; older ones only 'alt' (MSL)
+        hae = report.get('altHAE', report.get('alt', 0.0))
+        return cls(parse_time(report['time']), report['mode'], report['lat'], report['lon'], hae,
+                   report.get('speed', 0.0), report.get('track', 0.0), report.get('eph'), report.get('epv'))
+
+
+def parse_time(value):
+    """gpsd ISO 8601 UTC ("2026-10-18T12:00:00.000Z") to epoch seconds."""
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+
+class GpsdClient:
+    """Event-driven gpsd JSON client.
+
+    Reports are parsed as they arrive and the newest fix is kept in a single slot, so a
+    consumer that falls behind (or a burst gpsd had buffered while we were busy or
+    disconnected) only ever gets the latest position. A fix whose lag behind the system
+    clock exceeds the usual lag (lowest of the last `lag_window` fixes) by more than
+    `max_age` seconds is dropped as stale; comparing against the usual lag keeps this
+    working when the system clock is off, and `rebase_after` stale fixes in a row are taken
+    as a clock step (new baseline) rather than a stuck receiver. Reconnects with
+    exponential backoff."""
+
+    def __init__(self, host="127.0.0.1", port=2947, max_age=2.0, lag_window=60, rebase_after=5,
+                 backoff_min=1.0, backoff_max=30.0, read_timeout=30.0):
+        self.host = host
+        self.port = port
+        self.max_age = max_age
+        self.rebase_after = rebase_after
+        self.backoff_min = backoff_min
+        self.backoff_max = backoff_max
+        self.read_timeout = read_timeout # gpsd sends at least a TPV per second with a receiver attached
+        self._lags = deque(maxlen=lag_window)
+        self._stale_run = 0
+        self._fix = None
+        self._ready = None
+
+        self.connected = False
+        self.fixes = 0
+        self.superseded = 0
+        self.stale = 0
+        self.reconnects = 0
+        self.satellites = None
+        self._superseded = FIXES_DROPPED.labels("superseded")
+        self._stale = FIXES_DROPPED.labels("stale")
+        CONNECTED.set_function(lambda: 1 if self.connected else 0)
+        SATELLITES.set_function(lambda: self.satellites or 0)
+
+    async def run(self):
+        """Connects, reads and reconnects until cancelled."""
+        self._ready = self._ready or asyncio.Event()
+        backoff = self.backoff_min
+        while True:
+            try:
+                reader, writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), 10.0)
+            except (OSError, asyncio.TimeoutError) as e:
+                logger.warning(f"gpsd {self.host}:{self.port} unreachable: {e or type(e).__name__}, "
+                               f"retrying in {backoff:.0f}s")
+                await asyncio.sleep(backoff * random.uniform(0.8, 1.2))
+                backoff = min(backoff * 2.0, self.backoff_max)
+                continue
+            self.connected = True
+            self.reconnects += 1
+            RECONNECTS.inc()
+            connected_at = time.monotonic()
+            logger.info(f"Connected to gpsd {self.host}:{self.port}")
+            try:
+                writer.write(WATCH)
+                await writer.drain()
+                await self._read(reader)
+                logger.warning("gpsd closed the connection")
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError) as e:
+                logger.warning(f"gpsd connection lost: {e or type(e).__name__}")
+            finally:
+                self.connected = False
+                writer.close()
+            if time.monotonic() - connected_at > self.backoff_max:
+                backoff = self.backoff_min
+            await asyncio.sleep(backoff * random.uniform(0.8, 1.2))
+            backoff = min(backoff * 2.0, self.backoff_max)
+
+    async def _read(self, reader):
+        # Whatever has arrived is parsed in one go and the consumer woken once, so a
+        # backlog collapses into its newest fix instead of being replayed report by report
+        pending = b""
+        while True:
+            chunk = await asyncio.wait_for(reader.read(65536), self.read_timeout)
+            if not chunk:
+                return
+            *lines, pending = (pending + chunk).split(b"\n")
+            if len(pending) > 65536:
+                pending = b"" # No newline in sight: not gpsd JSON
+            new_fix = False
+            for line in lines:
+                new_fix |= self._on_report(line)
+            if new_fix:
+                self._ready.set()
+
+    def _on_report(self, line):
+        """Handles one JSON report; returns True if it was a usable TPV."""
+        try:
+            report = json.loads(line)
+        except ValueError:
+            return False
+        cls = report.get('class')
+        if cls == 'SKY':
+            used = report.get('uSat')
+            if used is None and 'satellites' in report:
+                used = sum(1 for sat in report['satellites'] if sat.get('used'))
+            if used is not None:
+                self.satellites = used
+            return False
+        if cls != 'TPV':
+            return False
+        try:
+            fix = Fix.from_tpv(report)
+        except (TypeError, ValueError):
+            return False
+        if fix is None:
+            return False
+        self.fixes += 1
+        FIXES.inc()
+        if self._fix is not None:
+            self.superseded += 1
+            self._superseded.inc()
+        self._fix = fix
+        return True
+
+    async def positions(self):
+        """Yields the newest fresh fix each time one arrives (older ones are skipped)."""
+        self._ready = self._ready or asyncio.Event()
+        while True:
+            await self._ready.wait()
+            self._ready.clear()
+            fix, self._fix = self._fix, None
+            if fix is None:
+                continue
+            lag = time.time() - fix.time
+            self._lags.append(lag)
+            excess = lag - min(self._lags)
+            FIX_LAG_SECONDS.observe(max(0.0, excess))
+            if excess > self.max_age:
+                self._stale_run += 1
+                if self._stale_run < self.rebase_after:
+                    self.stale += 1
+                    self._stale.inc()
+                    continue
+                logger.warning(f"gpsd fixes {excess:.1f}s behind for {self._stale_run} fixes, "
+                               f"assuming a clock step")
+                self._lags.clear()
+                self._lags.append(lag)
+            self._stale_run = 0
+            yield fix
+
+    def stats(self):
+        return {'connected': self.connected, 'fixes': self.fixes, 'superseded': self.superseded,
+                'stale': self.stale, 'reconnects': self.reconnects, 'satellites': self.satellites}
@@ -0,0 +1,89 @@
+import os
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# "pi" drives the real board; "replay" swaps in the in-process fakes below (see replay.py)
+HARDWARE = os.getenv("REDUIT_HARDWARE", "pi")
+SIMULATED = HARDWARE != "pi"
+
+
+# --- Clock ---
+class SystemClock:
+    """Wall and monotonic time. Replay installs a virtual clock in its place."""
+
+    def time(self):
+        return time.time()
+
+    def monotonic(self):
+        return time.monotonic()
+
+
+clock = SystemClock()
+
+
+def set_clock(new_clock):
+    global clock
+    clock = new_clock
+
+
+# --- GPIO ---
+class FakeGPIO:
+    """The subset of the RPi.GPIO API the monitor uses. Inputs can be bound to callables."""
+
+    BCM, BOARD = 11, 10
+    IN, OUT = 1, 0
+    LOW, HIGH = 0, 1
+    PUD_OFF, PUD_DOWN, PUD_UP = 20, 21, 22
+
+    def __init__(self):
+        self.mode = None
+        self.levels = {}
+        self.sources = {}
+        self.writes = 0
+
+    def setmode(self, mode):
+        self.mode = mode
+
+    def setwarnings(self, flag):
+        pass
+
+    def setup(self, pin, direction, pull_up_down=None, initial=None):
+        if initial is None:
+            initial = self.HIGH if pull_up_down == self.PUD_UP else self.LOW
+        self.levels[pin] = initial
+
+    def bind_input(self, pin, source):
+        """source: callable returning HIGH/LOW (or bool) on every read."""
+        self.sources[pin] = source
+
+    def input(self, pin):
+        source = self.sources.get(pin)
+        if source:
+            return self.HIGH if source() else self.LOW
+        return self.levels.get(pin, self.LOW)
+
+    def output(self, pin, value):
+        self.levels[pin] = value
+        self.writes += 1
+
+    def cleanup(self, *pins):
+        self.levels.clear()
+
+
+def load_gpio():
+    """RPi.GPIO on the Pi, FakeGPIO otherwise."""
+    if SIMULATED:
+        logger.info(f"Hardware '{HARDWARE}': using simulated GPIO.")
+        return FakeGPIO()
+    import RPi.GPIO as GPIO
+    return GPIO
+
+
+# --- Host power ---
+def poweroff():
+    if SIMULATED:
+        logger.warning("Simulated hardware: skipping host shutdown.")
+        return
+    os.system("shutdown -h now")
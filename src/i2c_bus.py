@@ -0,0 +1,308 @@
+import math
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+STANDARD_GRAVITY = 9.80665
+
+
+# --- Shared I2C Bus Manager ---
+class I2CBusManager:
+    """Owns /dev/i2c-N: one blocking lock for all devices, retries, re-init of devices
+    that keep NAKing, and per-device transaction latency / error accounting."""
+
+    def __init__(self, bus_number=1, retries=2, reinit_after=3, reinit_interval=10.0):
+        self.bus_number = bus_number
+        self.retries = retries
+        self.reinit_after = reinit_after
+        self.reinit_interval = reinit_interval
+        from smbus2 import SMBus, i2c_msg # Only on real hardware; replay runs never open a bus
+        self._bus = SMBus(bus_number)
+        self._msg = i2c_msg
+        self._lock = threading.Lock()
+        self.devices = {}
+
+    def close(self):
+        with self._lock:
+            self._bus.close()
+
+    def scan(self):
+        """Returns the addresses that ACK a one-byte read."""
+        found = []
+        with self._lock:
+            for addr in range(0x03, 0x78):
+                try:
+                    self._bus.read_byte(addr)
+                    found.append(addr)
+                except OSError:
+                    pass
+        return found
+
+    def attach(self, device):
+        """Registers a device and runs its init sequence (raises if the device is absent)."""
+        device.bus = self
+        device.init()
+        self.devices[device.name] = device
+        return device
+
+    def transaction(self, device, fn):
+        """Runs fn(smbus) under the bus lock with retries; returns its result."""
+        last_error = None
+        with self._lock:
+            for attempt in range(self.retries + 1):
+                t0 = time.perf_counter()
+                try:
+                    result = fn(self._bus)
+                except OSError as e:
+                    last_error = e
+                    device.errors += 1
+                    time.sleep(0.002 * (attempt + 1))
+                    continue
+                device.record(time.perf_counter() - t0)
+                device.consecutive_failures = 0
+                return result
+        device.consecutive_failures += 1
+        self._maybe_reinit(device)
+        raise last_error
+
+    def _maybe_reinit(self, device):
+        now = time.monotonic()
+        if device.consecutive_failures < self.reinit_after or now - device.last_reinit < self.reinit_interval:
+            return
+        device.last_reinit = now
+        device.reinits += 1
+        try:
+            device.init()
+            logger.warning(f"I2C device {device.name} (0x{device.addr:02x}) re-initialized after {device.consecutive_failures} failures")
+        except Exception as e:
+            logger.error(f"I2C device {device.name} (0x{device.addr:02x}) re-init failed: {e}")
+
+    # --- Helpers (each is a single locked transaction) ---
+    def read_block(self, device, reg, length):
+        """Register pointer write + burst read with a repeated start."""
+        def op(bus):
+            write, read = self._msg.write(device.addr, [reg]), self._msg.read(device.addr, length)
+            bus.i2c_rdwr(write, read)
+            return bytes(read)
+        return self.transaction(device, op)
+
+    def read_registers(self, device, regs, length=2):
+        """Reads several non-consecutive registers while holding the bus once."""
+        def op(bus):
+            out = []
+            for reg in regs:
+                write, read = self._msg.write(device.addr, [reg]), self._msg.read(device.addr, length)
+                bus.i2c_rdwr(write, read)
+                out.append(bytes(read))
+            return out
+        return self.transaction(device, op)
+
+    def read_raw(self, device, length):
+        def op(bus):
+            read = self._msg.read(device.addr, length)
+            bus.i2c_rdwr(read)
+            return bytes(read)
+        return self.transaction(device, op)
+
+    def write(self, device, data):
+        return self.transaction(device, lambda bus: bus.i2c_rdwr(self._msg.write(device.addr, list(data))))
+
+    def stats(self):
+        return {name: d.stats() for name, d in self.devices.items()}
+
+
+# --- Device Base ---
+class I2CDevice:
+    def __init__(self, name, addr):
+        self.name = name
+        self.addr = addr
+        self.bus = None
+        self.transactions = 0
+        self.errors = 0
+        self.reinits = 0
+        self.consecutive_failures = 0
+        self.last_reinit = 0.0
+        self.latency_avg = 0.0
+        self.latency_max = 0.0
+
+    def record(self, latency):
+        self.transactions += 1
+        self.latency_avg += (latency - self.latency_avg) * (0.1 if self.transactions > 1 else 1.0)
+        self.latency_max = max(self.latency_max, latency)
+
+    def stats(self):
+        return {'addr': self.addr, 'transactions': self.transactions, 'errors': self.errors,
+                'reinits': self.reinits, 'latency_avg_ms': self.latency_avg * 1000.0,
+                'latency_max_ms': self.latency_max * 1000.0}
+
+    def init(self):
+        pass
+
+
+# --- INA219 (Power) ---
+class INA219(I2CDevice):
+    """The INA219 has no register auto-increment, so instead of reading bus voltage, current and
+    power as three transactions we read shunt + bus voltage under one bus lock and derive I and P."""
+    REG_CONFIG, REG_SHUNT, REG_BUS = 0x00, 0x01, 0x02
+    CONFIG_32V_320MV_12BIT = 0x399F # 32 V range, PGA /8, 12-bit, continuous shunt + bus
+
+    def __init__(self, name, addr, shunt_ohms=0.1):
+        super().__init__(name, addr)
+        self.shunt_ohms = shunt_ohms
+
+    def init(self):
+        cfg = self.CONFIG_32V_320MV_12BIT
+        self.bus.write(self, [self.REG_CONFIG, cfg >> 8, cfg & 0xFF])
+
+    def read(self):
+        """Returns (bus volts, amps, watts)."""
+        shunt, bus = self.bus.read_registers(self, (self.REG_SHUNT, self.REG_BUS))
+        shunt_v = int.from_bytes(shunt, 'big', signed=True) * 10e-6 # 10 uV LSB
+        bus_v = (int.from_bytes(bus, 'big') >> 3) * 0.004 # 4 mV LSB
+        amps = shunt_v / self.shunt_ohms
+        return bus_v, amps, bus_v * amps
+
+    def read_bus_volts(self):
+        """Bus voltage only (one register, one transaction): the voltage guard's fast path."""
+        return (int.from_bytes(self.bus.read_block(self, self.REG_BUS, 2), 'big') >> 3) * 0.004
+
+
+# --- BME280 (Humidity / Pressure / Temperature) ---
+class BME280(I2CDevice):
+    """Compensation follows the floating-point formulas of the Bosch datasheet."""
+    CHIP_ID = 0x60
+
+    def init(self):
+        if self.bus.read_block(self, 0xD0, 1)[0] != self.CHIP_ID:
+            raise ValueError(f"No BME280 at 0x{self.addr:02x}")
+        c = self.bus.read_block(self, 0x88, 26)
+        h = self.bus.read_block(self, 0xE1, 7)
+        u16 = lambda b, i: int.from_bytes(b[i:i + 2], 'little')
+        s16 = lambda b, i: int.from_bytes(b[i:i + 2], 'little', signed=True)
+        self.t = (u16(c, 0), s16(c, 2), s16(c, 4))
+        self.p = (u16(c, 6),) + tuple(s16(c, i) for i in range(8, 24, 2))
+        h4 = (h[3] << 4) | (h[4] & 0x0F)
+        h5 = (h[5] << 4) | (h[4] >> 4)
+        self.h = (c[25], s16(h, 0), h[2],
+                  h4 - 4096 if h4 > 2047 else h4, h5 - 4096 if h5 > 2047 else h5,
+                  h[6] - 256 if h[6] > 127 else h[6])
+        self.bus.write(self, [0xF2, 0x01]) # Humidity x1 (must precede ctrl_meas)
+        self.bus.write(self, [0xF5, 0xA0]) # 1000 ms standby
+        self.bus.write(self, [0xF4, 0x27]) # Temp x1, Press x1, normal mode
+
+    def read(self):
+        """Returns (°C, %RH, hPa) from a single 8-byte burst of 0xF7..0xFE."""
+        d = self.bus.read_block(self, 0xF7, 8)
+        adc_p = (d[0] << 12) | (d[1] << 4) | (d[2] >> 4)
+        adc_t = (d[3] << 12) | (d[4] << 4) | (d[5] >> 4)
+        adc_h = (d[6] << 8) | d[7]
+
+        t1, t2, t3 = self.t
+        v1 = (adc_t / 16384.0 - t1 / 1024.0) * t2
+        v2 = ((adc_t / 131072.0 - t1 / 8192.0) ** 2) * t3
+        t_fine = v1 + v2
+        temperature = t_fine / 5120.0
+
+        p1, p2, p3, p4, p5, p6, p7, p8, p9 = self.p
+        v1 = t_fine / 2.0 - 64000.0
+        v2 = v1 * v1 * p6 / 32768.0
+        v2 = v2 + v1 * p5 * 2.0
+        v2 = v2 / 4.0 + p4 * 65536.0
+        v1 = (p3 * v1 * v1 / 524288.0 + p2 * v1) / 524288.0
+        v1 = (1.0 + v1 / 32768.0) * p1
+        pressure = 0.0
+        if v1:
+            p = (1048576.0 - adc_p - v2 / 4096.0) * 6250.0 / v1
+            pressure = (p + (p9 * p * p / 2147483648.0 + p * p8 / 32768.0 + p7) / 16.0) / 100.0
+
+        h1, h2, h3, h4, h5, h6 = self.h
+        hum = t_fine - 76800.0
+        hum = (adc_h - (h4 * 64.0 + h5 / 16384.0 * hum)) * \
+              (h2 / 65536.0 * (1.0 + h6 / 67108864.0 * hum * (1.0 + h3 / 67108864.0 * hum)))
+        hum = min(100.0, max(0.0, hum * (1.0 - h1 * hum / 524288.0)))
+        return temperature, hum, pressure
+
+
+# --- MPU6050 (Motion) ---
+class MPU6050(I2CDevice):
+    ACCEL_LSB_PER_G = 16384.0 # ±2 g
+    REG_SMPLRT_DIV, REG_CONFIG, REG_FIFO_EN = 0x19, 0x1A, 0x23
+    REG_INT_STATUS, REG_USER_CTRL, REG_FIFO_COUNT, REG_FIFO_RW = 0x3A, 0x6A, 0x72, 0x74
+    FIFO_SAMPLE_BYTES = 6 # Accel X/Y/Z only
+
+    def __init__(self, name, addr):
+        super().__init__(name, addr)
+        self.fifo_rate = None
+
+    def init(self):
+        self.bus.write(self, [0x6B, 0x01]) # Wake, PLL with gyro X clock
+        self.bus.write(self, [0x1C, 0x00]) # ±2 g
+        if self.fifo_rate: self.enable_fifo(self.fifo_rate) # Restore after a re-init
+
+    def enable_fifo(self, rate_hz=100):
+        """Streams accelerometer samples into the 1 KiB on-chip FIFO at rate_hz."""
+        div = max(0, min(255, int(round(1000.0 / rate_hz)) - 1))
+        self.bus.write(self, [self.REG_CONFIG, 0x03]) # DLPF 44 Hz, 1 kHz base rate
+        self.bus.write(self, [self.REG_SMPLRT_DIV, div])
+        self.bus.write(self, [self.REG_FIFO_EN, 0x08]) # Accel only
+        self.fifo_rate = 1000.0 / (1 + div)
+        self.reset_fifo()
+        return self.fifo_rate
+
+    def reset_fifo(self):
+        self.bus.write(self, [self.REG_USER_CTRL, 0x04]) # FIFO_RESET
+        self.bus.write(self, [self.REG_USER_CTRL, 0x40]) # FIFO_EN
+
+    def read_fifo(self, max_bytes=1020, chunk=252):
+        """Drains whole samples from the FIFO. Returns (raw big-endian bytes, overflowed).
+        On overflow the FIFO is reset, since sample alignment is lost."""
+        if self.bus.read_block(self, self.REG_INT_STATUS, 1)[0] & 0x10:
+            self.reset_fifo()
+            return b"", True
+        count = int.from_bytes(self.bus.read_block(self, self.REG_FIFO_COUNT, 2), 'big')
+        count = min(count - count % self.FIFO_SAMPLE_BYTES, max_bytes)
+        data = bytearray()
+        while count > 0:
+            n = min(count, chunk)
+            data += self.bus.read_block(self, self.REG_FIFO_RW, n)
+            count -= n
+        return bytes(data), False
+
+    def read(self):
+        """Acceleration (x, y, z) in m/s² from one 6-byte burst of ACCEL_XOUT_H.."""
+        d = self.bus.read_block(self, 0x3B, 6)
+        scale = STANDARD_GRAVITY / self.ACCEL_LSB_PER_G
+        return tuple(int.from_bytes(d[i:i + 2], 'big', signed=True) * scale for i in (0, 2, 4))
+
+
+# --- BH1750 (Light) ---
+class BH1750(I2CDevice):
+    def init(self):
+        self.bus.write(self, [0x01]) # Power on
+        self.bus.write(self, [0x10]) # Continuous high-resolution mode
+
+    def read(self):
+        """Lux."""
+        return int.from_bytes(self.bus.read_raw(self, 2), 'big') / 1.2
+
+
+# --- Compass (HMC5883L) ---
+class Compass(I2CDevice):
+    def __init__(self, name="compass", addr=0x1E):
+        super().__init__(name, addr)
+
+    def init(self):
+        # 0x00=ConfigA (8-avg,15Hz), 0x01=ConfigB (Gain), 0x02=Mode (Continuous)
+        self.bus.write(self, [0x00, 0x70])
+        self.bus.write(self, [0x01, 0x20])
+        self.bus.write(self, [0x02, 0x00])
+
+    def read_heading(self):
+        buffer = self.bus.read_block(self, 0x03, 6) # X, Z, Y (MSB first)
+        x = int.from_bytes(buffer[0:2], byteorder='big', signed=True)
+        y = int.from_bytes(buffer[4:6], byteorder='big', signed=True)
+        heading_rad = math.atan2(y, x)
+        if heading_rad < 0: heading_rad += 2 * math.pi
+        return math.degrees(heading_rad)
@@ -0,0 +1,307 @@
+import os
+import math
+import time
+import glob
+import logging
+import threading
+from collections import deque
+
+from metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+INFLUX_FLUSH_SECONDS = Histogram("reduit_influx_flush_seconds", "Duration of a successful batch write to InfluxDB.")
+
+
+# --- Connection (influxdb_client is imported here, only when a token is configured) ---
+def connect(url, token, org):
+    """Returns (client, synchronous write_api)."""
+    from influxdb_client import InfluxDBClient
+    from influxdb_client.client.write_api import SYNCHRONOUS
+    client = InfluxDBClient(url=url, token=token, org=org)
+    return client, client.write_api(write_options=SYNCHRONOUS)
+
+
+def bucket_preparer(client, org, name, retention_days):
+    """Returns a writer prepare() hook that creates the bucket if missing and keeps its
+    retention in line with the config (0 days = keep forever)."""
+    def prepare():
+        from influxdb_client import BucketRetentionRules
+        api = client.buckets_api()
+        seconds = int(retention_days * 86400)
+        rules = [BucketRetentionRules(type="expire", every_seconds=seconds)] if seconds else []
+        bucket = api.find_bucket_by_name(name)
+        if bucket is None:
+            api.create_bucket(bucket_name=name, retention_rules=rules, org=org)
+            logger.info(f"Created InfluxDB bucket {name} (retention {retention_days or 'forever'} days)")
+        elif [r.every_seconds for r in bucket.retention_rules or [] if r.every_seconds] != [r.every_seconds for r in rules]:
+            bucket.retention_rules = rules
+            api.update_bucket(bucket=bucket)
+            logger.info(f"Updated retention of InfluxDB bucket {name} to {retention_days or 'forever'} days")
+    return prepare
+
+
+# --- Line Protocol ---
+def _escape(value, chars):
+    value = str(value).replace("\\", "\\\\")
+    for c in chars:
+        value = value.replace(c, "\\" + c)
+    return value
+
+
+def _format_field(value):
+    if isinstance(value, bool): return "true" if value else "false"
+    if isinstance(value, int): return f"{value}i"
+    if isinstance(value, float): return repr(value)
+    return '"' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def line_protocol(measurement, tags, fields, ts):
+    """Formats one point; ts is an integer in the writer's precision. None, NaN and
+    infinite field values are left out. Returns "" when no field is left."""
+    parts = []
+    for key, value in fields.items():
+        if value is None or (isinstance(value, float) and (value != value or value in (math.inf, -math.inf))):
+            continue
+        parts.append(f"{_escape(key, ', =')}={_format_field(value)}")
+    if not parts:
+        return ""
+    head = _escape(measurement, ", ")
+    for key, value in sorted(tags.items()):
+        head += f",{_escape(key, ', =')}={_escape(value, ', =')}"
+    return f"{head} {','.join(parts)} {int(ts)}"
+
+
+# --- Batched InfluxDB Writer with On-Disk Spool ---
+class InfluxBatchWriter:
+    """Background writer: batches line-protocol points and spools to disk while InfluxDB is down."""
+
+    SEGMENT_PREFIX = "spool-"
+    SEGMENT_SUFFIX = ".lp"
+
+    def __init__(self, write_api, bucket, org, spool_dir,
+                 batch_size=50, flush_interval=10.0, max_queue=5000,
+                 spool_max_bytes=64 * 1024 * 1024, segment_bytes=1024 * 1024,
+                 retry_min=5.0, retry_max=300.0, precision="ns", prepare=None):
+        self.write_api = write_api
+        self.bucket = bucket
+        self.org = org
+        self.spool_dir = spool_dir
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spool_max_bytes = spool_max_bytes
+        self.segment_bytes = segment_bytes
+        self.retry_min = retry_min
+        self.retry_max = retry_max
+        self.precision = precision
+        # Called once before the first write (e.g. to create the bucket); retried like a write
+        self.prepare = prepare
+        self._prepared = prepare is None
+
+        # Bounded in-memory queue: on overflow the oldest point goes first
+        self._queue = deque(maxlen=max_queue)
+        self._lock = threading.Lock()
+        self._spool_lock = threading.Lock() # join() may spool while the thread is still writing
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+        self._retry_delay = retry_min
+        self._next_retry = 0.0
+        self._online = True
+
+        # Stats
+        self.dropped = 0
+        self.spool_dropped_bytes = 0
+        self.flushes = 0
+        self.failures = 0
+        self.last_flush_latency = 0.0
+        self.last_flush_time = 0.0
+
+        try:
+            os.makedirs(self.spool_dir, exist_ok=True)
+        except Exception as e:
+            logger.error(f"Cannot create Influx spool dir {self.spool_dir}: {e}")
+        self._spool_bytes = sum(os.path.getsize(p) for p in self._segments())
+        if self._spool_bytes:
+            logger.info(f"Influx spool holds {self._spool_bytes} bytes from a previous run, will replay.")
+
+    # --- Producer side (called from the sampling loop) ---
+    def enqueue(self, point):
+        """Queues a Point (or line-protocol string). Never blocks on I/O."""
+        line = point if isinstance(point, str) else point.to_line_protocol()
+        if not line:
+            return
+        with self._lock:
+            if len(self._queue) == self._queue.maxlen:
+                self.dropped += 1
+            self._queue.append(line)
+            depth = len(self._queue)
+        if depth >= self.batch_size:
+            self._wake.set()
+
+    def start(self):
+        if self._thread: return
+        self._thread = threading.Thread(target=self._run, name="influx-writer", daemon=True)
+        self._thread.start()
+        logger.info(f"Influx writer started (batch {self.batch_size}, flush {self.flush_interval}s, spool {self.spool_dir})")
+
+    def request_stop(self):
+        """Tells the thread to spool what is queued and exit, without waiting for it."""
+        self._stop.set()
+        self._wake.set()
+
+    def join(self, timeout=10.0):
+        """Waits for the thread to exit. If it is still stuck in a write, the points queued
+        since are spooled from here so nothing queued is lost."""
+        if self._thread:
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                logger.warning("Influx writer still busy at shutdown, spooling its queue directly")
+                batch = self._take_batch()
+                if batch: self._spool_append(batch)
+            self._thread = None
+
+    def stop(self, timeout=10.0):
+        """Stops the thread; anything not delivered ends up in the spool."""
+        self.request_stop()
+        self.join(timeout)
+
+    def stats(self):
+        with self._lock:
+            depth = len(self._queue)
+        return {
+            'queue_depth': depth,
+            'spool_bytes': self._spool_bytes,
+            'flush_latency_ms': self.last_flush_latency * 1000.0,
+            'flushes': self.flushes,
+            'failures': self.failures,
+            'dropped': self.dropped,
+            'spool_dropped_bytes': self.spool_dropped_bytes,
+            'online': self._online,
+        }
+
+    # --- Writer thread ---
+    def _run(self):
+        last_flush = time.monotonic()
+        while not self._stop.is_set():
+            self._wake.wait(timeout=1.0)
+            self._wake.clear()
+
+            now = time.monotonic()
+            with self._lock:
+                depth = len(self._queue)
+            if depth >= self.batch_size or (depth and now - last_flush >= self.flush_interval):
+                self._flush_queue()
+                last_flush = now
+
+            if self._spool_bytes and now >= self._next_retry:
+                self._replay_spool()
+
+        # Shutdown: whatever is still queued goes to the spool (replayed on the next start);
+        # a write attempt here could block for the client timeout
+        batch = self._take_batch()
+        if batch: self._spool_append(batch)
+
+    def _take_batch(self):
+        with self._lock:
+            batch = list(self._queue)
+            self._queue.clear()
+        return batch
+
+    def _flush_queue(self):
+        batch = self._take_batch()
+        if not batch: return
+        # While offline, don't hammer the server: go straight to disk until the next retry slot
+        if not self._online and time.monotonic() < self._next_retry:
+            self._spool_append(batch)
+            return
+        if not self._write(batch):
+            self._spool_append(batch)
+
+    def _write(self, lines):
+        t0 = time.monotonic()
+        try:
+            if not self._prepared:
+                self.prepare()
+                self._prepared = True
+            for i in range(0, len(lines), 5000):
+                self.write_api.write(bucket=self.bucket, org=self.org,
+                                     record=lines[i:i + 5000], write_precision=self.precision)
+        except Exception as e:
+            self.failures += 1
+            if self._online:
+                logger.error(f"Influx Write Failed, spooling to disk: {e}")
+            self._online = False
+            self._next_retry = time.monotonic() + self._retry_delay
+            self._retry_delay = min(self._retry_delay * 2, self.retry_max)
+            return False
+        self.last_flush_latency = time.monotonic() - t0
+        INFLUX_FLUSH_SECONDS.observe(self.last_flush_latency)
+        self.last_flush_time = time.time()
+        self.flushes += 1
+        if not self._online:
+            logger.info("InfluxDB reachable again.")
+        self._online = True
+        self._retry_delay = self.retry_min
+        return True
+
+    # --- Spool (write-ahead log of line protocol, one segment file per ~segment_bytes) ---
+    def _segments(self):
+        return sorted(glob.glob(os.path.join(self.spool_dir, f"{self.SEGMENT_PREFIX}*{self.SEGMENT_SUFFIX}")))
+
+    def _spool_append(self, lines):
+        data = ("\n".join(lines) + "\n").encode("utf-8")
+        try:
+            with self._spool_lock:
+                segments = self._segments()
+                path = segments[-1] if segments else None
+                if not path or os.path.getsize(path) + len(data) > self.segment_bytes:
+                    path = os.path.join(self.spool_dir, f"{self.SEGMENT_PREFIX}{time.time_ns():020d}{self.SEGMENT_SUFFIX}")
+                with open(path, "ab") as f:
+                    f.write(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+                self._spool_bytes += len(data)
+                self._enforce_spool_limit()
+        except Exception as e:
+            self.dropped += len(lines)
+            logger.error(f"Influx spool write failed, dropped {len(lines)} points: {e}")
+
+    def _enforce_spool_limit(self):
+        segments = self._segments()
+        # Never drop the segment currently being appended to
+        while self._spool_bytes > self.spool_max_bytes and len(segments) > 1:
+            oldest = segments.pop(0)
+            size = os.path.getsize(oldest)
+            os.remove(oldest)
+            self._spool_bytes -= size
+            self.spool_dropped_bytes += size
+            logger.warning(f"Influx spool full, discarded oldest segment ({size} bytes)")
+
+    def _replay_spool(self):
+        """Replays spool segments oldest-first; stops at the first failure.
+        Re-sending a partially delivered segment is harmless: identical points overwrite in InfluxDB."""
+        for path in self._segments():
+            if self._stop.is_set(): return
+            try:
+                with open(path, "rb") as f:
+                    raw = f.read()
+                lines = [l for l in raw.decode("utf-8", "replace").split("\n") if l]
+                size = len(raw)
+            except Exception as e:
+                logger.error(f"Influx spool read failed for {path}: {e}")
+                return
+            if lines and not self._write(lines):
+                return
+            with self._spool_lock:
+                # join() may have appended to this segment since it was read; replay it again
+                # later rather than delete the new points (re-sent ones are harmless)
+                if os.path.getsize(path) != size:
+                    return
+                os.remove(path)
+                self._spool_bytes = max(0, self._spool_bytes - size)
+            logger.info(f"Replayed {len(lines)} spooled points to InfluxDB")
+        with self._spool_lock:
+            if not self._segments():
+                self._spool_bytes = 0
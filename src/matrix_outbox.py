@@ -0,0 +1,205 @@
+"""Ordered, coalescing outbound queue for the bridge's Matrix room.
+
+Everything the bridge posts (forwarded mesh texts, command replies) goes through one
+queue drained by a single sender, so messages arrive in order and a chatty mesh can't
+pile up send tasks. Messages queued within `window` seconds of the first waiting one are
+joined into a single event (up to `max_chars`). A failed send is retried with the same
+transaction id, so the homeserver drops a duplicate if the first attempt did land:
+M_LIMIT_EXCEEDED waits the server's retry_after_ms, other errors back off exponentially.
+The queue is bounded (the oldest message goes when full) and written to `state_file`
+whenever it changes, so undelivered messages survive a restart.
+"""
+import os
+import json
+import time
+import random
+import asyncio
+import logging
+from collections import deque
+
+from metrics import Counter, Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+QUEUE_DEPTH = Gauge("reduit_bridge_matrix_queue_depth", "Messages waiting to be delivered to Matrix.")
+EVENTS = Counter("reduit_bridge_matrix_events_total", "Matrix events delivered by the outbox.")
+BATCH_MESSAGES = Histogram("reduit_bridge_matrix_batch_messages", "Messages joined into one Matrix event.",
+                           buckets=(1, 2, 3, 5, 10, 20, 50))
+DELIVERY_SECONDS = Histogram("reduit_bridge_matrix_delivery_seconds", "Time from queueing to delivery.",
+                             buckets=(0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 1800.0))
+RETRIES = Counter("reduit_bridge_matrix_retries_total", "Matrix sends retried.", ["reason"])
+DROPPED = Counter("reduit_bridge_matrix_dropped_total", "Messages given up on.", ["reason"])
+
+
+class SendFailed(Exception):
+    """Raised by the send function for an error response. `retry_after` (seconds) is the
+    server's M_LIMIT_EXCEEDED hint; `permanent` errors are not retried."""
+
+    def __init__(self, message, retry_after=None, permanent=False):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.permanent = permanent
+
+
+class MatrixOutbox:
+    def __init__(self, send, state_file=None, window=2.0, max_chars=4000, max_messages=500,
+                 backoff_min=1.0, backoff_max=60.0):
+        self.send = send # async send(body, txn_id)
+        self.state_file = state_file
+        self.window = window
+        self.max_chars = max_chars
+        self.max_messages = max_messages
+        self.backoff_min = backoff_min
+        self.backoff_max = backoff_max
+        self.queue = deque() # (queued at, body)
+        self._batch = None   # (txn_id, messages) being delivered
+        self._dirty = False
+        self._save_failed = False
+        self._wakeup = None
+        self._loop = None
+
+        # Stats
+        self.events = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.retries = 0
+        self._load()
+        QUEUE_DEPTH.set_function(lambda: self.depth)
+
+    @property
+    def depth(self):
+        batch = self._batch
+        return len(self.queue) + (len(batch[1]) if batch else 0)
+
+    def put(self, body):
+        """Queues one message; safe to call from any thread."""
+        if len(self.queue) >= self.max_messages:
+            self.queue.popleft()
+            self.dropped += 1
+            DROPPED.labels("full").inc()
+        self.queue.append((time.time(), body))
+        self._dirty = True
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def _take(self):
+        messages = [self.queue.popleft()]
+        size = len(messages[0][1])
+        while self.queue and size + 1 + len(self.queue[0][1]) <= self.max_chars:
+            messages.append(self.queue.popleft())
+            size += 1 + len(messages[-1][1])
+        return messages
+
+    async def run(self):
+        """Delivers until cancelled."""
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        backoff = self.backoff_min
+        try:
+            while True:
+                if self._batch is None:
+                    while True:
+                        self._wakeup.clear() # Before looking, so a put() from here on wakes us
+                        self._save()
+                        if self.queue: break
+                        await self._wakeup.wait()
+                    # Let a burst gather; messages restored from disk are long past their window
+                    delay = self.queue[0][0] + self.window - time.time()
+                    if delay > 0:
+                        await self._pause(min(delay, self.window))
+                    self._batch = (f"reduit-bridge-{time.time_ns()}", self._take())
+                    self._dirty = True
+                self._save()
+                txn_id, messages = self._batch
+                try:
+                    await self.send("\n".join(body for _, body in messages), txn_id)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    if getattr(e, 'permanent', False):
+                        logger.error(f"Matrix rejected {len(messages)} message(s), dropping them: {e}")
+                        self.dropped += len(messages)
+                        DROPPED.labels("rejected").inc(len(messages))
+                        self._batch = None
+                        self._dirty = True
+                        continue
+                    retry_after = getattr(e, 'retry_after', None)
+                    if retry_after is not None:
+                        reason, delay = "rate_limited", retry_after
+                    else:
+                        reason, delay = "error", backoff * random.uniform(0.8, 1.2)
+                        backoff = min(backoff * 2.0, self.backoff_max)
+                    self.retries += 1
+                    RETRIES.labels(reason).inc()
+                    logger.warning(f"Matrix send failed ({e or type(e).__name__}), {self.depth} message(s) "
+                                   f"waiting, retrying in {delay:.1f}s")
+                    await self._pause(delay)
+                    continue
+                backoff = self.backoff_min
+                now = time.time()
+                for queued_at, _ in messages:
+                    DELIVERY_SECONDS.observe(max(0.0, now - queued_at))
+                self.events += 1
+                self.delivered += len(messages)
+                EVENTS.inc()
+                BATCH_MESSAGES.observe(len(messages))
+                self._batch = None
+                self._dirty = True
+        finally:
+            self._save()
+
+    async def _pause(self, delay):
+        """Sleeps `delay` seconds, persisting messages put() meanwhile as they arrive (a
+        restart during a long backoff must not lose them)."""
+        end = time.monotonic() + delay
+        while True:
+            self._wakeup.clear()
+            self._save()
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                return
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+
+    # --- Persistence ---
+    def _load(self):
+        if not self.state_file:
+            return
+        try:
+            with open(self.state_file, "r") as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            logger.warning(f"Could not read Matrix outbox {self.state_file}: {e}")
+            return
+        batch = state.get('batch')
+        if batch:
+            self._batch = (batch['txn_id'], [tuple(m) for m in batch['messages']])
+        self.queue.extend(tuple(m) for m in state.get('queue', []))
+        if self.depth:
+            logger.info(f"Restored {self.depth} undelivered Matrix message(s)")
+
+    def _save(self):
+        if not self.state_file or not self._dirty:
+            return
+        self._dirty = False
+        batch = self._batch
+        state = {'batch': {'txn_id': batch[0], 'messages': batch[1]} if batch else None,
+                 'queue': list(self.queue)}
+        try:
+            tmp = self.state_file + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(state, f)
+            os.replace(tmp, self.state_file)
+            self._save_failed = False
+        except Exception as e:
+            if not self._save_failed:
+                logger.warning(f"Could not persist Matrix outbox: {e}")
+            self._save_failed = True
+
+    def stats(self):
+        return {'depth': self.depth, 'events': self.events, 'delivered': self.delivered,
+                'dropped': self.dropped, 'retries': self.retries}
@@ -0,0 +1,144 @@
+import os
+import json
+import time
+import queue
+import logging
+import threading
+import requests
+
+from metrics import Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+MATRIX_REQUEST_SECONDS = Histogram("reduit_matrix_request_seconds", "Matrix client-server API call duration.", ["op"])
+MATRIX_ERRORS = Counter("reduit_matrix_errors_total", "Failed Matrix API calls.", ["op"])
+
+
+# --- Matrix Long-Poll Command Worker ---
+class MatrixCommandWorker:
+    """Long-polls /sync in its own thread and hands room commands to the monitor via a queue."""
+
+    def __init__(self, homeserver, access_token, room_id, token_file,
+                 poll_timeout_ms=30000, send_timeout=10):
+        self.homeserver = homeserver.rstrip("/")
+        self.room_id = room_id
+        self.token_file = token_file
+        self.poll_timeout_ms = poll_timeout_ms
+        self.send_timeout = send_timeout
+        self.commands = queue.Queue()
+
+        headers = {"Authorization": f"Bearer {access_token}"}
+        # One keep-alive session per direction: the long-poll holds its connection for up to 30 s
+        self._sync_session = requests.Session()
+        self._sync_session.headers.update(headers)
+        self._send_session = requests.Session()
+        self._send_session.headers.update(headers)
+        self._send_lock = threading.Lock()
+
+        self._filter = json.dumps({
+            "presence": {"types": []},
+            "account_data": {"types": []},
+            "room": {
+                "rooms": [room_id],
+                "timeline": {"types": ["m.room.message"], "limit": 20},
+                "state": {"types": []},
+                "ephemeral": {"types": []},
+                "account_data": {"types": []},
+            },
+        })
+        self.next_batch = self._load_token()
+        self._stop = threading.Event()
+        self._thread = None
+        self._user_id = None
+
+    # --- next_batch persistence ---
+    def _load_token(self):
+        try:
+            with open(self.token_file, "r") as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Could not read Matrix sync token: {e}")
+            return None
+
+    def _save_token(self, token):
+        try:
+            tmp = self.token_file + ".tmp"
+            with open(tmp, "w") as f:
+                f.write(token)
+            os.replace(tmp, self.token_file)
+        except Exception as e:
+            logger.warning(f"Could not persist Matrix sync token: {e}")
+
+    # --- Lifecycle ---
+    def start(self):
+        if self._thread: return
+        self._thread = threading.Thread(target=self._run, name="matrix-sync", daemon=True)
+        self._thread.start()
+        logger.info("Matrix command worker started.")
+
+    def stop(self):
+        self._stop.set()
+
+    # --- Outbound ---
+    def send_message(self, body):
+        """Sends a text message to the room using the pooled session."""
+        txn_id = f"reduit-{time.time_ns()}"
+        url = f"{self.homeserver}/_matrix/client/r0/rooms/{self.room_id}/send/m.room.message/{txn_id}"
+        with MATRIX_REQUEST_SECONDS.labels("send").time(), self._send_lock:
+            try:
+                resp = self._send_session.put(url, json={"msgtype": "m.text", "body": body}, timeout=self.send_timeout)
+                resp.raise_for_status()
+            except Exception:
+                MATRIX_ERRORS.labels("send").inc()
+                raise
+
+    # --- Inbound ---
+    def _whoami(self):
+        try:
+            resp = self._sync_session.get(f"{self.homeserver}/_matrix/client/r0/account/whoami", timeout=10)
+            if resp.status_code == 200:
+                return resp.json().get("user_id")
+        except Exception as e:
+            logger.warning(f"Matrix whoami failed: {e}")
+        return None
+
+    def _run(self):
+        backoff = 1
+        self._user_id = self._whoami()
+        while not self._stop.is_set():
+            # Without a stored token, take a snapshot first so old commands are not replayed
+            initial = self.next_batch is None
+            params = {"filter": self._filter, "timeout": 0 if initial else self.poll_timeout_ms}
+            if self.next_batch: params["since"] = self.next_batch
+            t0 = time.monotonic()
+            try:
+                resp = self._sync_session.get(
+                    f"{self.homeserver}/_matrix/client/r0/sync", params=params,
+                    timeout=self.poll_timeout_ms / 1000.0 + 15)
+                if resp.status_code != 200:
+                    raise RuntimeError(f"HTTP {resp.status_code}")
+                data = resp.json()
+            except Exception as e:
+                MATRIX_ERRORS.labels("sync").inc()
+                logger.error(f"Matrix Sync Fail: {e} (retry in {backoff}s)")
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, 60)
+                continue
+            backoff = 1
+            MATRIX_REQUEST_SECONDS.labels("sync").observe(time.monotonic() - t0)
+
+            if not initial:
+                room = data.get("rooms", {}).get("join", {}).get(self.room_id, {})
+                for event in room.get("timeline", {}).get("events", []):
+                    if event.get("type") != "m.room.message": continue
+                    if self._user_id and event.get("sender") == self._user_id: continue
+                    body = event.get("content", {}).get("body", "").strip().lower()
+                    if body.startswith("!"):
+                        self.commands.put(body)
+
+            token = data.get("next_batch")
+            if token and token != self.next_batch:
+                self.next_batch = token
+                self._save_token(token)
@@ -0,0 +1,231 @@
+"""Meshtastic mesh members on the TAK map.
+
+The bridge hands every received packet to MeshCotGateway.handle() on its event loop.
+POSITION_APP and NODEINFO_APP packets update an in-memory node table (last position,
+callsign, last heard); any packet from a known node refreshes its last heard time. Every
+`batch_interval` seconds the nodes that changed go out as one batch of CoT PLI events
+through the CotPublisher, so a node that reports several times within a batch costs one
+event. Nodes heard within the CoT stale period have their last position re-sent every
+`refresh` seconds to keep them on the map; nodes not heard for `node_ttl` seconds are
+dropped.
+
+A packet relayed by several routers can reach us more than once with the same sender
+and packet id; repeats within `dedupe_window` are ignored, as are positions no newer than
+the one we have (a node answering a position request re-sends its last fix).
+"""
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+
+from cot import DEFAULT_TYPE, UNKNOWN, remarks_element
+from metrics import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+NODES = Gauge("reduit_mesh_nodes", "Mesh nodes in the gateway's node table.")
+PACKETS = Counter("reduit_mesh_gateway_packets_total", "Packets handled by the mesh gateway.", ["result"])
+EVENTS = Counter("reduit_mesh_cot_events_total", "CoT PLI events published for mesh nodes.")
+EVICTED = Counter("reduit_mesh_nodes_evicted_total", "Mesh nodes dropped from the table.", ["reason"])
+
+POSITION_APP = "POSITION_APP"
+NODEINFO_APP = "NODEINFO_APP"
+RESULTS = ('position', 'nodeinfo', 'duplicate', 'stale', 'no_fix', 'own')
+METRES_PER_DEGREE = 111320.0
+
+
+def node_id(num):
+    """Meshtastic's "!a1b2c3d4" form of a node number."""
+    return f"!{num & 0xffffffff:08x}"
+
+
+def precision_ce(bits):
+    """Horizontal error (m) of a position reduced to `bits` of precision, else UNKNOWN.
+    Reduced positions are snapped to a grid of 2^(32 - bits) * 1e-7 degrees."""
+    if not bits or bits >= 32:
+        return UNKNOWN
+    return f"{2 ** (32 - bits) * 1e-7 * METRES_PER_DEGREE * 0.5:.0f}"
+
+
+class MeshNode:
+    __slots__ = ('num', 'id', 'callsign', 'hw_model', 'lat', 'lon', 'hae', 'speed', 'course', 'ce',
+                 'fix_time', 'last_heard', 'snr', 'hops', 'emitted', 'dirty')
+
+    def __init__(self, num, now):
+        self.num = num
+        self.id = node_id(num)
+        self.callsign = self.id # Until its NODEINFO arrives
+        self.hw_model = None
+        self.lat = None
+        self.lon = None
+        self.hae = 0.0
+        self.speed = 0.0
+        self.course = 0.0
+        self.ce = UNKNOWN
+        self.fix_time = 0
+        self.last_heard = now
+        self.snr = None
+        self.hops = None
+        self.emitted = 0.0
+        self.dirty = False
+
+    def remarks(self):
+        parts = [f"Meshtastic {self.id}"]
+        if self.hw_model:
+            parts.append(self.hw_model)
+        if self.hops is not None:
+            parts.append("direct" if self.hops == 0 else f"{self.hops} hop{'s' if self.hops > 1 else ''}")
+        if self.snr is not None:
+            parts.append(f"SNR {self.snr:.1f}dB")
+        return remarks_element(" | ".join(parts))
+
+
+class MeshCotGateway:
+    def __init__(self, publisher, batch_interval=5.0, node_ttl=3600.0, stale=1800.0, refresh=None,
+                 dedupe_window=600.0, max_nodes=512, cot_type=DEFAULT_TYPE, uid_prefix="meshtastic-",
+                 exclude=(), clock=time.time):
+        self.publisher = publisher
+        self.batch_interval = batch_interval
+        self.node_ttl = node_ttl
+        self.stale = stale     # CoT stale period of a node's events
+        self.refresh = refresh or stale / 2.0
+        self.dedupe_window = dedupe_window
+        self.max_nodes = max_nodes
+        self.cot_type = cot_type
+        self.uid_prefix = uid_prefix
+        self.exclude = set(exclude) # Node numbers not to report (our own radio)
+        self.clock = clock
+        self.nodes = {}
+        self._seen = OrderedDict() # (from, packet id) -> first seen
+
+        # Stats
+        self.counts = {result: 0 for result in RESULTS}
+        self.events = 0
+        self._results = {result: PACKETS.labels(result) for result in RESULTS}
+        NODES.set_function(lambda: len(self.nodes))
+
+    def handle(self, packet, now=None):
+        """Takes one received packet (the meshtastic library's dict). Must run on the loop
+        that runs run(); returns what was done with it (one of RESULTS) or None if ignored."""
+        num = packet.get('from')
+        if num is None:
+            return None
+        if now is None:
+            now = self.clock()
+        decoded = packet.get('decoded') or {}
+        port = decoded.get('portnum')
+        if num in self.exclude:
+            result = 'own' if port in (POSITION_APP, NODEINFO_APP) else None
+        elif port not in (POSITION_APP, NODEINFO_APP):
+            node = self.nodes.get(num)
+            if node is not None:
+                node.last_heard = now
+            result = None
+        elif self._duplicate(num, packet.get('id'), now):
+            result = 'duplicate'
+        else:
+            node = self._node(num, now)
+            node.last_heard = now
+            if 'rxSnr' in packet:
+                node.snr = packet['rxSnr']
+            if 'hopStart' in packet and 'hopLimit' in packet:
+                node.hops = max(0, packet['hopStart'] - packet['hopLimit'])
+            if port == POSITION_APP:
+                result = self._on_position(node, decoded.get('position') or {})
+            else:
+                result = self._on_nodeinfo(node, decoded.get('user') or {})
+        if result:
+            self.counts[result] += 1
+            self._results[result].inc()
+        return result
+
+    def _duplicate(self, num, packet_id, now):
+        if not packet_id:
+            return False # Unset on locally generated packets
+        seen = self._seen
+        while seen:
+            key, t = next(iter(seen.items()))
+            if now - t < self.dedupe_window and len(seen) < self.max_nodes * 16:
+                break
+            del seen[key]
+        key = (num, packet_id)
+        if key in seen:
+            return True
+        seen[key] = now
+        return False
+
+    def _node(self, num, now):
+        node = self.nodes.get(num)
+        if node is None:
+            if len(self.nodes) >= self.max_nodes:
+                oldest = min(self.nodes.values(), key=lambda n: n.last_heard)
+                del self.nodes[oldest.num]
+                EVICTED.labels("full").inc()
+            node = self.nodes[num] = MeshNode(num, now)
+        return node
+
+    def _on_position(self, node, position):
+        lat, lon = position.get('latitude'), position.get('longitude')
+        if lat is None and 'latitudeI' in position:
+            lat = position['latitudeI'] * 1e-7
+        if lon is None and 'longitudeI' in position:
+            lon = position['longitudeI'] * 1e-7
+        if lat is None or lon is None or (lat == 0 and lon == 0):
+            return 'no_fix'
+        fix_time = position.get('time', 0)
+        if fix_time and fix_time <= node.fix_time:
+            return 'stale'
+        node.fix_time = fix_time
+        node.lat, node.lon = lat, lon
+        node.hae = position.get('altitudeHae', position.get('altitude', 0.0))
+        node.speed = position.get('groundSpeed', 0.0)
+        node.course = position.get('groundTrack', 0) * 1e-5 # Firmware sends 1e-5 degrees
+        node.ce = precision_ce(position.get('precisionBits'))
+        node.dirty = True
+        return 'position'
+
+    def _on_nodeinfo(self, node, user):
+        callsign = user.get('longName') or user.get('shortName')
+        if callsign and callsign != node.callsign:
+            node.callsign = callsign
+            node.dirty = node.lat is not None
+        node.hw_model = user.get('hwModel', node.hw_model)
+        return 'nodeinfo'
+
+    def flush(self, now=None):
+        """Publishes the batch due now and evicts silent nodes; returns the events sent."""
+        if now is None:
+            now = self.clock()
+        sent = 0
+        for num, node in list(self.nodes.items()):
+            if now - node.last_heard > self.node_ttl:
+                del self.nodes[num]
+                EVICTED.labels("ttl").inc()
+                continue
+            if node.lat is None:
+                continue
+            # A node gone quiet is left to go stale on the map rather than kept alive
+            if not node.dirty and (now - node.emitted < self.refresh or now - node.last_heard > self.stale):
+                continue
+            self.publisher.publish(f"{self.uid_prefix}{node.id}", node.callsign, node.lat, node.lon,
+                                   node.hae, node.speed, node.course, node.remarks(), stale=self.stale,
+                                   cot_type=self.cot_type, now=now, ce=node.ce)
+            node.emitted = now
+            node.dirty = False
+            sent += 1
+        if sent:
+            self.events += sent
+            EVENTS.inc(sent)
+        return sent
+
+    async def run(self):
+        """Flushes every batch_interval until cancelled."""
+        while True:
+            await asyncio.sleep(self.batch_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Mesh CoT batch failed: {e}")
+
+    def stats(self):
+        return {'nodes': len(self.nodes), 'events': self.events, 'packets': dict(self.counts)}
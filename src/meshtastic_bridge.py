@@ -5,8 +5,13 @@ import yaml
 import logging
 import meshtastic.serial_interface
 from meshtastic import mesh_pb2
-from nio import AsyncClient, MatrixRoom, RoomMessageText
-import subprocess
+from nio import AsyncClient, MatrixRoom, RoomMessageText, RoomSendError
+from status_channel import StatusReader
+from cot import reading
+from metrics import Counter, Gauge, Histogram, start_metrics_server
+from tak_publisher import CotPublisher, parse_sinks, tls_context
+from mesh_gateway import MeshCotGateway
+from matrix_outbox import MatrixOutbox, SendFailed
 
 # Configure Logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -14,6 +19,92 @@ logger = logging.getLogger("MeshtasticBridge")
 
 # Configuration Path
 CONFIG_PATH = os.environ.get("BRIDGE_CONFIG", "/etc/meshtastic-bridge/config.yaml")
+# Undelivered Matrix messages; overridable with matrix.outbox_file in the config
+OUTBOX_PATH = os.environ.get("BRIDGE_OUTBOX", "/var/lib/meshtastic-bridge/outbox.json")
+# Prometheus exporter (0 disables); overridable with metrics.port in the config
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "9102"))
+
+# --- Metrics ---
+MESSAGES = Counter("reduit_bridge_messages_total", "Messages handled by the bridge.", ["direction"])
+ERRORS = Counter("reduit_bridge_errors_total", "Bridge failures per operation.", ["op"])
+COMMAND_SECONDS = Histogram("reduit_bridge_command_seconds", "Command execution time.", ["command"])
+MATRIX_SEND_SECONDS = Histogram("reduit_bridge_matrix_send_seconds", "Duration of one Matrix room_send.")
+# Expected 0; anything above is time the event loop was blocked
+LOOP_LAG_SECONDS = Histogram("reduit_bridge_event_loop_lag_seconds", "Event loop scheduling delay.")
+# Label values for COMMAND_SECONDS; anything else is counted as "other" to bound cardinality
+KNOWN_COMMANDS = ("!lte on", "!lte off", "!wifi on", "!wifi off", "!eco on", "!status")
+# Matrix error codes that no retry will fix; the message is dropped
+PERMANENT_MATRIX_ERRORS = ("M_FORBIDDEN", "M_TOO_LARGE", "M_BAD_JSON", "M_NOT_JSON")
+COMMANDS_RUNNING = Gauge("reduit_bridge_commands_running", "Commands running or waiting for their turn.")
+# Seconds an external command (ip link ...) may take before it is killed
+COMMAND_TIMEOUT_S = 10.0
+
+
+async def run_command(argv, timeout=COMMAND_TIMEOUT_S):
+    """Runs a program without blocking the event loop; returns (returncode, stdout, stderr).
+    Raises asyncio.TimeoutError (after killing it) if it runs longer than `timeout`."""
+    proc = await asyncio.create_subprocess_exec(*argv, stdout=asyncio.subprocess.PIPE,
+                                                stderr=asyncio.subprocess.PIPE)
+    try:
+        out, err = await asyncio.wait_for(proc.communicate(), timeout)
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+        raise
+    return proc.returncode, out.decode(errors='replace').strip(), err.decode(errors='replace').strip()
+
+
+class CommandExecutor:
+    """Runs commands as tasks, so neither the Matrix sync loop nor mesh forwarding waits on
+    them. Each command names the resources it touches (e.g. network interfaces); commands
+    sharing one run one after another in arrival order, the others concurrently."""
+
+    def __init__(self, max_pending=16):
+        self.max_pending = max_pending
+        self._locks = {}
+        self._tasks = set()
+
+        # Stats
+        self.submitted = 0
+        self.rejected = 0
+        COMMANDS_RUNNING.set_function(lambda: len(self._tasks))
+
+    def submit(self, resources, coro, label="other"):
+        """Schedules `coro` once it holds every resource; returns its task, or None if too
+        many commands are pending."""
+        if len(self._tasks) >= self.max_pending:
+            coro.close()
+            self.rejected += 1
+            logger.warning(f"Command {label} rejected, {len(self._tasks)} commands pending.")
+            return None
+        self.submitted += 1
+        task = asyncio.create_task(self._run(sorted(set(resources)), coro, label))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _run(self, resources, coro, label):
+        # Locks are FIFO and taken in sorted order, so queued commands keep their order
+        # and two commands can't each hold a resource the other waits for
+        held = []
+        try:
+            for resource in resources:
+                lock = self._locks.setdefault(resource, asyncio.Lock())
+                await lock.acquire()
+                held.append(lock)
+            with COMMAND_SECONDS.labels(label).time():
+                await coro
+        except Exception as e:
+            ERRORS.labels("command").inc()
+            logger.error(f"Command {label} failed: {e}")
+        finally:
+            coro.close() # No-op once awaited; releases it if cancelled while waiting
+            for lock in held:
+                lock.release()
+
+    def stats(self):
+        return {'running': len(self._tasks), 'submitted': self.submitted, 'rejected': self.rejected}
+
 
 class MeshtasticMatrixBridge:
     def __init__(self, config):
@@ -21,6 +112,13 @@ class MeshtasticMatrixBridge:
         self.matrix_client = None
         self.mesh_interface = None
         self.room_id = config['matrix']['room_id']
+        self.status_reader = StatusReader()
+        self.mesh_gateway = None
+        self.executor = CommandExecutor()
+        self.command_timeout = config.get('command_timeout', COMMAND_TIMEOUT_S)
+        self.outbox = MatrixOutbox(self._room_send,
+                                   state_file=config['matrix'].get('outbox_file', OUTBOX_PATH),
+                                   window=config['matrix'].get('batch_window', 2.0))
 
     async def start_matrix(self):
         logger.info(f"Connecting to Matrix Homeserver: {self.config['matrix']['homeserver']}")
@@ -41,6 +139,7 @@ class MeshtasticMatrixBridge:
         # Start Sync Loop to receive commands
         self.matrix_client.add_event_callback(self.on_matrix_message, RoomMessageText)
         asyncio.create_task(self.matrix_client.sync_forever(timeout=30000))
+        asyncio.create_task(self.outbox.run())
 
     def start_meshtastic(self):
         logger.info("Connecting to Meshtastic Node...")
@@ -64,12 +163,34 @@ class MeshtasticMatrixBridge:
         from pubsub import pub
         pub.subscribe(self.on_meshtastic_message, "meshtastic.receive")
 
+    def start_tak(self):
+        """Mesh node positions to TAK (optional `tak` config section)."""
+        tak_conf = self.config.get('tak') or {}
+        sinks = tak_conf.get('sinks')
+        if not sinks:
+            logger.info("No TAK sinks configured, mesh positions are not forwarded.")
+            return
+        tls_conf = tak_conf.get('tls') or {}
+        tls = tls_context(tls_conf.get('cert'), tls_conf.get('key'), tls_conf.get('ca'),
+                          tls_conf.get('verify_hostname', True)) if "tls://" in sinks else None
+        publisher = CotPublisher(parse_sinks(sinks, tls))
+        self.mesh_gateway = MeshCotGateway(
+            publisher,
+            batch_interval=tak_conf.get('batch_interval', 5),
+            node_ttl=tak_conf.get('node_ttl', 3600),
+            stale=tak_conf.get('stale', 1800),
+        )
+        asyncio.create_task(publisher.run())
+        asyncio.create_task(self.mesh_gateway.run())
+        logger.info(f"Forwarding mesh positions to TAK: {', '.join(s.name for s in publisher.sinks)}")
+
     async def on_matrix_message(self, room: MatrixRoom, event: RoomMessageText):
         if room.room_id != self.room_id:
             return
 
         body = event.body.strip()
         sender = event.sender
+        MESSAGES.labels("matrix_in").inc()
         logger.info(f"Matrix Message received from {sender}: {body}")
         
         # Matrix Auth Check
@@ -82,6 +203,9 @@ class MeshtasticMatrixBridge:
 
     def on_meshtastic_message(self, packet, interface):
         try:
+            if self.mesh_gateway is not None:
+                # Node table lives on the event loop; this runs in the Meshtastic reader thread
+                self.loop.call_soon_threadsafe(self.mesh_gateway.handle, packet)
             if 'decoded' in packet:
                 decoded = packet['decoded']
                 if decoded.get('portnum') == 'TEXT_MESSAGE_APP':
@@ -89,6 +213,7 @@ class MeshtasticMatrixBridge:
                     sender = packet.get('fromId', 'Unknown')
                     
                     if text_content:
+                        MESSAGES.labels("mesh_in").inc()
                         logger.info(f"Received from Mesh: {sender}: {text_content}")
                         
                         # Process Command
@@ -99,11 +224,9 @@ class MeshtasticMatrixBridge:
                             )
 
                         # Forward to Matrix
-                        asyncio.run_coroutine_threadsafe(
-                             self.send_to_matrix(f"**[{sender}]**: {text_content}"),
-                             self.loop
-                        )
+                        self.send_to_matrix(f"**[{sender}]**: {text_content}")
         except Exception as e:
+            ERRORS.labels("mesh_packet").inc()
             logger.error(f"Error processing packet: {e}")
 
     async def process_command_lora(self, text, sender):
@@ -135,7 +258,21 @@ class MeshtasticMatrixBridge:
             return
 
         logger.info(f"Processing command from {source}: {cmd}")
+        label = cmd if cmd in KNOWN_COMMANDS else "other"
+        self.executor.submit(self._command_resources(cmd), self._dispatch_command(cmd), label)
 
+    def _command_resources(self, cmd):
+        lte = self.config.get('lte_interface', 'wwan0')
+        wifi = self.config.get('wifi_interface', 'wlan1')
+        if cmd.startswith("!lte"):
+            return [lte]
+        if cmd.startswith("!wifi"):
+            return [wifi]
+        if cmd == "!eco on":
+            return [lte, wifi]
+        return [cmd]
+
+    async def _dispatch_command(self, cmd):
         if cmd == "!lte on":
             await self.toggle_interface(self.config.get('lte_interface', 'wwan0'), True, "LTE")
         elif cmd == "!lte off":
@@ -147,9 +284,11 @@ class MeshtasticMatrixBridge:
             await self.toggle_interface(self.config.get('wifi_interface', 'wlan1'), False, "High-Power WiFi")
             
         elif cmd == "!eco on":
-            await self.send_to_matrix("🍃 Activating ECO Mode (Disabling LTE & High-Power WiFi)...")
-            await self.toggle_interface(self.config.get('lte_interface', 'wwan0'), False, "LTE")
-            await self.toggle_interface(self.config.get('wifi_interface', 'wlan1'), False, "High-Power WiFi")
+            self.send_to_matrix("🍃 Activating ECO Mode (Disabling LTE & High-Power WiFi)...")
+            await asyncio.gather(
+                self.toggle_interface(self.config.get('lte_interface', 'wwan0'), False, "LTE"),
+                self.toggle_interface(self.config.get('wifi_interface', 'wlan1'), False, "High-Power WiFi"),
+            )
             
         elif cmd == "!status":
              await self.report_status()
@@ -158,15 +297,21 @@ class MeshtasticMatrixBridge:
         action = "up" if state else "down"
         try:
             logger.info(f"Toggling {label} ({interface}) {action}...")
-            result = subprocess.run(["ip", "link", "set", interface, action], capture_output=True, text=True)
-            
-            if result.returncode == 0:
-                await self.send_to_matrix(f"✅ {label} turned **{action.upper()}**.")
+            returncode, _, stderr = await run_command(["ip", "link", "set", interface, action],
+                                                      self.command_timeout)
+
+            if returncode == 0:
+                self.send_to_matrix(f"✅ {label} turned **{action.upper()}**.")
             else:
-                await self.send_to_matrix(f"⚠️ Failed to toggle {label}: {result.stderr}")
+                self.send_to_matrix(f"⚠️ Failed to toggle {label}: {stderr}")
+        except asyncio.TimeoutError:
+            ERRORS.labels("command").inc()
+            logger.error(f"Toggling {label} ({interface}) timed out after {self.command_timeout}s")
+            self.send_to_matrix(f"🛑 Timed out controlling {label}.")
         except Exception as e:
+            ERRORS.labels("command").inc()
             logger.error(f"Failed to toggle {label}: {e}")
-            await self.send_to_matrix(f"🛑 Error controlling {label}: {str(e)}")
+            self.send_to_matrix(f"🛑 Error controlling {label}: {str(e)}")
 
     async def report_status(self):
         try:
@@ -182,9 +327,41 @@ class MeshtasticMatrixBridge:
                 f"📡 **LTE** ({lte_iface}): {lte_state}\n"
                 f"📶 **WiFi** ({wifi_iface}): {wifi_state}"
             )
-            await self.send_to_matrix(status_msg)
+
+            if self.outbox.depth:
+                status_msg += f"\n📨 **Outbox**: {self.outbox.depth} message(s) waiting"
+
+            power = self.status_reader.read()
+            if power and power['stale']:
+                status_msg += f"\n🔋 **Power**: monitor silent for {power['age'] / 60:.0f} min"
+            elif power:
+                status_msg += (f"\n🔋 **Power**: {reading(power['soc_pct'], '.0f')}% | "
+                               f"{reading(power['system_volts'], '.2f')}V | "
+                               f"{reading(power['net_watts'], '.1f')}W Net | Mode: {power['mode'].upper()}")
+            self.send_to_matrix(status_msg)
         except Exception as e:
-            await self.send_to_matrix(f"Error getting status: {e}")
+            self.send_to_matrix(f"Error getting status: {e}")
+
+    def send_to_matrix(self, body):
+        """Queues a message for the room (ordered, batched, retried); safe from any thread."""
+        self.outbox.put(body)
+
+    async def _room_send(self, body, txn_id):
+        t0 = time.monotonic()
+        try:
+            response = await self.matrix_client.room_send(self.room_id, "m.room.message",
+                                                          {"msgtype": "m.text", "body": body}, tx_id=txn_id)
+        except Exception:
+            ERRORS.labels("matrix_send").inc()
+            raise
+        finally:
+            MATRIX_SEND_SECONDS.observe(time.monotonic() - t0)
+        if isinstance(response, RoomSendError):
+            ERRORS.labels("matrix_send").inc()
+            retry_after = response.retry_after_ms / 1000.0 if response.retry_after_ms else None
+            raise SendFailed(f"{response.status_code}: {response.message}", retry_after,
+                             permanent=response.status_code in PERMANENT_MATRIX_ERRORS)
+        MESSAGES.labels("matrix_out").inc()
 
     def is_interface_up(self, interface):
         try:
@@ -195,14 +372,22 @@ class MeshtasticMatrixBridge:
 
     async def run(self):
         self.loop = asyncio.get_running_loop()
+        start_metrics_server(self.config.get('metrics', {}).get('port', METRICS_PORT))
         await self.start_matrix()
         # Meshtastic serial interface is blocking/threaded, so we start it here
         # It runs its own reader thread.
+        self.start_tak()
         self.start_meshtastic()
+        my_info = getattr(self.mesh_interface, 'myInfo', None)
+        if self.mesh_gateway is not None and my_info is not None:
+            # Our own radio is the box itself, which gps_to_tak already reports
+            self.mesh_gateway.exclude.add(my_info.my_node_num)
         
         # Keep the main loop alive
         while True:
+            t0 = self.loop.time()
             await asyncio.sleep(1)
+            LOOP_LAG_SECONDS.observe(max(0.0, self.loop.time() - t0 - 1))
 
 def load_config():
     if not os.path.exists(CONFIG_PATH):
@@ -0,0 +1,277 @@
+import os
+import time
+import bisect
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets (seconds): sub-ms loop stages up to the 30 s Matrix long-poll
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + (extra or [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"): return "+Inf"
+    return repr(float(value))
+
+
+# --- Metric Types ---
+class _Metric:
+    type = "untyped"
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._default = self._new_child()
+            self._children[()] = self._default
+        (registry or REGISTRY).register(self)
+
+    def labels(self, *values):
+        """Returns the child for these label values (cached, so hold on to it in hot paths)."""
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _samples(self):
+        for key, child in list(self._children.items()):
+            yield from child._samples(self.name, self.labelnames, key)
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(self._samples())
+        return lines
+
+
+class _ValueChild:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+        self._function = None
+
+    def inc(self, amount=1.0):
+        with self._lock:
+            self.value += amount
+
+    def set_function(self, function):
+        """Evaluated at scrape time, so nothing is paid between scrapes (e.g. a component's
+        own counter or queue length)."""
+        self._function = function
+
+    def _samples(self, name, labelnames, key):
+        value = self._function() if self._function else self.value
+        if value is not None:
+            yield f"{name}{_format_labels(labelnames, key)} {_format_value(value)}"
+
+
+class _GaugeChild(_ValueChild):
+    def dec(self, amount=1.0):
+        self.inc(-amount)
+
+    def set(self, value):
+        self.value = float(value)
+
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1) # last one is +Inf
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    def time(self):
+        return _Timer(self)
+
+    def _samples(self, name, labelnames, key):
+        with self._lock:
+            counts, total = list(self.counts), self.sum
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            yield f"{name}_bucket{_format_labels(labelnames, key, [('le', _format_value(bound))])} {cumulative}"
+        yield f"{name}_sum{_format_labels(labelnames, key)} {_format_value(total)}"
+        yield f"{name}_count{_format_labels(labelnames, key)} {cumulative}"
+
+
+class _Timer:
+    def __init__(self, child):
+        self.child = child
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.child.observe(time.perf_counter() - self.start)
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def _new_child(self):
+        return _ValueChild()
+
+    def inc(self, amount=1.0):
+        self._default.inc(amount)
+
+    def set_function(self, function):
+        self._default.set_function(function)
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value):
+        self._default.set(value)
+
+    def inc(self, amount=1.0):
+        self._default.inc(amount)
+
+    def set_function(self, function):
+        self._default.set_function(function)
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self._default.observe(value)
+
+    def time(self):
+        return self._default.time()
+
+
+# --- Registry ---
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} already registered")
+            self._metrics[metric.name] = metric
+
+    def add_collector(self, collect):
+        """collect() is called before every scrape, e.g. to copy a component's stats() into gauges."""
+        self._collectors.append(collect)
+
+    def expose(self):
+        for collect in list(self._collectors):
+            try:
+                collect()
+            except Exception as e:
+                logger.warning(f"Metrics collector failed: {e}")
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.expose())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+# --- Process Metrics ---
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+_PROCESS_START = time.time()
+
+
+def _rss_bytes():
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except OSError:
+        return None
+
+
+def _open_fds():
+    try:
+        return len(os.listdir("/proc/self/fd"))
+    except OSError:
+        return None
+
+
+def register_process_metrics(registry=None):
+    registry = registry or REGISTRY
+    Gauge("process_resident_memory_bytes", "Resident memory size in bytes.", registry=registry).set_function(_rss_bytes)
+    Counter("process_cpu_seconds_total", "User and system CPU time spent in seconds.",
+            registry=registry).set_function(lambda: sum(os.times()[:2]))
+    Gauge("process_open_fds", "Number of open file descriptors.", registry=registry).set_function(_open_fds)
+    Gauge("process_threads", "Number of Python threads.", registry=registry).set_function(threading.active_count)
+    Gauge("process_start_time_seconds", "Start time of the process since unix epoch in seconds.",
+          registry=registry).set(_PROCESS_START)
+
+
+# --- HTTP Exporter ---
+class _Handler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.registry.expose().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass # Scrapes every 15-60 s would flood the log
+
+
+def start_metrics_server(port, addr="0.0.0.0", registry=None):
+    """Serves /metrics on a daemon thread. Port 0 / None disables the exporter."""
+    if not port:
+        return None
+    registry = registry or REGISTRY
+    if "process_resident_memory_bytes" not in registry._metrics:
+        register_process_metrics(registry)
+    handler = type("MetricsHandler", (_Handler,), {"registry": registry})
+    try:
+        server = ThreadingHTTPServer((addr, port), handler)
+    except OSError as e:
+        logger.error(f"Metrics exporter could not bind {addr}:{port}: {e}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    logger.info(f"Metrics exporter listening on {addr}:{port}/metrics")
+    return server
@@ -0,0 +1,94 @@
+"""Lazy registry of sensor drivers and output sinks.
+
+Plugins are registered by "module:attribute" path, so a plugin's module and its
+dependencies (influxdb_client, requests, numpy, w1thermsensor, ...) are only imported
+when the plugin is enabled and, for devices, when the bus scan found it.
+"""
+import time
+import logging
+import importlib
+
+logger = logging.getLogger(__name__)
+
+
+class Plugin:
+    def __init__(self, name, target, kind="sensor", addr=None, enabled=True, label=None, args=(), kwargs=None):
+        self.name = name
+        self.target = target
+        self.kind = kind         # 'sensor' (I2C, probed by address), 'device' (other buses) or 'sink'
+        self.addr = addr         # I2C address the bus scan must find (sensors only)
+        self.enabled = enabled   # bool, or a callable evaluated at load time
+        self.label = label or name
+        self.args = tuple(args)
+        self.kwargs = dict(kwargs or {})
+        self.instance = None
+        self.import_seconds = None
+        self.error = None
+
+    def is_enabled(self):
+        return self.enabled() if callable(self.enabled) else bool(self.enabled)
+
+    def resolve(self):
+        """Imports the plugin's module (first use only) and returns the factory."""
+        module, _, attr = self.target.partition(":")
+        t0 = time.perf_counter()
+        factory = getattr(importlib.import_module(module), attr)
+        if self.import_seconds is None:
+            self.import_seconds = time.perf_counter() - t0
+        return factory
+
+
+class PluginRegistry:
+    def __init__(self, disabled=()):
+        self.plugins = {}
+        self.disabled = set(disabled) # Names switched off by configuration
+
+    def enabled(self, name):
+        return name not in self.disabled and self.plugins[name].is_enabled()
+
+    def register(self, name, target, **kwargs):
+        self.plugins[name] = Plugin(name, target, **kwargs)
+        return self.plugins[name]
+
+    def create(self, name, *args, **kwargs):
+        """Instantiates an enabled plugin (args are appended to the registered ones);
+        returns None when it is disabled or fails to load."""
+        plugin = self.plugins[name]
+        if not self.enabled(name):
+            return None
+        try:
+            plugin.instance = plugin.resolve()(*plugin.args, *args, **{**plugin.kwargs, **kwargs})
+        except Exception as e:
+            plugin.error = str(e)
+            logger.warning(f"{plugin.label} ({name}) failed to load: {e}")
+            return None
+        return plugin.instance
+
+    def probe_i2c(self, bus, addrs):
+        """Creates and attaches every enabled I2C sensor whose address is in addrs."""
+        sensors = {}
+        for plugin in self.plugins.values():
+            if plugin.kind != "sensor" or not self.enabled(plugin.name):
+                continue
+            if plugin.addr not in addrs:
+                logger.warning(f"{plugin.label} ({plugin.name}) NOT found at 0x{plugin.addr:02x}")
+                continue
+            device = self.create(plugin.name)
+            if device is None:
+                continue
+            try:
+                sensors[plugin.name] = bus.attach(device)
+                logger.info(f"{plugin.label} ({plugin.name}) found at 0x{plugin.addr:02x}")
+            except Exception as e:
+                plugin.error = str(e)
+                logger.warning(f"{plugin.label} ({plugin.name}) init failed: {e}")
+        return sensors
+
+    def stats(self):
+        return {name: {
+            'kind': p.kind,
+            'enabled': self.enabled(name),
+            'loaded': p.instance is not None,
+            'import_ms': p.import_seconds * 1000.0 if p.import_seconds is not None else None,
+            'error': p.error,
+        } for name, p in self.plugins.items()}
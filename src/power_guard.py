@@ -0,0 +1,196 @@
+import os
+import time
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+logger = logging.getLogger(__name__)
+
+
+# --- Low-Voltage Guard ---
+class VoltageGuard:
+    """Samples the battery voltage on its own (high-priority) thread and shuts the host
+    down when it stays low, independently of the main loop, Matrix or kubectl.
+
+    Readings go through a median over the last `window` samples, so load transients
+    (LTE/WiFi TX bursts, relay clicks) and single bad reads don't count. The guard trips
+    once the median has been below `threshold` for `hold` seconds; readings under
+    `min_valid` (sensor unpowered / unplugged) are ignored. Worst-case time from a sustained
+    drop to the trip is therefore `window // 2 + 2` sample intervals (the median turning, plus
+    read phase on both ends) and `hold`.
+
+    A read that fails, returns under `min_valid` or takes longer than `read_timeout` (a
+    stuck bus) leaves the guard blind. Blind for `hold` seconds, it calls `on_blind(message)`
+    once, and trips if the last filtered voltage was below `threshold + blind_margin`: a
+    sensor browning out with the battery must not keep the host running.
+
+    On a trip `on_trip(volts)` (the orderly shutdown) runs on a separate thread; if it
+    hasn't finished after `shutdown_timeout` seconds, `force()` powers off regardless."""
+
+    def __init__(self, read_volts, on_trip, force, threshold, interval=0.2, window=5, hold=2.0,
+                 min_valid=0.5, shutdown_timeout=20.0, priority=10, read_timeout=None, blind_margin=0.3,
+                 on_blind=None, clock=time.monotonic):
+        self.read_volts = read_volts
+        self.on_trip = on_trip
+        self.force = force
+        self.threshold = threshold
+        self.interval = interval
+        self.hold = hold
+        self.min_valid = min_valid
+        self.shutdown_timeout = shutdown_timeout
+        self.priority = priority # SCHED_FIFO priority (1-99); falls back to nice -10
+        self.read_timeout = read_timeout if read_timeout is not None else max(interval, 0.5)
+        self.blind_margin = blind_margin
+        self.on_blind = on_blind
+        self.clock = clock
+
+        self._readings = deque(maxlen=window)
+        self._low_since = None
+        self._blind_since = None
+        self._blind_alerted = False
+        # Reads run on a worker so a hung bus can't stall the guard; at most one in flight
+        self._reader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="voltage-guard-read")
+        self._inflight = None
+        self._stop = threading.Event()
+        self._thread = None
+
+        # Stats
+        self.samples = 0
+        self.read_errors = 0
+        self.volts = None      # Latest filtered (median) voltage
+        self.min_volts = None  # Lowest filtered voltage seen
+        self.tripped_at = None # Filtered voltage that caused the trip
+        self.trip_reason = None # 'low' or 'blind'
+        self.max_read_ms = 0.0
+
+    @property
+    def max_trip_seconds(self):
+        """Upper bound from a sustained drop to the trip, with every read succeeding."""
+        return (self._readings.maxlen // 2 + 2) * self.interval + self.hold
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="voltage-guard", daemon=True)
+        self._thread.start()
+        logger.info(f"Voltage guard sampling every {self.interval}s, shutdown below {self.threshold:.2f}V "
+                    f"within {self.max_trip_seconds:.1f}s")
+
+    def stop(self):
+        self._stop.set()
+
+    def _raise_priority(self):
+        # pid 0 is the calling thread on Linux
+        try:
+            os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(self.priority))
+            return
+        except (AttributeError, OSError) as e:
+            logger.debug(f"SCHED_FIFO not available for the voltage guard: {e}")
+        try:
+            os.setpriority(os.PRIO_PROCESS, 0, -10)
+        except (AttributeError, OSError) as e:
+            logger.warning(f"Voltage guard runs at normal priority: {e}")
+
+    def _run(self):
+        self._raise_priority()
+        next_read = self.clock()
+        while not self._stop.is_set():
+            volts = self._read()
+            now = self.clock()
+            if self.update(volts, now):
+                self._trip()
+                return
+            # Fixed rate; after a stall carry on from now instead of bursting
+            next_read = max(next_read + self.interval, now)
+            self._stop.wait(next_read - now)
+
+    def _read(self):
+        """One bounded read; None if it failed or is still running after read_timeout."""
+        if self._inflight is None:
+            self._inflight = (self._reader.submit(self.read_volts), self.clock())
+        future, t0 = self._inflight
+        try:
+            volts = future.result(timeout=self.read_timeout)
+        except FutureTimeout:
+            volts, error = None, f"no result after {self.clock() - t0:.1f}s"
+        except Exception as e:
+            self._inflight = None
+            volts, error = None, e
+        else:
+            self._inflight = None
+            self.max_read_ms = max(self.max_read_ms, (self.clock() - t0) * 1000.0)
+            return volts
+        self.read_errors += 1
+        if self.read_errors == 1 or self.read_errors % 100 == 0:
+            logger.warning(f"Voltage guard read failed ({self.read_errors}x): {error}")
+        return None
+
+    def update(self, volts, now):
+        """Feeds one reading (None for a failed read) taken at monotonic time `now`; returns
+        True when the guard trips."""
+        if volts is None or volts < self.min_valid:
+            return self._blind(now)
+        if self._blind_since is not None:
+            logger.info(f"Voltage guard reading again after {now - self._blind_since:.1f}s blind")
+            self._blind_since = None
+            self._blind_alerted = False
+        self.samples += 1
+        self._readings.append(volts)
+        ordered = sorted(self._readings)
+        median = ordered[len(ordered) // 2]
+        self.volts = median
+        if self.min_volts is None or median < self.min_volts:
+            self.min_volts = median
+        if median >= self.threshold:
+            self._low_since = None
+            return False
+        if self._low_since is None:
+            self._low_since = now
+            logger.warning(f"Battery below {self.threshold:.2f}V ({median:.2f}V), shutting down in {self.hold:.1f}s")
+        return now - self._low_since >= self.hold
+
+    def _blind(self, now):
+        if self._blind_since is None:
+            self._blind_since = now
+        blind_for = now - self._blind_since
+        if blind_for < self.hold:
+            return False
+        # The drop that took the sensor out may be the one we are guarding against
+        low = self.volts is not None and self.volts < self.threshold + self.blind_margin
+        if not self._blind_alerted:
+            self._blind_alerted = True
+            last = f"{self.volts:.2f}V" if self.volts is not None else "none yet"
+            message = (f"⚠️ Voltage guard blind for {blind_for:.1f}s (last reading {last})"
+                       + (", shutting down." if low else "; low-voltage shutdown is inactive until it reads again."))
+            logger.error(message)
+            if self.on_blind:
+                try:
+                    self.on_blind(message)
+                except Exception as e:
+                    logger.error(f"Voltage guard blind alert failed: {e}")
+        if low:
+            self.trip_reason = 'blind'
+        return low
+
+    def _trip(self):
+        self.tripped_at = self.volts
+        self.trip_reason = self.trip_reason or 'low'
+        logger.critical(f"Voltage guard tripped at {self.volts:.2f}V ({self.trip_reason})")
+        worker = threading.Thread(target=self._shutdown, name="voltage-guard-shutdown", daemon=True)
+        worker.start()
+        worker.join(self.shutdown_timeout)
+        if worker.is_alive():
+            logger.critical(f"Orderly shutdown still running after {self.shutdown_timeout:.1f}s, forcing poweroff")
+            self.force()
+
+    def _shutdown(self):
+        try:
+            self.on_trip(self.volts)
+        except Exception as e:
+            logger.error(f"Orderly shutdown failed: {e}")
+            self.force()
+
+    def stats(self):
+        return {'volts': self.volts, 'min_volts': self.min_volts, 'samples': self.samples,
+                'read_errors': self.read_errors, 'max_read_ms': self.max_read_ms,
+                'tripped': self.tripped_at is not None, 'max_trip_s': self.max_trip_seconds,
+                'blind_s': self.clock() - self._blind_since if self._blind_since is not None else 0.0}
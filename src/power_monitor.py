@@ -1,30 +1,35 @@
 #!/usr/bin/env python3
 import time
-import board
-import busio
-from adafruit_ina219 import INA219
 import logging
-import csv
-import json
 from datetime import datetime
 import os
-import requests
+import queue
+import glob
 import socket
-from influxdb_client import InfluxDBClient, Point, WritePrecision
-from influxdb_client.client.write_api import SYNCHRONOUS
-from w1thermsensor import W1ThermSensor, SensorNotReadyError
+import threading
+from influx_writer import InfluxBatchWriter, bucket_preparer, line_protocol
+from telemetry_log import TelemetryLog
+from rollups import RollupAggregator, rollup_schema
+from compression import TelemetryCompressor
+from acquisition import AcquisitionScheduler, SensorTask, SampleTicker
+from status_channel import StatusWriter
+from alerts import AlertDispatcher, BuzzerPlayer
+from i2c_bus import I2CBusManager
+from battery import SocEstimator
+from power_guard import VoltageGuard
+from actuators import ActuatorEngine, CpuGovernor, WifiPowerSave, WifiLink, DeploymentScale, MemoryActuator
+from plugins import PluginRegistry
+from metrics import Counter, Gauge, Histogram, start_metrics_server
+import hardware
 
-import math
-from adafruit_bme280 import basic as adafruit_bme280
-import math
 import subprocess
-from adafruit_bme280 import basic as adafruit_bme280
-from adafruit_mpu6050 import MPU6050
-import adafruit_bh1750
-import RPi.GPIO as GPIO
-import smbus2
+
+# RPi.GPIO on the Pi; a fake when REDUIT_HARDWARE=replay (see replay.py / benchmark.py)
+GPIO = hardware.load_gpio()
 
 # --- Configuration ---
+I2C_BUS = int(os.getenv("I2C_BUS", "1"))
+INA219_SHUNT_OHMS = float(os.getenv("INA219_SHUNT_OHMS", "0.1"))
 I2C_ADDR_SOLAR = 0x40
 I2C_ADDR_SYSTEM = 0x41
 I2C_ADDR_BME = 0x76  # or 0x77
@@ -37,14 +42,41 @@ PIN_SHUTDOWN = 26
 PIN_LID_SENSOR = 17
 PIN_BUZZER = 27
 
-LOG_FILE = "/var/log/reduit_power.csv"
+# Binary telemetry log (export with: python telemetry_log.py /var/log/reduit_power)
+TELEMETRY_LOG_DIR = os.getenv("TELEMETRY_LOG_DIR", "/var/log/reduit_power")
+TELEMETRY_LOG_MAX_MB = int(os.getenv("TELEMETRY_LOG_MAX_MB", "512"))
 SAMPLE_INTERVAL_ACTIVE = 5
 SAMPLE_INTERVAL_ECO = 30
 current_sample_interval = SAMPLE_INTERVAL_ACTIVE
+# Main loop deadlines: "skip" drops slots missed by a stall, "catch_up" samples them back-to-back
+SAMPLE_TICK_POLICY = os.getenv("SAMPLE_TICK_POLICY", "skip")
 
 SHUTDOWN_VOLTAGE = 11.5
-SHUTDOWN_GRACE_PERIOD_SAMPLES = 3
-TAMPER_THRESHOLD_G = 0.5
+# Low-voltage guard (see power_guard.py): own thread on the system INA219, median over
+# VOLTAGE_GUARD_WINDOW reads, trips after VOLTAGE_GUARD_HOLD_S below SHUTDOWN_VOLTAGE
+VOLTAGE_GUARD_INTERVAL = float(os.getenv("VOLTAGE_GUARD_INTERVAL", "0.2"))
+VOLTAGE_GUARD_WINDOW = 5
+VOLTAGE_GUARD_HOLD_S = float(os.getenv("VOLTAGE_GUARD_HOLD_S", "2.0"))
+SHUTDOWN_TIMEOUT_S = 20.0 # Orderly shutdown budget before a forced poweroff
+SHUTDOWN_BUDGET_S = 15.0  # What shutdown() plans for itself, well inside SHUTDOWN_TIMEOUT_S
+# Tamper detection on the MPU6050 FIFO (see tamper.py)
+TAMPER_SAMPLE_RATE_HZ = 100
+TAMPER_RMS_G = 0.05      # Vibration / handling (RMS over one poll)
+TAMPER_PEAK_G = 0.3      # Knock (sample-to-sample change)
+TAMPER_TILT_DEG = 10.0   # Box moved to a new resting orientation...
+TAMPER_TILT_HOLD_S = 3.0 # ...for at least this long
+
+# Per-sensor acquisition: name -> (interval s, timeout s, max age s)
+# Voltage and lid are sampled fast for safety; slow-moving climate values rarely.
+SENSOR_SCHEDULE = {
+    'lid':     (0.2, 0.1, 2.0),
+    'system':  (1.0, 0.5, 5.0),
+    'solar':   (2.0, 0.5, 10.0),
+    'light':   (5.0, 1.0, 20.0),
+    'compass': (5.0, 1.0, 20.0),
+    'bme':     (30.0, 2.0, 120.0),
+    'ds18b20': (30.0, 2.0, 120.0), # 1-wire conversion alone takes ~750 ms
+}
 # ... (imports)
 
 # --- Configuration ---
@@ -65,15 +97,22 @@ THRESH_TEMP_HIGH = 50.0
 THRESH_TEMP_LOW = 0.0
 THRESH_HUMIDITY_HIGH = 80.0
 THRESH_LIGHT_LEAK = 10.0 # Lux inside closed box
+ALERT_COALESCE_WINDOW = 2.0 # Seconds to gather a burst into one Matrix message
+ALERT_KEY_INTERVAL = 60.0 # Min seconds between alerts with the same key (e.g. motion)
 
 # --- Auto Mode Thresholds ---
 AUTO_MODE_ENABLED = os.getenv("AUTO_MODE_ENABLED", "1") == "1"
-THRESH_SOLAR_HIGH = 15.0 # Watts (Go Tactical)
-THRESH_BATT_HIGH = 13.2  # Volts (Go Tactical)
-THRESH_SOLAR_LOW = 5.0   # Watts (Go Sentry)
-THRESH_BATT_LOW = 12.5   # Volts (Go Sentry)
+THRESH_SOC_TACTICAL = 0.80 # Go Tactical above this SoC...
+THRESH_SOC_CHARGING = 0.50 # ...or above this SoC while the battery is net charging
+THRESH_SOC_SENTRY = 0.40   # Go Sentry below this SoC...
+THRESH_RUNTIME_RESERVE_H = 72.0 # ...or when discharging with less runtime than this left
 HYSTERESIS_SAMPLES = 12  # 12 * 5s = 60s
 
+# --- Battery (State of Charge) ---
+BATTERY_CAPACITY_AH = float(os.getenv("BATTERY_CAPACITY_AH", "100"))
+MPPT_EFFICIENCY = 0.95 # Solar INA219 sits on the panel side of the MPPT
+SOC_STATE_FILE = os.getenv("SOC_STATE_FILE", "/var/log/reduit_soc.json")
+
 
 # --- Alert Manager Class ---
 class AlertManager:
@@ -82,7 +121,7 @@ class AlertManager:
         self.cooldown = 3600 # 1 hour cooldown for persistent conditions
         
     def check(self, key, condition, message, is_critical=False):
-        timestamp = time.time()
+        timestamp = hardware.clock.time()
         last_time = self.states.get(key, 0)
         
         if condition:
@@ -90,7 +129,7 @@ class AlertManager:
             if (timestamp - last_time) > self.cooldown:
                 priority = "🔴 CRITICAL" if is_critical else "⚠️ WARNING"
                 full_msg = f"{priority}: {message}"
-                send_matrix_alert(full_msg)
+                send_matrix_alert(full_msg, key=key)
                 logger.warning(full_msg)
                 if is_critical: buzz(1.0, 1)
                 else: buzz(0.2, 2)
@@ -138,110 +177,277 @@ def check_sensor_thresholds(data):
     alert_manager.check("light_leak", (not lid_open and lux > THRESH_LIGHT_LEAK), 
                         f"Light Detected ({lux:.1f} lx) while Lid Closed! Hull Breach?", is_critical=True)
 
-# ... (main loop)
-
-    while True:
-        # Check Matrix for Commands
-        check_matrix_commands()
-        
-        # ... (read sensors) ...
-        
-        # Check alerts
-        check_sensor_thresholds(data)
-
-        # Logging
-        # ...
 MATRIX_HOMESERVER = os.getenv("MATRIX_HOMESERVER", "https://matrix.org")
 MATRIX_ACCESS_TOKEN = os.getenv("MATRIX_ACCESS_TOKEN", "")
 MATRIX_ROOM_ID = os.getenv("MATRIX_ROOM_ID", "")
+# Persisted /sync position so a restart neither misses nor replays commands
+MATRIX_SYNC_TOKEN_FILE = os.getenv("MATRIX_SYNC_TOKEN_FILE", "/var/log/reduit_matrix_next_batch")
 
 # --- InfluxDB Config (Env Vars) ---
 INFLUX_URL = os.getenv("INFLUX_URL", "http://influxdb:8086")
 INFLUX_TOKEN = os.getenv("INFLUX_TOKEN", "")
 INFLUX_ORG = os.getenv("INFLUX_ORG", "reduit")
 INFLUX_BUCKET = os.getenv("INFLUX_BUCKET", "power")
+INFLUX_BATCH_SIZE = int(os.getenv("INFLUX_BATCH_SIZE", "50"))
+INFLUX_FLUSH_INTERVAL = float(os.getenv("INFLUX_FLUSH_INTERVAL", "30"))
+# Write-ahead spool on the SSD, replayed when InfluxDB comes back
+INFLUX_SPOOL_DIR = os.getenv("INFLUX_SPOOL_DIR", "/var/log/reduit_influx_spool")
+INFLUX_SPOOL_MAX_MB = int(os.getenv("INFLUX_SPOOL_MAX_MB", "64"))
+# Retention of the raw bucket, applied on first write (0 leaves it as configured in InfluxDB)
+INFLUX_RAW_RETENTION_DAYS = float(os.getenv("INFLUX_RAW_RETENTION_DAYS", "0"))
+
+# Plugins switched off regardless of config / detection, e.g. "compass,influx" (see plugins.py)
+DISABLED_PLUGINS = [name.strip() for name in os.getenv("DISABLED_PLUGINS", "").split(",") if name.strip()]
+W1_DEVICE_GLOB = "/sys/bus/w1/devices/28-*" # DS18B20 family code
+
+# Sample field -> InfluxDB field name (power_metrics measurement and rollup tiers)
+INFLUX_FIELDS = {
+    'solar_volts': 'solar_volts', 'solar_amps': 'solar_amps', 'solar_watts': 'solar_watts',
+    'system_volts': 'system_volts', 'system_amps': 'system_amps', 'system_watts': 'system_watts',
+    'net_watts': 'net_watts', 'temperature': 'temperature_c', 'humidity': 'humidity_pct',
+    'pressure': 'pressure_hpa', 'lux': 'lux', 'heading': 'heading_deg', 'lid_open': 'lid_open',
+    'soc_pct': 'soc_pct', 'runtime_h': 'runtime_h',
+}
+
+INFLUX_TAGS = {'host': socket.gethostname()}
+
+# --- Compression ---
+# Per-field deadband / swinging-door ("sdt") filtering in front of InfluxDB and the
+# telemetry log; alerts, auto mode, rollups and the status channel still see every sample.
+# Tolerances sit just above the sensor noise. Each field is re-sent at least every
+# COMPRESSION_KEEPALIVE seconds so dashboards and staleness checks keep working.
+COMPRESSION_ENABLED = os.getenv("COMPRESSION_ENABLED", "1") == "1"
+COMPRESSION_KEEPALIVE = float(os.getenv("COMPRESSION_KEEPALIVE", "300"))
+COMPRESSION = {
+    'solar_volts':  ('sdt', 0.2),
+    'solar_amps':   ('sdt', 0.05),
+    'solar_watts':  ('sdt', 1.0),
+    'system_volts': ('sdt', 0.02),
+    'system_amps':  ('sdt', 0.05),
+    'system_watts': ('sdt', 0.5),
+    'net_watts':    ('sdt', 1.0),
+    'temperature':  ('sdt', 0.2),
+    'humidity':     ('sdt', 1.0),
+    'pressure':     ('sdt', 0.3),
+    'soc_pct':      ('sdt', 0.5),
+    'lux':          ('deadband', 2.0),
+    'heading':      ('deadband', 2.0),
+    'lid_open':     ('deadband', 0.0), # Every change
+}
+
+# --- Rollups ---
+# Streaming min/max/mean/last per tier. Each tier goes to measurement power_metrics_<tier>
+# in its own bucket (<INFLUX_BUCKET>_<tier>) and to its own telemetry log (power_<tier>-*.rtl).
+# tier: (window s, InfluxDB retention days (0 = forever), local log budget MB)
+ROLLUP_TIERS = {
+    '1m':  (60, 90, 32),
+    '15m': (900, 730, 16),
+    '1h':  (3600, 0, 8),
+}
+# Heading has no meaningful mean, so it isn't rolled up
+ROLLUP_FIELDS = [name for name in INFLUX_FIELDS if name != 'heading']
+
+# Actuators (mode switches)
+ACTUATOR_TIMEOUT = 10.0 # seconds, per mode switch
+
+# Prometheus exporter (0 disables); scraped by Telegraf into InfluxDB, see k8s/monitoring.yaml
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9101"))
+K8S_NAMESPACE = os.getenv("K8S_NAMESPACE", "default")
 
 # --- GPIO Setup ---
-GPIO.setmode(GPIO.BCM)
-GPIO.setup(PIN_LID_SENSOR, GPIO.IN, pull_up_down=GPIO.PUD_UP)
-GPIO.setup(PIN_BUZZER, GPIO.OUT, initial=GPIO.LOW)
+def setup_gpio():
+    GPIO.setmode(GPIO.BCM)
+    GPIO.setup(PIN_LID_SENSOR, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+    GPIO.setup(PIN_BUZZER, GPIO.OUT, initial=GPIO.LOW)
+
+def set_buzzer(on):
+    GPIO.output(PIN_BUZZER, GPIO.HIGH if on else GPIO.LOW)
+
+buzzer = BuzzerPlayer(set_buzzer)
 
 def buzz(duration=0.1, count=1):
-    """Activates the buzzer."""
-    try:
-        for _ in range(count):
-            GPIO.output(PIN_BUZZER, GPIO.HIGH)
-            time.sleep(duration)
-            GPIO.output(PIN_BUZZER, GPIO.LOW)
-            if count > 1: time.sleep(0.1)
-    except: pass
+    """Activates the buzzer (queued, returns immediately)."""
+    buzzer.play(duration, count)
 
 # --- Logging Setup ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# --- InfluxDB Client ---
-influx_write_api = None
-try:
-    if INFLUX_TOKEN:
-        influx_client = InfluxDBClient(url=INFLUX_URL, token=INFLUX_TOKEN, org=INFLUX_ORG)
-        influx_write_api = influx_client.write_api(write_options=SYNCHRONOUS)
+# --- Plugins ---
+# Sensor drivers and sinks are imported and started only when enabled and (for devices)
+# present, so a pod without InfluxDB, Matrix or some sensors doesn't load their libraries.
+plugins = PluginRegistry(disabled=DISABLED_PLUGINS)
+plugins.register('solar', 'i2c_bus:INA219', addr=I2C_ADDR_SOLAR, label="INA219",
+                 args=('solar', I2C_ADDR_SOLAR, INA219_SHUNT_OHMS))
+plugins.register('system', 'i2c_bus:INA219', addr=I2C_ADDR_SYSTEM, label="INA219",
+                 args=('system', I2C_ADDR_SYSTEM, INA219_SHUNT_OHMS))
+plugins.register('bme', 'i2c_bus:BME280', addr=I2C_ADDR_BME, label="BME280", args=('bme', I2C_ADDR_BME))
+plugins.register('mpu', 'i2c_bus:MPU6050', addr=I2C_ADDR_MPU, label="MPU6050", args=('mpu', I2C_ADDR_MPU))
+plugins.register('light', 'i2c_bus:BH1750', addr=I2C_ADDR_BH1750, label="BH1750", args=('light', I2C_ADDR_BH1750))
+plugins.register('compass', 'i2c_bus:Compass', addr=I2C_ADDR_COMPASS, label="Compass HMC5883L",
+                 args=('compass', I2C_ADDR_COMPASS))
+plugins.register('tamper', 'tamper:TamperDetector', kind="device", label="Tamper detector (numpy)")
+plugins.register('ds18b20', 'w1thermsensor:W1ThermSensor', kind="device", label="DS18B20",
+                 enabled=lambda: bool(glob.glob(W1_DEVICE_GLOB)))
+plugins.register('influx', 'influx_writer:connect', kind="sink", label="InfluxDB", enabled=bool(INFLUX_TOKEN),
+                 args=(INFLUX_URL, INFLUX_TOKEN, INFLUX_ORG))
+plugins.register('matrix', 'matrix_worker:MatrixCommandWorker', kind="sink", label="Matrix",
+                 enabled=bool(MATRIX_ACCESS_TOKEN and MATRIX_ROOM_ID),
+                 args=(MATRIX_HOMESERVER, MATRIX_ACCESS_TOKEN, MATRIX_ROOM_ID),
+                 kwargs={'token_file': MATRIX_SYNC_TOKEN_FILE})
+plugins.register('kube', 'actuators:KubeClient', kind="sink", label="Kubernetes API",
+                 enabled=not hardware.SIMULATED and bool(os.getenv("KUBERNETES_SERVICE_HOST")))
+
+# Started by init_plugins()
+influx_writer = None # The sampling loop only enqueues; the writer thread batches, flushes and spools.
+rollup_writers = {}  # tier -> InfluxBatchWriter for that tier's bucket
+matrix_worker = None
+alert_dispatcher = None
+kube_client = None
+temp_sensor = None
+
+def init_plugins():
+    """Creates the enabled sinks and the 1-Wire sensor. I2C sensors are probed in main()."""
+    global influx_writer, matrix_worker, alert_dispatcher, kube_client, temp_sensor
+    influx = plugins.create('influx')
+    if influx:
+        client, write_api = influx
+        influx_writer = InfluxBatchWriter(
+            write_api, INFLUX_BUCKET, INFLUX_ORG,
+            spool_dir=INFLUX_SPOOL_DIR, batch_size=INFLUX_BATCH_SIZE,
+            flush_interval=INFLUX_FLUSH_INTERVAL, spool_max_bytes=INFLUX_SPOOL_MAX_MB * 1024 * 1024,
+            prepare=bucket_preparer(client, INFLUX_ORG, INFLUX_BUCKET, INFLUX_RAW_RETENTION_DAYS)
+            if INFLUX_RAW_RETENTION_DAYS else None)
+        for tier, (_, retention_days, _) in ROLLUP_TIERS.items():
+            bucket = f"{INFLUX_BUCKET}_{tier}"
+            rollup_writers[tier] = InfluxBatchWriter(
+                write_api, bucket, INFLUX_ORG,
+                spool_dir=os.path.join(INFLUX_SPOOL_DIR, tier), batch_size=INFLUX_BATCH_SIZE,
+                flush_interval=INFLUX_FLUSH_INTERVAL, spool_max_bytes=INFLUX_SPOOL_MAX_MB * 1024 * 1024 // 4,
+                precision="s", prepare=bucket_preparer(client, INFLUX_ORG, bucket, retention_days))
         logger.info(f"InfluxDB Client initialized for {INFLUX_URL}")
-    else:
+    elif not INFLUX_TOKEN:
         logger.warning("INFLUX_TOKEN not set. Skipping DB writes.")
-except Exception as e:
-    logger.error(f"Failed to init InfluxDB: {e}")
 
-# --- DS18B20 Sensor ---
-temp_sensor = None
-try:
-    temp_sensor = W1ThermSensor()
-    logger.info(f"DS18B20 Sensor found: {temp_sensor.id}")
-except Exception as e:
-    logger.warning(f"No DS18B20 sensor found: {e}")
+    matrix_worker = plugins.create('matrix')
+    if matrix_worker:
+        alert_dispatcher = AlertDispatcher(matrix_worker.send_message,
+                                           coalesce_window=ALERT_COALESCE_WINDOW, key_interval=ALERT_KEY_INTERVAL)
+    elif not (MATRIX_ACCESS_TOKEN and MATRIX_ROOM_ID):
+        logger.warning("MATRIX_ACCESS_TOKEN/MATRIX_ROOM_ID not set. Matrix alerts and commands disabled.")
 
-# --- Compass Helper Class (HMC5883L) ---
-class Compass:
-    def __init__(self, i2c_bus, addr=0x1E):
-        self.bus = i2c_bus
-        self.addr = addr
-        self._init_sensor()
+    kube_client = plugins.create('kube')
+    if kube_client is None and not hardware.SIMULATED:
+        logger.info("Kubernetes API not available, scaling via kubectl.")
 
-    def _init_sensor(self):
-        try:
-            while not self.bus.try_lock(): pass
-            # 0x00=ConfigA (8-avg,15Hz), 0x01=ConfigB (Gain), 0x02=Mode (Continuous)
-            self.bus.writeto(self.addr, bytes([0x00, 0x70]))
-            self.bus.writeto(self.addr, bytes([0x01, 0x20]))
-            self.bus.writeto(self.addr, bytes([0x02, 0x00]))
-            self.bus.unlock()
-            logger.info("Compass HMC5883L initialized.")
-        except Exception as e:
-            logger.error(f"Failed to init Compass: {e}")
-            if hasattr(self.bus, 'unlock'): self.bus.unlock()
+    temp_sensor = plugins.create('ds18b20')
+    if temp_sensor:
+        logger.info(f"DS18B20 Sensor found: {temp_sensor.id}")
+    else:
+        logger.warning("No DS18B20 sensor found.")
 
-    def read_heading(self):
-        try:
-            while not self.bus.try_lock(): pass
-            self.bus.writeto(self.addr, bytes([0x03]), stop=False)
-            buffer = bytearray(6)
-            self.bus.readfrom_into(self.addr, buffer)
-            self.bus.unlock()
-            x = int.from_bytes(buffer[0:2], byteorder='big', signed=True)
-            z = int.from_bytes(buffer[2:4], byteorder='big', signed=True)
-            y = int.from_bytes(buffer[4:6], byteorder='big', signed=True)
-            heading_rad = math.atan2(y, x)
-            if heading_rad < 0: heading_rad += 2 * math.pi
-            return math.degrees(heading_rad)
-        except Exception as e:
-            if hasattr(self.bus, 'unlock'): self.bus.unlock()
-            return 0.0
+# --- Status Channel (IPC) ---
+status_writer = None
+try:
+    status_writer = StatusWriter()
+except Exception as e:
+    logger.error(f"Failed to open status channel: {e}")
+
+# --- Metrics ---
+LOOP_STAGE_SECONDS = Histogram("reduit_loop_stage_seconds", "Duration of each main loop stage.", ["stage"])
+SINK_ERRORS = Counter("reduit_sink_errors_total", "Failed writes per output sink.", ["sink"])
+QUEUE_DEPTH = Gauge("reduit_queue_depth", "Items waiting in each internal queue.", ["queue"])
+_stage_seconds = {stage: LOOP_STAGE_SECONDS.labels(stage)
+                  for stage in ("publish", "thresholds", "auto_mode", "compress", "store", "rollups", "total")}
+
+def observe_stage(stage, t0):
+    """Records the time since t0 for a loop stage and returns the new reference time."""
+    now = time.perf_counter()
+    _stage_seconds[stage].observe(now - t0)
+    return now
+
+def register_metrics(bus=None, tamper=None):
+    """Exposes the components' own counters and queue lengths; all read at scrape time."""
+    if influx_writer:
+        QUEUE_DEPTH.labels("influx").set_function(lambda: influx_writer.stats()['queue_depth'])
+        Gauge("reduit_influx_spool_bytes", "Bytes of line protocol spooled to disk.").set_function(
+            lambda: influx_writer.stats()['spool_bytes'])
+        SINK_ERRORS.labels("influx_flush").set_function(lambda: influx_writer.failures)
+        Counter("reduit_influx_dropped_total", "Points dropped because the queue was full.").set_function(
+            lambda: influx_writer.dropped)
+    for tier, writer in rollup_writers.items():
+        QUEUE_DEPTH.labels(f"influx_{tier}").set_function(lambda w=writer: w.stats()['queue_depth'])
+        SINK_ERRORS.labels(f"influx_{tier}_flush").set_function(lambda w=writer: w.failures)
+    if compressor:
+        ratio = Gauge("reduit_compression_ratio", "Telemetry values sampled per value stored.", ["field"])
+        ratio.labels("total").set_function(compressor.ratio)
+        for name in COMPRESSION:
+            ratio.labels(name).set_function(lambda n=name: compressor.ratio(n))
+        Counter("reduit_compression_rows_stored_total", "Telemetry records written to storage.").set_function(
+            lambda: compressor.rows_out)
+    rollups_emitted = Counter("reduit_rollups_total", "Rollup windows closed per tier.", ["tier"])
+    for tier in ROLLUP_TIERS:
+        rollups_emitted.labels(tier).set_function(lambda t=tier: rollups.emitted[t])
+    if alert_dispatcher:
+        QUEUE_DEPTH.labels("alerts").set_function(alert_dispatcher.depth)
+        SINK_ERRORS.labels("matrix_alerts").set_function(lambda: alert_dispatcher.failures)
+        Counter("reduit_alerts_suppressed_total", "Alerts suppressed by per-key rate limiting.").set_function(
+            lambda: alert_dispatcher.suppressed_total)
+    if matrix_worker:
+        QUEUE_DEPTH.labels("matrix_commands").set_function(matrix_worker.commands.qsize)
+    if bus:
+        i2c_transactions = Counter("reduit_i2c_transactions_total", "I2C transactions per device.", ["device"])
+        i2c_errors = Counter("reduit_i2c_errors_total", "Failed I2C transactions per device.", ["device"])
+        for name, device in bus.devices.items():
+            i2c_transactions.labels(name).set_function(lambda d=device: d.transactions)
+            i2c_errors.labels(name).set_function(lambda d=device: d.errors)
+    if tamper:
+        Counter("reduit_tamper_events_total", "Tamper events raised by the MPU6050 detector.").set_function(
+            lambda: tamper.events)
+    Gauge("reduit_soc_ratio", "Estimated battery state of charge (0-1).").set_function(lambda: soc_estimator.soc)
+    if voltage_guard:
+        Gauge("reduit_voltage_guard_volts", "Filtered battery voltage seen by the low-voltage guard.").set_function(
+            lambda: voltage_guard.volts)
+        Counter("reduit_voltage_guard_read_errors_total", "Failed voltage guard reads.").set_function(
+            lambda: voltage_guard.read_errors)
+    if sample_ticker:
+        Counter("reduit_loop_deadline_misses_total", "Main loop ticks that fired late.").set_function(
+            lambda: sample_ticker.missed)
+        Counter("reduit_loop_skipped_ticks_total", "Main loop slots dropped after a stall.").set_function(
+            lambda: sample_ticker.skipped)
+        Counter("reduit_loop_overruns_total", "Main loop passes that took longer than the interval.").set_function(
+            lambda: sample_ticker.overruns)
+        Counter("reduit_clock_steps_total", "System clock steps seen by the sample ticker.").set_function(
+            lambda: sample_ticker.clock_steps)
+
+# --- Actuators ---
+# Mode switches write sysfs / the k3s API directly and only touch what differs.
+actuator_engine = ActuatorEngine(timeout=ACTUATOR_TIMEOUT)
+if hardware.SIMULATED:
+    actuator_engine.register(MemoryActuator('cpu_governor'))
+    wifi_powersave = actuator_engine.register(MemoryActuator('wifi_powersave'))
+    actuator_engine.register(MemoryActuator('wifi_link'))
+else:
+    actuator_engine.register(CpuGovernor())
+    wifi_powersave = actuator_engine.register(WifiPowerSave(WIFI_INTERFACE))
+    actuator_engine.register(WifiLink(up=lambda: wifi_link_up(), down=lambda: wifi_link_down()))
+
+def scale_actuator(deployment):
+    """Name of the (lazily registered) replica actuator for a deployment."""
+    name = f"scale:{deployment}"
+    if name not in actuator_engine.actuators:
+        if hardware.SIMULATED:
+            actuator_engine.register(MemoryActuator(name))
+        else:
+            actuator_engine.register(DeploymentScale(deployment, K8S_NAMESPACE, client=kube_client))
+    return name
 
 # --- Matrix Helper ---
 # ... (imports)
 
 # Global State for Status Command
 latest_data = {}
+sample_ticker = None # SampleTicker driving the main loop (created in main())
 auto_mode_counter = 0 # +ve for Tactical, -ve for Sentry
 current_mode = "unknown" # 'sentry', 'tactical', 'manual'
 
@@ -252,40 +458,56 @@ def set_mode_sentry(reason="User Command"):
     global current_sample_interval, current_mode
     if current_mode == "sentry": return
     
-    set_cpu_governor("powersave")
-    set_k8s_scale("tileserver", 0)
-    set_wifi_powersave(True)
     current_sample_interval = SAMPLE_INTERVAL_ECO
     current_mode = "sentry"
-    send_matrix_alert(f"💤 SENTRY MODE ACTIVE ({reason})")
+    if sample_ticker: sample_ticker.set_interval(current_sample_interval)
+    apply_power_state({'cpu_governor': "powersave", scale_actuator("tileserver"): 0, 'wifi_powersave': True},
+                      f"💤 SENTRY MODE ACTIVE ({reason})")
 
 def set_mode_tactical(reason="User Command"):
     """Enables Tactical (Active) Mode."""
     global current_sample_interval, current_mode
     if current_mode == "tactical": return
     
-    set_cpu_governor("ondemand")
-    set_k8s_scale("tileserver", 1)
-    set_wifi_powersave(False) # Performance WiFi
     current_sample_interval = SAMPLE_INTERVAL_ACTIVE
     current_mode = "tactical"
-    send_matrix_alert(f"🚀 TACTICAL MODE ACTIVE ({reason})")
+    if sample_ticker: sample_ticker.set_interval(current_sample_interval)
+    # Performance WiFi
+    apply_power_state({'cpu_governor': "ondemand", scale_actuator("tileserver"): 1, 'wifi_powersave': False},
+                      f"🚀 TACTICAL MODE ACTIVE ({reason})")
+
+def apply_power_state(desired, headline=None):
+    """Hands the desired state to the actuator engine (returns immediately) and, once it
+    has been applied, sends one alert summarising what actually changed."""
+    def report(results):
+        lines = []
+        for name, result in results.items():
+            if result == "changed":
+                lines.append(f"✔️ {name} → {desired[name]}")
+            elif result != "unchanged":
+                lines.append(f"⚠️ {name}: {result}")
+        if any(r == "changed" for r in results.values()):
+            buzz(0.1, 1)
+        if headline:
+            send_matrix_alert("\n".join([headline] + lines))
+        elif lines:
+            send_matrix_alert("\n".join(lines))
+    return actuator_engine.apply(desired, report)
 
 def check_auto_mode(data):
-    """Checks power levels and auto-switches modes."""
+    """Switches modes on the energy budget (SoC and runtime) rather than raw voltage."""
     global auto_mode_counter
-    if not AUTO_MODE_ENABLED: return
+    if not AUTO_MODE_ENABLED or soc_estimator.soc is None: return
 
-    # Current readings
-    solar_watts = data.get('solar_watts', 0)
-    batt_volts = data.get('system_volts', 0)
-    
-    # Conditions
-    # Go TACTICAL if Solar is abundant OR Battery is very full
-    cond_tactical = (solar_watts > THRESH_SOLAR_HIGH) or (batt_volts > THRESH_BATT_HIGH)
-    
-    # Go SENTRY if Solar is low AND Battery is not full (discharging/low)
-    cond_sentry = (solar_watts < THRESH_SOLAR_LOW) and (batt_volts < THRESH_BATT_LOW)
+    soc = soc_estimator.soc
+    charging = soc_estimator.avg_watts > 0
+    runtime_h = soc_estimator.runtime_hours()
+
+    # Go TACTICAL if the battery is well charged, or comfortably charged and gaining energy
+    cond_tactical = soc >= THRESH_SOC_TACTICAL or (charging and soc >= THRESH_SOC_CHARGING)
+
+    # Go SENTRY if the battery is low, or the current drain would eat into the reserve
+    cond_sentry = soc < THRESH_SOC_SENTRY or (runtime_h is not None and runtime_h < THRESH_RUNTIME_RESERVE_H)
     
     if cond_tactical:
         auto_mode_counter += 1
@@ -302,67 +524,59 @@ def check_auto_mode(data):
         if auto_mode_counter > 0: auto_mode_counter -= 1
         elif auto_mode_counter < 0: auto_mode_counter += 1
 
-def check_matrix_commands():
-    """Polls Matrix for new commands (!wifi on/off, !status)."""
-    global next_batch_token
-    if not MATRIX_ACCESS_TOKEN or not MATRIX_ROOM_ID: return
-
+def send_matrix_alert(message, key=None):
+    """Queues a message for the Matrix room (no-op without credentials).
+    Messages with a key are rate-limited per key; bursts are coalesced."""
+    if not alert_dispatcher: return
+    alert_dispatcher.post(message, key=key)
+
+def handle_matrix_command(body):
+    """Executes one command received from the Matrix room."""
+    global AUTO_MODE_ENABLED, auto_mode_counter
+    logger.info(f"Matrix command: {body}")
+    if body == "!wifi off":
+        set_wifi(False)
+    elif body == "!wifi on":
+        set_wifi(True)
+    elif body == "!maps off":
+        set_k8s_scale("tileserver", 0)
+    elif body == "!maps on":
+        set_k8s_scale("tileserver", 1)
+    elif body == "!eco on":
+        set_mode_sentry()
+    elif body == "!eco off":
+        set_mode_tactical()
+    elif body == "!auto on":
+        AUTO_MODE_ENABLED = True
+        send_matrix_alert("🔄 Dynamic Power Switching: ENABLED")
+        buzz(0.1, 2)
+    elif body == "!auto off":
+        AUTO_MODE_ENABLED = False
+        # Reset counter to zero to avoid stuck state if re-enabled
+        auto_mode_counter = 0
+        send_matrix_alert("🛑 Dynamic Power Switching: DISABLED (Manual Mode Only)")
+        buzz(0.5)
+    elif body == "!status":
+        send_status_report()
+
+def wait_for_command(timeout):
+    """Waits up to timeout for one Matrix command and executes it as soon as it arrives
+    (the sample ticker calls this until the next sample is due)."""
+    if not matrix_worker:
+        time.sleep(timeout)
+        return
     try:
-        url = f"{MATRIX_HOMESERVER}/_matrix/client/r0/sync"
-        params = {"timeout": 0, "filter": '{"room":{"rooms":["' + MATRIX_ROOM_ID + '"]}}'}
-        if next_batch_token: params["since"] = next_batch_token
-        
-        headers = {"Authorization": f"Bearer {MATRIX_ACCESS_TOKEN}"}
-        resp = requests.get(url, params=params, headers=headers, timeout=5)
-        
-        if resp.status_code == 200:
-            data = resp.json()
-            next_batch_token = data.get("next_batch")
-            
-            rooms = data.get("rooms", {}).get("join", {}).get(MATRIX_ROOM_ID, {})
-            timeline = rooms.get("timeline", {}).get("events", [])
-            
-            for event in timeline:
-                if event.get("type") == "m.room.message":
-                    body = event.get("content", {}).get("body", "").strip().lower()
-                    if body == "!wifi off":
-                        set_wifi(False)
-                    elif body == "!wifi on":
-                        set_wifi(True)
-                    elif body == "!maps off":
-                        set_k8s_scale("tileserver", 0)
-                    elif body == "!maps on":
-                        set_k8s_scale("tileserver", 1)
-                    elif body == "!eco on":
-                        set_mode_sentry()
-                    elif body == "!eco off":
-                        set_mode_tactical()
-                    elif body == "!auto on":
-                        global AUTO_MODE_ENABLED
-                        AUTO_MODE_ENABLED = True
-                        send_matrix_alert("🔄 Dynamic Power Switching: ENABLED")
-                        buzz(0.1, 2)
-                    elif body == "!auto off":
-                        global AUTO_MODE_ENABLED
-                        AUTO_MODE_ENABLED = False
-                        # Reset counter to zero to avoid stuck state if re-enabled
-                        global auto_mode_counter
-                        auto_mode_counter = 0
-                        send_matrix_alert("🛑 Dynamic Power Switching: DISABLED (Manual Mode Only)")
-                        buzz(0.5)
-                    elif body == "!status":
-                        send_status_report()
+        body = matrix_worker.commands.get(timeout=timeout)
+    except queue.Empty:
+        return
+    try:
+        handle_matrix_command(body)
     except Exception as e:
-        logger.error(f"Matrix Sync Fail: {e}")
+        logger.error(f"Command '{body}' failed: {e}")
 
 def set_wifi_powersave(enable):
-    """Sets WiFi Power Save mode."""
-    state = "on" if enable else "off"
-    try:
-        subprocess.run(["iw", "dev", WIFI_INTERFACE, "set", "power_save", state], check=True)
-        logger.info(f"WiFi Power Save set to {state}")
-    except Exception as e:
-        logger.error(f"WiFi PS Failed: {e}")
+    """Sets WiFi Power Save mode (no-op if already in that state)."""
+    apply_power_state({'wifi_powersave': enable})
 
 def set_tx_power(dbm):
     """Sets WiFi Transmission Power Limit."""
@@ -399,28 +613,12 @@ def set_usb_power(enable):
 
 def set_k8s_scale(deployment, replicas):
     """Scales a k8s deployment to save power."""
-    try:
-        # Assumes running as root with kubectl access or KUBECONFIG set
-        cmd = ["kubectl", "scale", "deployment", deployment, f"--replicas={replicas}", "-n", "default"]
-        subprocess.run(cmd, check=True)
-        send_matrix_alert(f"⚖️ Scaled {deployment} to {replicas} replicas.")
-        buzz(0.1, 1)
-    except Exception as e:
-        logger.error(f"Scale Failed: {e}")
-        send_matrix_alert(f"⚠️ Scale Failed: {e}")
+    apply_power_state({scale_actuator(deployment): replicas}, f"⚖️ Scale {deployment} to {replicas} replicas")
 
 def set_cpu_governor(mode):
     """Sets CPU Governor (powersave|ondemand|performance)."""
     # modes: powersave (min freq), ondemand (jumpy), performance (max)
-    try:
-        # RPi specific: write to all cores
-        # We use a shell command with wildcard expansion
-        subprocess.run(f"echo {mode} | tee /sys/devices/system/cpu/cpu*/cpufreq/scaling_governor", shell=True, check=True)
-        send_matrix_alert(f"🧠 CPU Governor set to: {mode.upper()}")
-        buzz(0.1, 1)
-    except Exception as e:
-        logger.error(f"CPU Gov Failed: {e}")
-        send_matrix_alert(f"⚠️ CPU Gov Failed: {e}")
+    apply_power_state({'cpu_governor': mode}, f"🧠 CPU Governor: {mode.upper()}")
 
 def send_status_report():
     if not latest_data:
@@ -434,184 +632,340 @@ def send_status_report():
             gov = f.read().strip()
     except: gov = "?"
 
+    runtime_h = soc_estimator.runtime_hours()
+    full_h = soc_estimator.time_to_full_hours()
+    if runtime_h is not None: budget = f"~{runtime_h:.0f}h left"
+    elif full_h is not None: budget = f"charging, full in ~{full_h:.0f}h"
+    else: budget = "balanced"
     msg = (f"🔋 **Power**: {d.get('system_volts',0):.2f}V | {d.get('net_watts',0):.1f}W Net\n"
+           f"🔋 **Battery**: {d.get('soc_pct',0):.0f}% SoC | {budget}\n"
            f"🌡️ **Climate**: {d.get('temperature',0):.1f}°C | {d.get('humidity',0):.0f}% | {d.get('pressure',0):.0f}hPa\n"
            f"🧠 **System**: Mode: {current_mode.upper()} | CPU: {gov}\n"
            f"💡 **Light/Lid**: {d.get('lux',0):.0f} lx | Lid: {'OPEN' if d.get('lid_open') else 'Closed'}\n"
            f"🧭 **Heading**: {d.get('heading',0):.0f}°")
+    if influx_writer:
+        st = influx_writer.stats()
+        msg += (f"\n📦 **InfluxDB**: {'online' if st['online'] else 'OFFLINE'} | Queue: {st['queue_depth']} | "
+                f"Spool: {st['spool_bytes'] / 1024:.0f} KiB | Flush: {st['flush_latency_ms']:.0f} ms")
+    if compressor:
+        st = compressor.stats()
+        msg += f"\n🗜️ **Compression**: {st['ratio']:.1f}x values | {st['row_ratio']:.1f}x records"
+    if i2c_bus:
+        devs = " | ".join(f"{name} {s['latency_avg_ms']:.1f}ms/{s['errors']}err"
+                          for name, s in i2c_bus.stats().items())
+        msg += f"\n🔌 **I2C**: {devs}"
+    st = actuator_engine.stats()
+    msg += f"\n⚙️ **Actuators**: last switch {st['last_duration_ms']:.0f} ms | {st['changes']} changes | {st['errors']} errors"
+    if voltage_guard:
+        st = voltage_guard.stats()
+        msg += (f"\n🛡️ **Guard**: {st['volts'] or 0:.2f}V (min {st['min_volts'] or 0:.2f}V) | "
+                f"off below {SHUTDOWN_VOLTAGE:.1f}V within {st['max_trip_s']:.1f}s | {st['read_errors']} read errors")
+        if st['blind_s']:
+            msg += f" | ⚠️ blind for {st['blind_s']:.0f}s"
+    if sample_ticker:
+        st = sample_ticker.stats()
+        msg += (f"\n⏱️ **Loop**: every {st['interval']}s | {st['missed']} late | {st['skipped']} skipped | "
+                f"{st['overruns']} overruns | max late {st['max_late_ms']:.0f} ms")
     send_matrix_alert(msg)
 
-# ... (set_wifi, get_temperature, write_to_influx, initialize_sensors, log_to_csv) ...
-
-def main():
-    global latest_data
-    i2c = busio.I2C(board.SCL, board.SDA)
-    # ... (init sensors) ...
-    
-    hostname = socket.gethostname()
-    buzz(0.1, 2)
-    send_matrix_alert(f"🟢 Monitor Online on {hostname}. Audio & Sensors Active.")
-    buzz(0.1, 2)
-    send_matrix_alert(f"🟢 Monitor Online on {hostname}. Audio & Sensors Active.")
-    logger.info("Starting Power Monitor Loop...")
-
-    # Initial WiFi Config
+def wifi_link_up():
+    """Wake up: 1. Power on USB, 2. Link up, 3. Config (runs on the actuator engine)."""
+    set_usb_power(True)
+    time.sleep(2) # Wait for device to enumerate
+    subprocess.run(["ip", "link", "set", WIFI_INTERFACE, "up"], check=True)
+    time.sleep(1)
     set_tx_power(WIFI_TXPOWER_DBM)
-    set_wifi_powersave(True)
+    wifi_powersave.invalidate() # Fresh adapter, driver default applies again
 
-    low_voltage_counter = 0
-    last_accel = None
-    last_lid_state = False 
-
-    while True:
-        # Check Matrix for Commands
-        check_matrix_commands()
-
-        data = {
-            'timestamp': datetime.now().isoformat(),
-            'solar_volts': 0.0, 'solar_amps': 0.0, 'solar_watts': 0.0,
-            'system_volts': 0.0, 'system_amps': 0.0, 'system_watts': 0.0,
-            'net_watts': 0.0, 'temperature': 0.0, 'humidity': 0.0, 'pressure': 0.0,
-            'lid_open': False, 'heading': 0.0, 'lux': 0.0
-        }
-
-        # ... (Sensor Reading Logic same as before) ...
-        # ... (0. Check Lid) ...
-        # ... (1. Read Temp) ...
-        # ... (2. Read Power) ...
-        # ... (3. Read Environment) ...
-        # ... (4. Read Compass) ...
-        # ... (5. Check Motion) ...
-        
-        # [OMITTED FOR BREVITY - KEEP EXISTING READING CODE]
-
-        # Update Global State for !status command
-        latest_data = data
-        
-        # Export for TAK Bridge (IPC)
-        try:
-            with open("/tmp/reduit_status.json", "w") as f:
-                json.dump(data, f)
-        except: pass
-        
-        # Check Thresholds
-        check_sensor_thresholds(data)
-        
-        # Check Auto Mode
-        check_auto_mode(data)
-        
-        # Logging
-        # ... (rest of loop) ...
+def wifi_link_down():
+    """Sleep: 1. Link down, 2. Power off USB (runs on the actuator engine)."""
+    subprocess.run(["ip", "link", "set", WIFI_INTERFACE, "down"], check=True)
+    set_usb_power(False)
 
 def set_wifi(state):
-    """Toggles WiFi Interface and USB Power."""
+    """Toggles WiFi Interface and USB Power. The sequence runs on the actuator engine, so a
+    wake-up (several seconds) doesn't hold up sampling; the outcome is posted as an alert."""
     cmd = "up" if state else "down"
-    try:
+    def report(results):
+        result = results.get('wifi_link')
+        if result not in ("changed", "unchanged"):
+            send_matrix_alert(f"⚠️ Failed to set WiFi {cmd}: {result}")
+            return
         if state:
-            # Wake up: 1. Power on USB, 2. Link up, 3. Config
-            set_usb_power(True)
-            time.sleep(2) # Wait for device to enumerate
-            subprocess.run(["ip", "link", "set", WIFI_INTERFACE, cmd], check=True)
-            time.sleep(1)
-            set_tx_power(WIFI_TXPOWER_DBM)
             set_wifi_powersave(True)
             send_matrix_alert(f"📶 WiFi {WIFI_INTERFACE} is now UP (Active).")
         else:
-            # Sleep: 1. Link down, 2. Power off USB
-            subprocess.run(["ip", "link", "set", WIFI_INTERFACE, cmd], check=True)
-            set_usb_power(False)
             send_matrix_alert(f"💤 WiFi {WIFI_INTERFACE} is now DOWN (Deep Sleep).")
-            
         buzz(0.1, 1) # Confirm beep
-    except Exception as e:
-        send_matrix_alert(f"⚠️ Failed to set WiFi {cmd}: {e}")
-
-def get_temperature():
-    if not temp_sensor: return 0.0
-    try: return temp_sensor.get_temperature()
-    except: return 0.0
+    return actuator_engine.apply({'wifi_link': state}, report)
 
-def write_to_influx(data):
-    if not influx_write_api: return
+def write_to_influx(data, ts, fields=INFLUX_FIELDS):
+    """Enqueues the given fields of a sample as one power_metrics point at epoch time ts."""
+    if not influx_writer: return
     try:
-        p = Point("power_metrics") \
-            .tag("host", socket.gethostname()) \
-            .field("solar_volts", data['solar_volts']) \
-            .field("solar_amps", data['solar_amps']) \
-            .field("solar_watts", data['solar_watts']) \
-            .field("system_volts", data['system_volts']) \
-            .field("system_amps", data['system_amps']) \
-            .field("system_watts", data['system_watts']) \
-            .field("net_watts", data['net_watts']) \
-            .field("temperature_c", data['temperature']) \
-            .field("humidity_pct", data.get('humidity', 0.0)) \
-            .field("pressure_hpa", data.get('pressure', 0.0)) \
-            .field("lux", data.get('lux', 0.0)) \
-            .field("heading_deg", data.get('heading', 0.0)) \
-            .field("lid_open", int(data.get('lid_open', 0))) \
-            .time(datetime.utcnow(), WritePrecision.NS)
-        influx_write_api.write(bucket=INFLUX_BUCKET, org=INFLUX_ORG, record=p)
+        values = {}
+        for name in fields:
+            value = data.get(name)
+            if value is None: continue
+            values[INFLUX_FIELDS[name]] = int(value) if name == 'lid_open' else float(value)
+        influx_writer.enqueue(line_protocol("power_metrics", INFLUX_TAGS, values, ts * 1e9))
     except Exception as e:
-        logger.error(f"Influx Write Failed: {e}")
+        SINK_ERRORS.labels("influx").inc()
+        logger.error(f"Influx Enqueue Failed: {e}")
 
-def initialize_sensors(i2c):
-    sensors = {}
-    
-    for name, addr in [('solar', I2C_ADDR_SOLAR), ('system', I2C_ADDR_SYSTEM)]:
-        try:
-            sensors[name] = INA219(i2c, addr=addr)
-            logger.info(f"{name} INA219 found at 0x{addr:02x}")
-        except ValueError:
-            logger.error(f"{name} INA219 NOT found at 0x{addr:02x}")
-            
+def initialize_sensors(bus):
+    """Probes the bus once and attaches every expected device that answers."""
     try:
-        bme = adafruit_bme280.Adafruit_BME280_I2C(i2c, address=I2C_ADDR_BME)
-        sensors['bme'] = bme
-        logger.info(f"BME280 found at 0x{I2C_ADDR_BME:02x}")
+        addrs = set(bus.scan())
     except Exception as e:
-        logger.warning(f"BME280 init failed: {e}")
+        logger.error(f"I2C scan failed: {e}")
+        return {}
+    # Drivers are only instantiated for the addresses that answered
+    return plugins.probe_i2c(bus, addrs)
+
+def read_ina219(prefix, ina):
+    """Reads one INA219 channel into '<prefix>_volts/_amps/_watts'."""
+    volts, amps, watts = ina.read()
+    return {f'{prefix}_volts': volts, f'{prefix}_amps': amps, f'{prefix}_watts': watts}
+
+def read_bme280(bme):
+    _, humidity, pressure = bme.read()
+    return {'humidity': humidity, 'pressure': pressure}
+
+def on_lid_update(values):
+    """Alerts on lid transitions as soon as the lid task sees them."""
+    global last_lid_state
+    is_open = values['lid_open']
+    if last_lid_state is not None:
+        if is_open and not last_lid_state:
+            buzz(0.5) # Warning Beep
+            send_matrix_alert("🔓 SECURITY ALERT: Le Réduit Lid Opened!", key="lid_open")
+        elif not is_open and last_lid_state:
+            send_matrix_alert("🔒 Info: Lid Closed.", key="lid_closed")
+    last_lid_state = is_open
+
+def on_tamper_event(kind, value):
+    """Called by the tamper detector thread."""
+    buzz(0.1, 3) # fast alarm
+    if kind == 'tilt':
+        send_matrix_alert(f"🏃‍♂️ MOVEMENT DETECTED! Box tilted by {value:.0f}°", key="tamper_tilt")
+    elif kind == 'knock':
+        send_matrix_alert(f"🏃‍♂️ MOVEMENT DETECTED! Knock: {value:.2f}g", key="tamper_knock")
+    else:
+        send_matrix_alert(f"🏃‍♂️ MOVEMENT DETECTED! Vibration: {value:.2f}g RMS", key="tamper_motion")
+
+last_lid_state = None
+
+soc_estimator = SocEstimator(BATTERY_CAPACITY_AH, SOC_STATE_FILE)
+
+def on_system_power_update(values, scheduler):
+    """Feeds every system INA219 reading (1 Hz) into the SoC estimator."""
+    solar = scheduler.tasks['solar'].values if 'solar' in scheduler.tasks else {}
+    volts = values['system_volts']
+    if volts < 5.0: return
+    battery_watts = solar.get('solar_watts', 0.0) * MPPT_EFFICIENCY - values['system_watts']
+    soc_estimator.update(volts, battery_watts / volts, now=hardware.clock.monotonic())
+
+def build_scheduler(sensors):
+    """Creates one acquisition task per detected sensor using SENSOR_SCHEDULE."""
+    scheduler = AcquisitionScheduler()
+    readers = {'lid': lambda: {'lid_open': GPIO.input(PIN_LID_SENSOR) == GPIO.HIGH}}
+    handlers = {'lid': on_lid_update,
+                'system': lambda values: on_system_power_update(values, scheduler)}
+    if 'system' in sensors:
+        readers['system'] = lambda: read_ina219('system', sensors['system'])
+    if 'solar' in sensors:
+        readers['solar'] = lambda: read_ina219('solar', sensors['solar'])
+    if 'light' in sensors:
+        readers['light'] = lambda: {'lux': sensors['light'].read()}
+    if 'compass' in sensors:
+        readers['compass'] = lambda: {'heading': sensors['compass'].read_heading()}
+    if 'bme' in sensors:
+        readers['bme'] = lambda: read_bme280(sensors['bme'])
+    if temp_sensor:
+        readers['ds18b20'] = lambda: {'temperature': temp_sensor.get_temperature()}
+
+    for name, read in readers.items():
+        interval, timeout, max_age = SENSOR_SCHEDULE[name]
+        scheduler.add(SensorTask(name, read, interval, timeout, max_age, on_update=handlers.get(name)))
+    return scheduler
+
+telemetry_log = None
+
+def log_telemetry(data, ts):
+    """Appends the sample to the binary telemetry log."""
+    global telemetry_log
+    if telemetry_log is None:
+        telemetry_log = TelemetryLog(TELEMETRY_LOG_DIR, max_total_bytes=TELEMETRY_LOG_MAX_MB * 1024 * 1024)
+    telemetry_log.append(data, ts=ts)
+
+compressor = TelemetryCompressor(COMPRESSION, keepalive=COMPRESSION_KEEPALIVE,
+                                 carry=[name for name in INFLUX_FIELDS if name not in COMPRESSION]) \
+    if COMPRESSION_ENABLED else None
+
+# Timestamps of the samples last written to the telemetry log (insertion ordered, bounded)
+logged_ts = {}
+
+def store_records(records):
+    """Writes compressed (ts, sample, fields) records to InfluxDB and the telemetry log."""
+    for ts, data, fields in records:
+        write_to_influx(data, ts, fields)
+        # Fixed-size records: the log stores the whole sample whenever any field is due.
+        # A delayed swinging-door point is for an earlier sample, which may be logged already
+        if ts in logged_ts: continue
+        logged_ts[ts] = True
+        if len(logged_ts) > 256:
+            del logged_ts[next(iter(logged_ts))]
+        try: log_telemetry(data, ts)
+        except Exception as e:
+            SINK_ERRORS.labels("telemetry_log").inc()
+            logger.error(f"Telemetry Log Failed: {e}")
 
+rollup_logs = {} # tier -> TelemetryLog, opened on the first closed window
+ROLLUP_SCHEMA = rollup_schema(ROLLUP_FIELDS)
+
+def on_rollup(rollup):
+    """Writes one closed rollup window to the tier's bucket and local log."""
+    writer = rollup_writers.get(rollup.tier)
+    if writer:
+        try:
+            values = {"samples": rollup.count}
+            for name, (lo, hi, mean, last) in rollup.stats.items():
+                field = INFLUX_FIELDS[name]
+                values.update({f"{field}_min": lo, f"{field}_max": hi, f"{field}_mean": mean, f"{field}_last": last})
+            writer.enqueue(line_protocol(f"power_metrics_{rollup.tier}", INFLUX_TAGS, values, rollup.start))
+        except Exception as e:
+            SINK_ERRORS.labels(f"influx_{rollup.tier}").inc()
+            logger.error(f"Influx Rollup Enqueue Failed: {e}")
     try:
-        mpu = MPU6050(i2c, address=I2C_ADDR_MPU)
-        sensors['mpu'] = mpu
-        logger.info(f"MPU6050 found at 0x{I2C_ADDR_MPU:02x}")
-    except Exception as e:
-        logger.warning(f"MPU6050 init failed: {e}")
-        
-    try:
-        bh1750 = adafruit_bh1750.BH1750(i2c, address=I2C_ADDR_BH1750)
-        sensors['light'] = bh1750
-        logger.info(f"BH1750 found at 0x{I2C_ADDR_BH1750:02x}")
+        log = rollup_logs.get(rollup.tier)
+        if log is None:
+            log = rollup_logs[rollup.tier] = TelemetryLog(
+                TELEMETRY_LOG_DIR, schema=ROLLUP_SCHEMA, prefix=f"power_{rollup.tier}",
+                segment_bytes=1024 * 1024, max_total_bytes=ROLLUP_TIERS[rollup.tier][2] * 1024 * 1024,
+                flush_every=1)
+        log.append(rollup.as_dict(), ts=rollup.start)
     except Exception as e:
-        logger.warning(f"BH1750 init failed: {e}")
-        
-    try:
-        while not i2c.try_lock(): pass
-        addrs = i2c.scan()
-        i2c.unlock()
-        if I2C_ADDR_COMPASS in addrs:
-            compass = Compass(i2c, addr=I2C_ADDR_COMPASS)
-            sensors['compass'] = compass
-            logger.info(f"Compass found at 0x{I2C_ADDR_COMPASS:02x}")
-    except: pass
-    return sensors
-
-def log_to_csv(data):
-    file_exists = False
-    try:
-        with open(LOG_FILE, 'r'): file_exists = True
-    except FileNotFoundError: pass
-    with open(LOG_FILE, 'a', newline='') as csvfile:
-        fieldnames = ['timestamp', 'solar_volts', 'solar_amps', 'solar_watts', 
-                      'system_volts', 'system_amps', 'system_watts', 'net_watts',
-                      'temperature', 'humidity', 'pressure', 'lid_open', 'heading', 'lux']
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        if not file_exists: writer.writeheader()
-        writer.writerow(data)
+        SINK_ERRORS.labels(f"telemetry_log_{rollup.tier}").inc()
+        logger.error(f"Rollup Log Failed: {e}")
+
+rollups = RollupAggregator(ROLLUP_FIELDS, on_rollup,
+                           tiers=[(tier, window) for tier, (window, _, _) in ROLLUP_TIERS.items()])
+
+SNAPSHOT_DEFAULTS = {
+    'solar_volts': 0.0, 'solar_amps': 0.0, 'solar_watts': 0.0,
+    'system_volts': 0.0, 'system_amps': 0.0, 'system_watts': 0.0,
+    'net_watts': 0.0, 'temperature': 0.0, 'humidity': 0.0, 'pressure': 0.0,
+    'lid_open': False, 'heading': 0.0, 'lux': 0.0
+}
+
+voltage_guard = None # VoltageGuard on the system INA219 (created in main())
+storage_lock = threading.Lock() # Main loop storage vs. the guard's shutdown flush
+shutting_down = False
+
+def shutdown(volts):
+    """Orderly low-voltage shutdown, run by the voltage guard (which forces a poweroff if
+    this takes longer than SHUTDOWN_TIMEOUT_S)."""
+    global shutting_down
+    deadline = time.monotonic() + SHUTDOWN_BUDGET_S
+    remaining = lambda: max(0.0, deadline - time.monotonic())
+    soc_estimator.save() # First: cheap, and what the next boot needs most
+    buzz(1.0) # Shutdown tone
+    send_matrix_alert(f"🔴 CRITICAL LOW VOLTAGE ({volts:.2f}V). Shutting down.")
+    # A main loop stuck inside storage must not hold the shutdown up; skip the flush then
+    if storage_lock.acquire(timeout=min(5.0, remaining())):
+        try:
+            shutting_down = True
+            if compressor: store_records(compressor.flush()) # Close the open swinging-door segments
+            rollups.flush() # Partial windows, so the last minutes before shutdown aren't lost
+            if telemetry_log: telemetry_log.close()
+            for log in rollup_logs.values(): log.close()
+        finally:
+            storage_lock.release()
+    else:
+        logger.error("Main loop holds the storage lock, shutting down without a final flush")
+    # Writers spool what is queued; stop them all at once and share one deadline
+    writers = ([influx_writer] if influx_writer else []) + list(rollup_writers.values())
+    for writer in writers: writer.request_stop()
+    for writer in writers: writer.join(timeout=remaining())
+    if alert_dispatcher: alert_dispatcher.flush(timeout=remaining())
+    hardware.poweroff()
+
+def process_sample(data, tick=None):
+    """One pass of the main loop over a merged sensor snapshot: publish, alert, decide, log.
+    The sample is stamped with the tick's monotonic and wall time (or the clock's, without one)."""
+    global latest_data
+    t_start = t = time.perf_counter()
+    if tick is not None:
+        data['monotonic'], ts = tick.monotonic, tick.wall
+    else:
+        data['monotonic'], ts = hardware.clock.monotonic(), hardware.clock.time()
+    data['timestamp'] = datetime.fromtimestamp(ts).isoformat()
+    data['net_watts'] = data['solar_watts'] - data['system_watts']
+    data['soc_pct'] = soc_estimator.soc * 100.0 if soc_estimator.soc is not None else 0.0
+    data['runtime_h'] = soc_estimator.runtime_hours()
+    is_open = data['lid_open']
+
+    # Update Global State for !status command
+    latest_data = data
+
+    # Export for TAK / Meshtastic Bridges (shared memory)
+    if status_writer:
+        try: status_writer.publish(data, current_mode)
+        except Exception as e:
+            SINK_ERRORS.labels("status").inc()
+            logger.error(f"Status Publish Failed: {e}")
+    t = observe_stage("publish", t)
+
+    # Check Thresholds
+    check_sensor_thresholds(data)
+    t = observe_stage("thresholds", t)
+
+    # Check Auto Mode
+    check_auto_mode(data)
+    t = observe_stage("auto_mode", t)
+
+    # Logging
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(f"Sol: {data['solar_watts']:.1f}W | Sys: {data['system_watts']:.1f}W | "
+                    f"Net: {data['net_watts']:.1f}W | {data['temperature']:.1f}°C | "
+                    f"Lid: {is_open} | {data['heading']:.0f}° | {data['lux']:.1f} lx")
+
+    # Low-voltage shutdown is handled by the voltage guard thread, not here
+    with storage_lock:
+        if shutting_down: return
+        # Storage: only the points that leave their tolerance band (or are due for a keepalive)
+        records = compressor.process(ts, data) if compressor else [(ts, data, INFLUX_FIELDS)]
+        t = observe_stage("compress", t)
+        store_records(records)
+        t = observe_stage("store", t)
+
+        # Streaming rollups over every sample (the sinks run only when a window closes)
+        rollups.add(ts, data)
+    observe_stage("rollups", t)
+    observe_stage("total", t_start)
+
+i2c_bus = None
 
 def main():
-    i2c = busio.I2C(board.SCL, board.SDA)
-    sensors = initialize_sensors(i2c)
+    global i2c_bus, sample_ticker, voltage_guard
+    init_plugins()
+    setup_gpio()
+    i2c_bus = I2CBusManager(I2C_BUS)
+    sensors = initialize_sensors(i2c_bus)
+    # Battery protection first, so nothing started below can delay it
+    if 'system' in sensors:
+        voltage_guard = VoltageGuard(sensors['system'].read_bus_volts, shutdown, hardware.poweroff,
+                                     SHUTDOWN_VOLTAGE, interval=VOLTAGE_GUARD_INTERVAL,
+                                     window=VOLTAGE_GUARD_WINDOW, hold=VOLTAGE_GUARD_HOLD_S,
+                                     shutdown_timeout=SHUTDOWN_TIMEOUT_S,
+                                     on_blind=lambda message: send_matrix_alert(message, key="voltage_guard_blind"))
+        voltage_guard.start()
+    else:
+        logger.error("System INA219 missing: NO low-voltage shutdown protection!")
+    if influx_writer: influx_writer.start()
+    for writer in rollup_writers.values(): writer.start()
+    if matrix_worker: matrix_worker.start()
     
     hostname = socket.gethostname()
     
@@ -621,110 +975,33 @@ def main():
     send_matrix_alert(f"🟢 Monitor Online on {hostname}. Audio & Sensors Active. Listening for '!wifi on/off'.")
     logger.info("Starting Power Monitor Loop...")
 
-    low_voltage_counter = 0
-    last_accel = None
-    last_lid_state = False 
-
-    while True:
-        # Check Matrix for Commands
-        check_matrix_commands()
-
-        data = {
-            'timestamp': datetime.now().isoformat(),
-            'solar_volts': 0.0, 'solar_amps': 0.0, 'solar_watts': 0.0,
-            'system_volts': 0.0, 'system_amps': 0.0, 'system_watts': 0.0,
-            'net_watts': 0.0, 'temperature': 0.0, 'humidity': 0.0, 'pressure': 0.0,
-            'lid_open': False, 'heading': 0.0, 'lux': 0.0
-        }
+    # Initial WiFi Config
+    set_tx_power(WIFI_TXPOWER_DBM)
+    set_wifi_powersave(True)
 
-        # 0. Check Lid
-        is_open = GPIO.input(PIN_LID_SENSOR) == GPIO.HIGH
-        data['lid_open'] = is_open
+    scheduler = build_scheduler(sensors)
+    scheduler.start()
 
-        if is_open and not last_lid_state:
-            buzz(0.5) # Warning Beep
-            send_matrix_alert("🔓 SECURITY ALERT: Le Réduit Lid Opened!")
-        elif not is_open and last_lid_state:
-            send_matrix_alert("🔒 Info: Lid Closed.")
-        last_lid_state = is_open
-
-        # 1. Read Temp
-        data['temperature'] = get_temperature()
-
-        # 2. Read Power
-        if 'solar' in sensors:
-            try:
-                data['solar_volts'] = sensors['solar'].bus_voltage
-                data['solar_amps'] = sensors['solar'].current / 1000.0
-                data['solar_watts'] = sensors['solar'].power / 1000.0
-            except: pass
-        if 'system' in sensors:
-            try:
-                data['system_volts'] = sensors['system'].bus_voltage
-                data['system_amps'] = sensors['system'].current / 1000.0
-                data['system_watts'] = sensors['system'].power / 1000.0
-            except: pass
-        data['net_watts'] = data['solar_watts'] - data['system_watts']
-
-        # 3. Read Environment (BME + Light)
-        if 'bme' in sensors:
-            try:
-                data['humidity'] = sensors['bme'].humidity
-                data['pressure'] = sensors['bme'].pressure
-            except: pass
-            
-        if 'light' in sensors:
-            try:
-                data['lux'] = sensors['light'].lux
-            except: pass
-
-        # 4. Read Compass
-        if 'compass' in sensors:
-            data['heading'] = sensors['compass'].read_heading()
-
-        # 5. Check Motion
-        if 'mpu' in sensors:
-            try:
-                accel = sensors['mpu'].acceleration
-                if last_accel:
-                    delta = math.sqrt(sum((a-b)**2 for a, b in zip(accel, last_accel)))
-                    if delta > TAMPER_THRESHOLD_G:
-                        buzz(0.1, 3) # fast alarm
-                        send_matrix_alert(f"🏃‍♂️ MOVEMENT DETECTED! Delta: {delta:.2f}g")
-                last_accel = accel
-            except: pass
-
-        # Check Thresholds (New)
-        check_sensor_thresholds(data)
-
-        # Logging
-        msg = (f"Sol: {data['solar_watts']:.1f}W | Sys: {data['system_watts']:.1f}W | "
-               f"Net: {data['net_watts']:.1f}W | {data['temperature']:.1f}°C | "
-               f"Lid: {is_open} | {data['heading']:.0f}° | {data['lux']:.1f} lx")
-        logger.info(msg)
-
-        write_to_influx(data)
-
-        # Shutdown Logic
-        current_voltage = data['system_volts']
-        if 0.5 < current_voltage < SHUTDOWN_VOLTAGE:
-            low_voltage_counter += 1
-            if low_voltage_counter >= SHUTDOWN_GRACE_PERIOD_SAMPLES:
-                buzz(1.0) # Shutdown tone
-                send_matrix_alert(f"🔴 CRITICAL LOW VOLTAGE ({current_voltage:.2f}V). Shutting down.")
-                time.sleep(2)
-                os.system("shutdown -h now")
-        else:
-            low_voltage_counter = 0
+    tamper = None
+    if 'mpu' in sensors:
+        tamper = plugins.create('tamper', sensors['mpu'], on_tamper_event, rate_hz=TAMPER_SAMPLE_RATE_HZ,
+                                rms_g=TAMPER_RMS_G, peak_g=TAMPER_PEAK_G,
+                                tilt_deg=TAMPER_TILT_DEG, tilt_hold=TAMPER_TILT_HOLD_S)
+        try:
+            if tamper: tamper.start()
+        except Exception as e:
+            logger.error(f"Tamper detector failed to start: {e}")
 
-        # CSV Log
-        try: log_to_csv(data)
-        except: pass
+    sample_ticker = SampleTicker(current_sample_interval, hardware.clock, policy=SAMPLE_TICK_POLICY)
+    register_metrics(i2c_bus, tamper)
+    start_metrics_server(METRICS_PORT)
 
-        try: log_to_csv(data)
-        except: pass
+    while True:
+        # Fixed-rate ticks; commands are handled while waiting, so they take effect immediately
+        tick = sample_ticker.wait(idle=wait_for_command)
 
-        time.sleep(current_sample_interval)
+        # Merge the latest value of every sensor (each runs at its own rate)
+        process_sample(scheduler.snapshot(SNAPSHOT_DEFAULTS), tick)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,227 @@
+"""Replays recorded telemetry through fake sensor drivers, on a virtual clock.
+
+A recording is either a binary telemetry log directory (telemetry_log.py) or a CSV in
+the exported / legacy reduit_power.csv format. Drivers return the values of the row that
+was current at the virtual time, so the monitor can run much faster than real time.
+"""
+import csv
+import math
+import bisect
+import logging
+import os
+from datetime import datetime
+
+import numpy as np
+
+from telemetry_log import POWER_SCHEMA, read_log, schema_dtype
+
+logger = logging.getLogger(__name__)
+
+POWER_DTYPE = schema_dtype(POWER_SCHEMA)
+
+
+# --- Recordings ---
+def load_recording(path):
+    """Returns the recording as a structured array with the POWER_SCHEMA fields."""
+    if os.path.isdir(path):
+        arr = read_log(path)
+    else:
+        arr = _load_csv(path)
+    if not len(arr):
+        raise ValueError(f"Recording {path} is empty")
+    arr = np.sort(arr, order='timestamp')
+    logger.info(f"Loaded {len(arr)} samples spanning {(arr['timestamp'][-1] - arr['timestamp'][0]) / 3600:.1f}h from {path}")
+    return arr
+
+
+def _load_csv(path):
+    rows = []
+    with open(path, newline="") as f:
+        for rec in csv.DictReader(f):
+            row = []
+            for name, _ in POWER_SCHEMA:
+                value = rec.get(name, "")
+                if name == 'timestamp':
+                    row.append(datetime.fromisoformat(value).timestamp())
+                elif name == 'lid_open':
+                    row.append(1 if value in ("True", "1", "true") else 0)
+                else:
+                    row.append(float(value) if value not in ("", None) else 0.0)
+            rows.append(tuple(row))
+    return np.array(rows, dtype=POWER_DTYPE)
+
+
+def synthesize(days=7.0, interval=5.0, start=None, seed=1):
+    """Generates a plausible recording (solar day cycle, clouds, load, lid openings)
+    for when no real log is at hand."""
+    rng = np.random.default_rng(seed)
+    start = datetime(2025, 6, 1).timestamp() if start is None else start
+    t = start + np.arange(0.0, days * 86400.0, interval)
+    n = len(t)
+    hour = (t - start) / 3600.0 % 24.0
+
+    daylight = np.clip(np.sin((hour - 6.0) / 14.0 * math.pi), 0.0, None)
+    clouds = np.clip(1.0 - np.abs(np.cumsum(rng.normal(0, 0.01, n))) % 1.0 * 0.7, 0.2, 1.0)
+    solar_w = 100.0 * daylight * clouds
+    system_w = 4.5 + rng.normal(0, 0.3, n) + (rng.random(n) < 0.01) * 6.0
+
+    # Crude battery model so the voltage tracks the energy balance
+    capacity_wh = 100.0 * 12.8
+    energy = np.clip(0.6 * capacity_wh + np.cumsum((solar_w * 0.95 - system_w) * interval / 3600.0),
+                     0.0, capacity_wh)
+    soc = energy / capacity_wh
+    system_v = 12.0 + 1.4 * soc + np.where(solar_w > 5, 0.4, 0.0) + rng.normal(0, 0.01, n)
+    solar_v = np.where(daylight > 0.02, 18.0 + rng.normal(0, 0.2, n), 0.5)
+
+    temp = 15.0 + 8.0 * np.sin((hour - 9.0) / 24.0 * 2 * math.pi) + rng.normal(0, 0.1, n)
+    lid = np.zeros(n, dtype=np.uint8)
+    for i in rng.integers(0, n, max(1, int(days))):
+        lid[i:i + int(300 / interval)] = 1
+
+    arr = np.zeros(n, dtype=POWER_DTYPE)
+    arr['timestamp'] = t
+    arr['solar_volts'], arr['solar_watts'] = solar_v, solar_w
+    arr['solar_amps'] = solar_w / solar_v
+    arr['system_volts'], arr['system_watts'] = system_v, system_w
+    arr['system_amps'] = system_w / system_v
+    arr['net_watts'] = solar_w - system_w
+    arr['temperature'] = temp
+    arr['humidity'] = np.clip(60.0 - (temp - 15.0) * 2.0 + rng.normal(0, 1, n), 0, 100)
+    arr['pressure'] = 1013.0 + np.cumsum(rng.normal(0, 0.01, n))
+    arr['lid_open'] = lid
+    arr['heading'] = 180.0 + rng.normal(0, 0.5, n)
+    arr['lux'] = daylight * clouds * 20000.0 * lid + rng.random(n) * 0.2
+    return arr
+
+
+# --- Virtual Clock ---
+class ReplayClock:
+    """Drop-in for hardware.SystemClock; only moves when the replay advances it."""
+
+    def __init__(self, start):
+        self.start = start
+        self.now = start
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now - self.start
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+# --- Source ---
+class ReplaySource:
+    """Serves the recorded row that was current at the clock's time. With repeat > 1
+    the recording is played back-to-back, shifted in time, to simulate longer spans."""
+
+    def __init__(self, records, clock, repeat=1):
+        self.records = records
+        self.clock = clock
+        self.names = records.dtype.names
+        self._times = records['timestamp'].tolist()
+        gap = self._times[1] - self._times[0] if len(self._times) > 1 else 1.0
+        self.period = self._times[-1] - self._times[0] + gap
+        self.start = self._times[0]
+        self.end = self.start + self.period * repeat
+        self._at = None
+        self._index = -1
+        self._cycle = 0
+        self._row = None
+
+    @property
+    def done(self):
+        return self.clock.time() >= self.end
+
+    @property
+    def row(self):
+        """The current row as a dict (cached until the clock moves to another row)."""
+        now = self.clock.time()
+        if now == self._at:
+            return self._row
+        self._at = now
+        offset = now - self.start
+        cycle = int(offset // self.period)
+        i = max(0, bisect.bisect_right(self._times, self.start + offset - cycle * self.period) - 1)
+        if (i, cycle) != (self._index, self._cycle) or self._row is None:
+            self._index, self._cycle = i, cycle
+            self._row = dict(zip(self.names, self.records[i].tolist()))
+        return self._row
+
+
+# --- Fake Drivers ---
+class ReplayDevice:
+    def __init__(self, source, name):
+        self.source = source
+        self.name = name
+        self.reads = 0
+
+
+class ReplayINA219(ReplayDevice):
+    def read(self):
+        r = self.source.row
+        self.reads += 1
+        return r[f'{self.name}_volts'], r[f'{self.name}_amps'], r[f'{self.name}_watts']
+
+    def read_bus_volts(self):
+        self.reads += 1
+        return self.source.row[f'{self.name}_volts']
+
+
+class ReplayBME280(ReplayDevice):
+    def read(self):
+        r = self.source.row
+        self.reads += 1
+        return r['temperature'], r['humidity'], r['pressure']
+
+
+class ReplayBH1750(ReplayDevice):
+    def read(self):
+        self.reads += 1
+        return self.source.row['lux']
+
+
+class ReplayCompass(ReplayDevice):
+    def read_heading(self):
+        self.reads += 1
+        return self.source.row['heading']
+
+
+class ReplayMPU6050(ReplayDevice):
+    """The log holds no acceleration; the box sits still."""
+    ACCEL_LSB_PER_G = 16384.0
+
+    def read(self):
+        return 0.0, 0.0, 9.80665
+
+    def enable_fifo(self, rate_hz=100):
+        return rate_hz
+
+    def reset_fifo(self):
+        pass
+
+    def read_fifo(self):
+        return b"", False
+
+
+class ReplayThermSensor(ReplayDevice):
+    """Stands in for W1ThermSensor."""
+    id = "replay"
+
+    def get_temperature(self):
+        self.reads += 1
+        return self.source.row['temperature']
+
+
+def replay_sensors(source):
+    """Same shape as power_monitor.initialize_sensors(), backed by the recording."""
+    return {
+        'solar': ReplayINA219(source, 'solar'),
+        'system': ReplayINA219(source, 'system'),
+        'bme': ReplayBME280(source, 'bme'),
+        'mpu': ReplayMPU6050(source, 'mpu'),
+        'light': ReplayBH1750(source, 'light'),
+        'compass': ReplayCompass(source, 'compass'),
+    }
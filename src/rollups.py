@@ -0,0 +1,145 @@
+"""Streaming min/max/mean/last rollups over fixed wall-clock windows.
+
+The finest tier accumulates raw samples; every window it closes is merged into the
+next tier up, so a sample costs O(fields) no matter how many tiers there are and each
+tier holds exactly one window of state. Windows are aligned to multiples of their
+length since the epoch (e.g. 10:00, 10:15, 10:30 for 15 min), so tiers line up.
+"""
+import math
+import logging
+
+logger = logging.getLogger(__name__)
+
+STATS = ('min', 'max', 'mean', 'last')
+
+# (name, window seconds); each window must be a multiple of the one before
+DEFAULT_TIERS = (('1m', 60), ('15m', 900), ('1h', 3600))
+
+
+class Window:
+    """Running min/max/sum/count/last per field for one window (reused, never reallocated)."""
+    __slots__ = ('start', 'count', 'mins', 'maxs', 'sums', 'counts', 'lasts')
+
+    def __init__(self, size):
+        self.mins = [0.0] * size
+        self.maxs = [0.0] * size
+        self.sums = [0.0] * size
+        self.counts = [0] * size
+        self.lasts = [0.0] * size
+        self.reset(None)
+
+    def reset(self, start):
+        self.start = start
+        self.count = 0
+        for i in range(len(self.counts)):
+            self.mins[i], self.maxs[i], self.sums[i], self.counts[i] = math.inf, -math.inf, 0.0, 0
+
+    def add(self, data, fields):
+        """Adds the given fields of one sample dict; missing (None) and NaN values are skipped."""
+        mins, maxs, sums, counts, lasts = self.mins, self.maxs, self.sums, self.counts, self.lasts
+        for i, name in enumerate(fields):
+            v = data.get(name)
+            if v is None or v != v: continue
+            if v < mins[i]: mins[i] = v
+            if v > maxs[i]: maxs[i] = v
+            sums[i] += v
+            counts[i] += 1
+            lasts[i] = v
+        self.count += 1
+
+    def merge(self, other):
+        """Folds a closed lower-tier window into this one."""
+        for i, n in enumerate(other.counts):
+            if not n: continue
+            if other.mins[i] < self.mins[i]: self.mins[i] = other.mins[i]
+            if other.maxs[i] > self.maxs[i]: self.maxs[i] = other.maxs[i]
+            self.sums[i] += other.sums[i]
+            self.counts[i] += n
+            self.lasts[i] = other.lasts[i]
+        self.count += other.count
+
+
+class Rollup:
+    """One closed window of one tier, handed to the on_rollup callback."""
+    __slots__ = ('tier', 'start', 'seconds', 'count', 'stats')
+
+    def __init__(self, tier, seconds, window, fields):
+        self.tier = tier
+        self.start = window.start
+        self.seconds = seconds
+        self.count = window.count
+        # field -> (min, max, mean, last); fields without a single value are left out
+        self.stats = {
+            name: (float(window.mins[i]), float(window.maxs[i]),
+                   window.sums[i] / window.counts[i], float(window.lasts[i]))
+            for i, name in enumerate(fields) if window.counts[i]
+        }
+
+    def as_dict(self):
+        """Flat {'<field>_<stat>': value} form, as used by the rollup telemetry log schema."""
+        out = {'samples': self.count}
+        for name, values in self.stats.items():
+            for stat, value in zip(STATS, values):
+                out[f"{name}_{stat}"] = value
+        return out
+
+
+def rollup_schema(fields):
+    """TelemetryLog schema for one rollup tier: window start, sample count, then every stat."""
+    return [('timestamp', 'd'), ('samples', 'I')] + \
+        [(f"{name}_{stat}", 'f') for name in fields for stat in STATS]
+
+
+class RollupAggregator:
+    """Feeds samples into cascading tiers and calls on_rollup(Rollup) as windows close.
+
+    Upper tiers close when the tier below hands over its first window past their end,
+    i.e. at most one finest window late.
+    """
+
+    def __init__(self, fields, on_rollup, tiers=DEFAULT_TIERS):
+        self.fields = list(fields)
+        self.on_rollup = on_rollup
+        self.tiers = [(name, seconds) for name, seconds in tiers]
+        for (_, lower), (name, upper) in zip(self.tiers, self.tiers[1:]):
+            if upper % lower:
+                raise ValueError(f"Rollup tier {name} ({upper}s) is not a multiple of {lower}s")
+        self._windows = [Window(len(self.fields)) for _ in self.tiers]
+        self.emitted = {name: 0 for name, _ in self.tiers}
+
+    def add(self, ts, data):
+        """Adds one sample dict taken at epoch time ts."""
+        self._advance(0, ts)
+        self._windows[0].add(data, self.fields)
+
+    def _advance(self, level, ts):
+        """Makes the window at `level` the one containing ts, closing the current one if needed."""
+        seconds = self.tiers[level][1]
+        start = ts - ts % seconds
+        window = self._windows[level]
+        if window.start == start:
+            return
+        if window.count:
+            self._close(level)
+        window.reset(start)
+
+    def _close(self, level):
+        name, seconds = self.tiers[level]
+        window = self._windows[level]
+        try:
+            self.on_rollup(Rollup(name, seconds, window, self.fields))
+        except Exception as e:
+            logger.error(f"Rollup sink failed for tier {name}: {e}")
+        self.emitted[name] += 1
+        if level + 1 < len(self.tiers):
+            self._advance(level + 1, window.start)
+            self._windows[level + 1].merge(window)
+
+    def flush(self):
+        """Emits the open (partial) windows of every tier, e.g. before shutdown. Their
+        `count` tells how much of the window they cover."""
+        for level in range(len(self.tiers)):
+            window = self._windows[level]
+            if window.count:
+                self._close(level)
+                window.reset(None)
@@ -0,0 +1,135 @@
+import os
+import math
+import mmap
+import time
+import struct
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Shared between the power monitor (writer) and the TAK / Meshtastic bridges (readers).
+# Lives on tmpfs; pods mount the host's /dev/shm/reduit to share it.
+STATUS_PATH = os.getenv("REDUIT_STATUS_PATH", "/dev/shm/reduit/status")
+
+MAGIC = b"RDST"
+VERSION = 2
+
+# Order is the wire layout; append only (and bump VERSION) when adding fields.
+# A reading the monitor doesn't have (failed sensor) is stored as NaN and read back as None.
+FIELDS = (
+    'solar_volts', 'solar_amps', 'solar_watts',
+    'system_volts', 'system_amps', 'system_watts', 'net_watts',
+    'temperature', 'humidity', 'pressure',
+    'lid_open', 'heading', 'lux', 'mode',
+    'soc_pct', 'runtime_h',
+)
+MODES = ('unknown', 'sentry', 'tactical', 'manual')
+
+# magic, version, field count, sequence counter (odd while a write is in progress)
+_HEADER = struct.Struct("<4sHHQ")
+_SEQ = struct.Struct("<Q")
+_SEQ_OFFSET = 8
+# wall time (epoch s), writer monotonic time, then one float64 per field
+_PAYLOAD = struct.Struct("<dd" + "d" * len(FIELDS))
+SIZE = _HEADER.size + _PAYLOAD.size
+
+
+# --- Writer ---
+class StatusWriter:
+    """Publishes the latest status into a fixed-layout shared-memory segment guarded by a seqlock."""
+
+    def __init__(self, path=STATUS_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            os.ftruncate(fd, SIZE)
+            self._mm = mmap.mmap(fd, SIZE, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+        finally:
+            os.close(fd)
+        magic, version, count, seq = _HEADER.unpack_from(self._mm, 0)
+        # Continue an existing counter so readers never see the sequence go backwards
+        self._seq = seq + (seq & 1) if (magic, version, count) == (MAGIC, VERSION, len(FIELDS)) else 0
+        _HEADER.pack_into(self._mm, 0, MAGIC, VERSION, len(FIELDS), self._seq)
+
+    def publish(self, data, mode="unknown"):
+        values = []
+        for name in FIELDS:
+            if name == 'mode':
+                values.append(float(MODES.index(mode)) if mode in MODES else 0.0)
+            else:
+                value = data.get(name)
+                values.append(math.nan if value is None else float(value))
+        # Seqlock: odd = write in progress, even = consistent
+        self._seq += 1
+        _SEQ.pack_into(self._mm, _SEQ_OFFSET, self._seq)
+        _PAYLOAD.pack_into(self._mm, _HEADER.size, time.time(), time.monotonic(), *values)
+        self._seq += 1
+        _SEQ.pack_into(self._mm, _SEQ_OFFSET, self._seq)
+
+    def close(self):
+        self._mm.close()
+
+
+# --- Reader ---
+class StatusReader:
+    """Lock-free reader: after the segment is mapped, a read is two counter loads and one unpack."""
+
+    def __init__(self, path=STATUS_PATH, max_age=120.0):
+        self.path = path
+        self.max_age = max_age
+        self._mm = None
+        self._next_open = 0.0
+
+    def _open(self):
+        # Monitor may not be up yet; don't stat the file more than once a second
+        now = time.monotonic()
+        if now < self._next_open: return False
+        self._next_open = now + 1.0
+        try:
+            with open(self.path, "rb") as f:
+                mm = mmap.mmap(f.fileno(), SIZE, mmap.MAP_SHARED, mmap.PROT_READ)
+        except (OSError, ValueError):
+            return False
+        magic, version, count, _ = _HEADER.unpack_from(mm, 0)
+        if (magic, version, count) != (MAGIC, VERSION, len(FIELDS)):
+            logger.warning(f"Status segment {self.path} has an unexpected layout (v{version}), ignoring.")
+            mm.close()
+            return False
+        self._mm = mm
+        return True
+
+    def sequence(self):
+        """The writer's sequence counter (changes on every publish), or None before the first
+        one; lets callers skip read() while nothing new was published."""
+        if self._mm is None and not self._open():
+            return None
+        seq = _SEQ.unpack_from(self._mm, _SEQ_OFFSET)[0]
+        return seq if seq and not seq & 1 else None
+
+    def read(self, retries=100):
+        """Returns the latest status dict (with 'updated', 'age' and 'stale'), or None.
+        Readings the monitor didn't have are None."""
+        if self._mm is None and not self._open():
+            return None
+        mm = self._mm
+        for _ in range(retries):
+            seq1 = _SEQ.unpack_from(mm, _SEQ_OFFSET)[0]
+            if seq1 & 1: continue
+            payload = _PAYLOAD.unpack_from(mm, _HEADER.size)
+            if _SEQ.unpack_from(mm, _SEQ_OFFSET)[0] == seq1: break
+        else:
+            return None
+        if seq1 == 0:
+            return None # Never written
+        updated = payload[0]
+        data = {name: None if math.isnan(value) else value for name, value in zip(FIELDS, payload[2:])}
+        if data['lid_open'] is not None:
+            data['lid_open'] = bool(data['lid_open'])
+        mode = int(data['mode'] or 0)
+        data['mode'] = MODES[mode] if 0 <= mode < len(MODES) else 'unknown'
+        data['updated'] = updated
+        data['age'] = time.time() - updated
+        data['stale'] = data['age'] > self.max_age
+        data['version'] = seq1
+        return data
@@ -0,0 +1,323 @@
+import ssl
+import time
+import random
+import socket
+import asyncio
+import logging
+import threading
+import ipaddress
+from collections import deque, OrderedDict
+from urllib.parse import urlsplit, parse_qs
+
+from cot import CotEncoder, TakProtoEncoder, DEFAULT_TYPE, UNKNOWN
+from metrics import Counter, Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+PACKETS = Counter("reduit_tak_packets_total", "CoT packets sent per sink.", ["sink"])
+BYTES_SENT = Counter("reduit_tak_bytes_total", "CoT payload bytes sent per sink.", ["sink"])
+DROPPED = Counter("reduit_tak_dropped_total", "CoT packets dropped by a sink's queue policy.", ["sink"])
+SINK_ERRORS = Counter("reduit_tak_sink_errors_total", "Failed sends / connects per sink.", ["sink"])
+RECONNECTS = Counter("reduit_tak_reconnects_total", "Stream sink (re)connections.", ["sink"])
+QUEUE_DEPTH = Gauge("reduit_tak_queue_depth", "CoT packets waiting per sink.", ["sink"])
+CONNECTED = Gauge("reduit_tak_sink_connected", "1 while a sink can send.", ["sink"])
+SEND_SECONDS = Histogram("reduit_tak_send_seconds", "Time to hand one packet to a sink's socket.", ["sink"])
+PACKET_BYTES = Histogram("reduit_tak_packet_bytes", "Size of the CoT packets encoded.", ["encoding"],
+                         buckets=(64, 128, 192, 256, 384, 512, 768, 1024, 1500))
+
+
+# --- Sinks ---
+class CotSink:
+    """One destination with its own bounded queue. `drop` decides what goes when the queue
+    is full: "oldest" (default; for PLI only the newest position matters) or "newest"."""
+    framing = "mesh"
+
+    def __init__(self, name, protocol="xml", queue_size=64, drop="oldest"):
+        if protocol not in ("xml", "protobuf"):
+            raise ValueError(f"Unknown TAK protocol for sink {name}: {protocol}")
+        if drop not in ("oldest", "newest"):
+            raise ValueError(f"Unknown drop policy for sink {name}: {drop}")
+        self.name = name
+        self.protocol = protocol
+        self.drop = drop
+        self.queue = deque(maxlen=queue_size)
+        self._wakeup = None
+        self._loop = None
+
+        self.connected = False
+        self.sent = 0
+        self.dropped = 0
+        self.errors = 0
+        self._packets = PACKETS.labels(name)
+        self._bytes = BYTES_SENT.labels(name)
+        self._dropped = DROPPED.labels(name)
+        self._errors = SINK_ERRORS.labels(name)
+        self._send_seconds = SEND_SECONDS.labels(name)
+        QUEUE_DEPTH.labels(name).set_function(lambda: len(self.queue))
+        CONNECTED.labels(name).set_function(lambda: 1 if self.connected else 0)
+
+    @property
+    def wire_format(self):
+        return (self.protocol, self.framing if self.protocol == "protobuf" else None)
+
+    def offer(self, payload):
+        """Queues one packet; safe to call from any thread."""
+        if len(self.queue) == self.queue.maxlen:
+            self.dropped += 1
+            self._dropped.inc()
+            if self.drop == "newest":
+                return False
+        self.queue.append(payload) # A full deque discards its oldest entry
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+        return True
+
+    async def _next(self):
+        while not self.queue:
+            self._wakeup.clear()
+            await self._wakeup.wait()
+        return self.queue.popleft()
+
+    def _requeue(self, payload):
+        """Puts a packet that couldn't be sent back at the head (unless newer ones filled the queue)."""
+        if len(self.queue) < self.queue.maxlen:
+            self.queue.appendleft(payload)
+        else:
+            self.dropped += 1
+            self._dropped.inc()
+
+    def _sent(self, payload, seconds):
+        self.sent += 1
+        self._packets.inc()
+        self._bytes.inc(len(payload))
+        self._send_seconds.observe(seconds)
+
+    def _failed(self, e, what="send"):
+        self.errors += 1
+        self._errors.inc()
+        if self.errors == 1 or self.errors % 100 == 0:
+            logger.warning(f"TAK sink {self.name} {what} failed ({self.errors}x): {e or type(e).__name__}")
+
+    async def run(self):
+        self._wakeup = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        await self._run()
+
+    def stats(self):
+        return {'protocol': self.protocol, 'connected': self.connected, 'queue_depth': len(self.queue),
+                'sent': self.sent, 'dropped': self.dropped, 'errors': self.errors}
+
+
+class UdpSink(CotSink):
+    """UDP unicast or multicast (mesh SA). A send never waits: a full socket buffer counts
+    as an error and the packet is dropped."""
+
+    def __init__(self, name, host, port, ttl=2, **kwargs):
+        super().__init__(name, **kwargs)
+        self.addr = (host, port)
+        self.ttl = ttl
+
+    async def _run(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        try:
+            # Resolved once, off the event loop; sendto() with a hostname would look it up per packet
+            infos = await asyncio.get_running_loop().getaddrinfo(
+                self.addr[0], self.addr[1], family=socket.AF_INET, type=socket.SOCK_DGRAM)
+            addr = infos[0][4]
+            if ipaddress.ip_address(addr[0]).is_multicast:
+                sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, self.ttl)
+            sock.setblocking(False)
+            self.connected = True
+            while True:
+                payload = await self._next()
+                t0 = time.perf_counter()
+                try:
+                    sock.sendto(payload, addr)
+                except OSError as e:
+                    self._failed(e)
+                    continue
+                self._sent(payload, time.perf_counter() - t0)
+        finally:
+            self.connected = False
+            sock.close()
+
+
+class StreamSink(CotSink):
+    """Persistent TCP or TLS connection to a TAK server (OpenTAKServer: 8088 TCP, 8089 TLS).
+
+    Packets wait in the queue while disconnected (drop policy applies); the connection is
+    re-established with exponential backoff and jitter. Anything the server sends (other
+    clients' events, pings) is read and discarded, so its socket never backs up."""
+    framing = "stream"
+
+    def __init__(self, name, host, port, ssl_context=None, connect_timeout=10.0, write_timeout=10.0,
+                 backoff_min=1.0, backoff_max=60.0, **kwargs):
+        super().__init__(name, **kwargs)
+        self.host = host
+        self.port = port
+        self.ssl_context = ssl_context
+        self.connect_timeout = connect_timeout
+        self.write_timeout = write_timeout
+        self.backoff_min = backoff_min
+        self.backoff_max = backoff_max
+        self.reconnects = 0
+        RECONNECTS.labels(name).set_function(lambda: self.reconnects)
+
+    async def _run(self):
+        backoff = self.backoff_min
+        while True:
+            try:
+                reader, writer = await asyncio.wait_for(
+                    asyncio.open_connection(self.host, self.port, ssl=self.ssl_context), self.connect_timeout)
+            except (OSError, asyncio.TimeoutError, ssl.SSLError) as e:
+                self._failed(e, "connect")
+                await asyncio.sleep(backoff * random.uniform(0.8, 1.2))
+                backoff = min(backoff * 2.0, self.backoff_max)
+                continue
+            sock = writer.get_extra_info('socket')
+            if sock is not None:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            self.reconnects += 1
+            self.connected = True
+            connected_at = time.monotonic()
+            logger.info(f"TAK sink {self.name} connected to {self.host}:{self.port}")
+            try:
+                await self._stream(reader, writer)
+            finally:
+                self.connected = False
+                writer.close()
+            # A server that accepts and drops us right away is backed off like a failed connect
+            if time.monotonic() - connected_at > self.backoff_max:
+                backoff = self.backoff_min
+            await asyncio.sleep(backoff * random.uniform(0.8, 1.2))
+            backoff = min(backoff * 2.0, self.backoff_max)
+
+    async def _stream(self, reader, writer):
+        """Sends until the connection fails; the packet in flight is requeued for the next one."""
+        drain = asyncio.ensure_future(self._discard(reader))
+        try:
+            while True:
+                send = asyncio.ensure_future(self._next())
+                done, _ = await asyncio.wait((send, drain), return_when=asyncio.FIRST_COMPLETED)
+                if drain in done:
+                    if send.done():
+                        self._requeue(send.result())
+                    send.cancel()
+                    self._failed(drain.exception() or "closed by server", "connection")
+                    return
+                payload = send.result()
+                t0 = time.perf_counter()
+                try:
+                    writer.write(payload)
+                    await asyncio.wait_for(writer.drain(), self.write_timeout)
+                except (OSError, asyncio.TimeoutError) as e:
+                    self._requeue(payload)
+                    self._failed(e)
+                    return
+                self._sent(payload, time.perf_counter() - t0)
+        finally:
+            drain.cancel()
+
+    @staticmethod
+    async def _discard(reader):
+        while await reader.read(65536):
+            pass
+
+
+def tls_context(cert=None, key=None, ca=None, verify_hostname=True):
+    """Client context for TAK servers: usually a private CA (ca) and a client certificate."""
+    context = ssl.create_default_context(cafile=ca)
+    if cert:
+        context.load_cert_chain(cert, key)
+    context.check_hostname = verify_hostname
+    return context
+
+
+def parse_sinks(spec, tls=None):
+    """Builds sinks from a comma-separated list of URLs, e.g.
+    "udp://239.2.3.1:6969,tls://tak.example.org:8089?protocol=protobuf&queue=256".
+    Schemes: udp, tcp, tls. Query: protocol (xml|protobuf), queue (size), drop
+    (oldest|newest), name. `tls` is the ssl context for tls:// sinks."""
+    sinks = []
+    for url in filter(None, (part.strip() for part in spec.split(","))):
+        u = urlsplit(url)
+        q = {k: v[-1] for k, v in parse_qs(u.query).items()}
+        kwargs = {'protocol': q.get('protocol', 'xml'), 'queue_size': int(q.get('queue', 64)),
+                  'drop': q.get('drop', 'oldest')}
+        name = q.get('name', f"{u.scheme}://{u.hostname}:{u.port}")
+        if u.scheme == "udp":
+            sinks.append(UdpSink(name, u.hostname, u.port or 6969, **kwargs))
+        elif u.scheme in ("tcp", "tls"):
+            context = (tls or tls_context()) if u.scheme == "tls" else None
+            sinks.append(StreamSink(name, u.hostname, u.port or (8089 if context else 8088),
+                                    ssl_context=context, **kwargs))
+        else:
+            raise ValueError(f"Unsupported TAK sink: {url}")
+    return sinks
+
+
+# --- Publisher ---
+class CotPublisher:
+    """Encodes each event once per wire format in use and hands it to every sink's queue.
+    publish() never blocks and is safe from any thread; the sinks run on one asyncio loop,
+    either the caller's (await run()) or a background thread's (start())."""
+
+    def __init__(self, sinks, max_entities=1024):
+        self.sinks = list(sinks)
+        self.max_entities = max_entities
+        self._formats = sorted({sink.wire_format for sink in self.sinks}, key=str)
+        self._encoders = OrderedDict() # (wire format, uid, callsign, type) -> encoder, LRU
+        self._packet_bytes = {fmt: PACKET_BYTES.labels(fmt[0]) for fmt in self._formats}
+        self._thread = None
+
+    def _encoder(self, fmt, uid, callsign, cot_type):
+        key = (fmt, uid, callsign, cot_type)
+        encoder = self._encoders.get(key)
+        if encoder is None:
+            protocol, framing = fmt
+            encoder = TakProtoEncoder(uid, callsign, cot_type, framing=framing) if protocol == "protobuf" \
+                else CotEncoder(uid, callsign, cot_type)
+            self._encoders[key] = encoder
+            if len(self._encoders) > self.max_entities * len(self._formats):
+                self._encoders.popitem(last=False)
+        else:
+            self._encoders.move_to_end(key)
+        return encoder
+
+    def publish(self, uid, callsign, lat, lon, hae=0.0, speed=0.0, course=0.0, remarks="",
+                stale=None, cot_type=DEFAULT_TYPE, now=None, ce=UNKNOWN, le=UNKNOWN):
+        """Queues one PLI event on every sink. Returns the encoded size per wire format."""
+        if now is None:
+            now = time.time()
+        payloads = {}
+        for fmt in self._formats:
+            payload = self._encoder(fmt, uid, callsign, cot_type).encode(
+                lat, lon, hae, speed, course, remarks, now=now, stale=stale, ce=ce, le=le)
+            payloads[fmt] = payload
+            self._packet_bytes[fmt].observe(len(payload))
+        for sink in self.sinks:
+            sink.offer(payloads[sink.wire_format])
+        return {fmt: len(p) for fmt, p in payloads.items()}
+
+    async def run(self):
+        """Runs every sink until cancelled; a crashing sink is restarted, the others go on."""
+        await asyncio.gather(*(self._supervise(sink) for sink in self.sinks))
+
+    async def _supervise(self, sink):
+        while True:
+            try:
+                await sink.run()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                sink._failed(e, "task")
+                await asyncio.sleep(5)
+
+    def start(self):
+        """Runs the sinks on a background thread's event loop (for synchronous callers)."""
+        if self._thread: return
+        self._thread = threading.Thread(target=asyncio.run, args=(self.run(),), name="tak-sinks", daemon=True)
+        self._thread.start()
+
+    def stats(self):
+        return {sink.name: sink.stats() for sink in self.sinks}
@@ -0,0 +1,150 @@
+import time
+import logging
+import threading
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+# --- MPU6050 FIFO Tamper Detector ---
+class TamperDetector:
+    """Drains the MPU6050 FIFO at its native rate into a ring buffer and evaluates
+    windowed statistics (vectorized) on every poll:
+
+    * rms   - RMS deviation from the poll's mean acceleration (vibration, handling), in g
+    * peak  - largest sample-to-sample change, in g (knocks, drops)
+    * tilt  - angle between the current gravity vector and the resting orientation,
+              raised once it stays above the threshold for tilt_hold seconds
+
+    `on_event(kind, value)` is called from the detector thread."""
+
+    def __init__(self, mpu, on_event, rate_hz=100, poll_interval=0.5, window_s=2.0,
+                 rms_g=0.05, peak_g=0.3, tilt_deg=10.0, tilt_hold=3.0, tilt_window_s=1.0):
+        self.mpu = mpu
+        self.on_event = on_event
+        self.rate_hz = rate_hz
+        self.poll_interval = poll_interval
+        self.rms_g = rms_g
+        self.peak_g = peak_g
+        self.tilt_cos = np.cos(np.radians(tilt_deg))
+        self.tilt_hold = tilt_hold
+        self.tilt_window_s = tilt_window_s
+        self.window_s = window_s
+
+        self._buf = None
+        self._pos = 0
+        self._filled = 0
+        self._last = None # last sample of the previous chunk (for peak delta)
+        self._rest = None # resting orientation (unit vector, for tilt)
+        self._tilt_since = None
+        self._stop = threading.Event()
+        self._thread = None
+
+        # Stats
+        self.samples = 0
+        self.overflows = 0
+        self.events = 0
+        self.last_rms = 0.0
+        self.last_peak = 0.0
+        self.last_tilt_deg = 0.0
+
+    def start(self):
+        self.rate_hz = self.mpu.enable_fifo(self.rate_hz)
+        size = int(self.rate_hz * self.window_s)
+        self._buf = np.zeros((size, 3), dtype=np.float32)
+        self._thread = threading.Thread(target=self._run, name="tamper", daemon=True)
+        self._thread.start()
+        logger.info(f"Tamper detector reading MPU6050 FIFO at {self.rate_hz:.0f} Hz")
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                raw, overflowed = self.mpu.read_fifo()
+            except Exception as e:
+                logger.warning(f"MPU6050 FIFO read failed: {e}")
+                continue
+            if overflowed:
+                self.overflows += 1
+                self._last = None
+                continue
+            if raw:
+                self.process(np.frombuffer(raw, dtype='>i2').reshape(-1, 3) / self.mpu.ACCEL_LSB_PER_G)
+
+    def _append(self, chunk):
+        n = len(chunk)
+        size = len(self._buf)
+        if n >= size:
+            self._buf[:] = chunk[-size:]
+            self._pos = 0
+        else:
+            idx = (self._pos + np.arange(n)) % size
+            self._buf[idx] = chunk
+            self._pos = (self._pos + n) % size
+        self._filled = min(size, self._filled + n)
+
+    def _recent(self, n):
+        """Last n samples in chronological order."""
+        n = min(n, self._filled)
+        idx = (self._pos - n + np.arange(n)) % len(self._buf)
+        return self._buf[idx]
+
+    def process(self, chunk):
+        """Evaluates one chunk of samples (shape (n, 3), in g)."""
+        if self._buf is None:
+            self._buf = np.zeros((int(self.rate_hz * self.window_s), 3), dtype=np.float32)
+        chunk = np.asarray(chunk, dtype=np.float32)
+        if not len(chunk): return
+        self.samples += len(chunk)
+        self._append(chunk)
+
+        mean = chunk.mean(axis=0)
+        if self._rest is None:
+            self._rest = mean / np.linalg.norm(mean)
+
+        # 1. Vibration / handling: RMS around the chunk mean (gravity and static tilt cancel out)
+        dyn = chunk - mean
+        rms = float(np.sqrt(np.mean(np.einsum('ij,ij->i', dyn, dyn))))
+
+        # 2. Knocks: peak sample-to-sample change (including across the chunk boundary)
+        seq = chunk if self._last is None else np.vstack((self._last, chunk))
+        peak = float(np.max(np.linalg.norm(np.diff(seq, axis=0), axis=1))) if len(seq) > 1 else 0.0
+        self._last = chunk[-1:]
+
+        # 3. Sustained tilt: orientation over the last tilt window vs. resting orientation
+        recent = self._recent(int(self.rate_hz * self.tilt_window_s)).mean(axis=0)
+        cos = float(np.dot(recent, self._rest) / (np.linalg.norm(recent) or 1.0))
+        self.last_tilt_deg = float(np.degrees(np.arccos(np.clip(cos, -1.0, 1.0))))
+
+        self.last_rms, self.last_peak = rms, peak
+        quiet = rms < self.rms_g * 0.5 and peak < self.peak_g * 0.5
+
+        if peak > self.peak_g:
+            self._emit('knock', peak)
+        elif rms > self.rms_g:
+            self._emit('motion', rms)
+
+        now = time.monotonic()
+        if cos < self.tilt_cos:
+            if self._tilt_since is None:
+                self._tilt_since = now
+            elif now - self._tilt_since >= self.tilt_hold and quiet:
+                self._emit('tilt', self.last_tilt_deg)
+                # Re-arm on the new orientation
+                self._rest = recent / np.linalg.norm(recent)
+                self._tilt_since = None
+        else:
+            self._tilt_since = None
+
+    def _emit(self, kind, value):
+        self.events += 1
+        try:
+            self.on_event(kind, value)
+        except Exception as e:
+            logger.error(f"Tamper event handler failed: {e}")
+
+    def stats(self):
+        return {'samples': self.samples, 'overflows': self.overflows, 'events': self.events,
+                'rms_g': self.last_rms, 'peak_g': self.last_peak, 'tilt_deg': self.last_tilt_deg}
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""Compact append-only binary telemetry log.
+
+Each segment file is a fixed-size header (magic, version, JSON schema) followed by
+fixed-size little-endian records, so a segment can be memory-mapped straight into a
+NumPy structured array. Segments rotate by size; the oldest are pruned by total size.
+
+Export to CSV:  python telemetry_log.py /var/log/reduit_power > power.csv
+"""
+import os
+import sys
+import csv
+import glob
+import json
+import time
+import struct
+import logging
+import argparse
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"RDTL"
+VERSION = 1
+HEADER_SIZE = 1024
+SEGMENT_SUFFIX = ".rtl"
+
+# (field, struct code). Timestamp is epoch seconds (UTC) as float64, lid_open a byte.
+POWER_SCHEMA = [
+    ('timestamp', 'd'),
+    ('solar_volts', 'f'), ('solar_amps', 'f'), ('solar_watts', 'f'),
+    ('system_volts', 'f'), ('system_amps', 'f'), ('system_watts', 'f'),
+    ('net_watts', 'f'),
+    ('temperature', 'f'), ('humidity', 'f'), ('pressure', 'f'),
+    ('lid_open', 'B'),
+    ('heading', 'f'), ('lux', 'f'),
+]
+
+_PREAMBLE = struct.Struct("<4sHHI")  # magic, version, reserved, header size
+
+
+def _record_struct(schema):
+    return struct.Struct("<" + "".join(code for _, code in schema))
+
+
+# --- Writer ---
+class TelemetryLog:
+    """Appends fixed-size records to rotating segment files in `directory`."""
+
+    def __init__(self, directory, schema=POWER_SCHEMA, prefix="power",
+                 segment_bytes=4 * 1024 * 1024, max_total_bytes=512 * 1024 * 1024, flush_every=6):
+        self.directory = directory
+        self.schema = schema
+        self.prefix = prefix
+        self.segment_bytes = segment_bytes
+        self.max_total_bytes = max_total_bytes
+        self.flush_every = flush_every
+        self.fields = [name for name, _ in schema]
+        self._record = _record_struct(schema)
+        self._file = None
+        self._size = 0
+        self._pending = 0
+        os.makedirs(directory, exist_ok=True)
+
+    @property
+    def record_size(self):
+        return self._record.size
+
+    def _header(self):
+        meta = json.dumps({
+            'fields': [[name, code] for name, code in self.schema],
+            'record_size': self._record.size,
+            'byte_order': 'little',
+            'created': time.time(),
+            'host': os.uname().nodename,
+        }).encode("utf-8")
+        # Wide schemas (e.g. rollup tiers) take as many HEADER_SIZE blocks as they need
+        size = -(-(_PREAMBLE.size + len(meta)) // HEADER_SIZE) * HEADER_SIZE
+        return (_PREAMBLE.pack(MAGIC, VERSION, 0, size) + meta).ljust(size, b"\0")
+
+    def _open_segment(self):
+        self.close()
+        name = f"{self.prefix}-{datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')}{SEGMENT_SUFFIX}"
+        path = os.path.join(self.directory, name)
+        self._file = open(path, "ab")
+        if self._file.tell() == 0:
+            self._file.write(self._header())
+        self._size = self._file.tell()
+        self._prune()
+
+    def _prune(self):
+        segments = list_segments(self.directory, self.prefix)
+        total = sum(os.path.getsize(p) for p in segments)
+        while total > self.max_total_bytes and len(segments) > 1:
+            oldest = segments.pop(0)
+            total -= os.path.getsize(oldest)
+            os.remove(oldest)
+            logger.info(f"Telemetry log pruned {oldest}")
+
+    def append(self, data, ts=None):
+        """Packs one sample dict; missing fields are written as 0."""
+        if self._file is None or self._size + self._record.size > self.segment_bytes:
+            self._open_segment()
+        values = []
+        for name, code in self.schema:
+            if name == 'timestamp':
+                values.append(ts if ts is not None else time.time())
+            elif code == 'B':
+                values.append(1 if data.get(name) else 0)
+            else:
+                values.append(data.get(name) or 0.0)
+        self._file.write(self._record.pack(*values))
+        self._size += self._record.size
+        # Let the page cache coalesce writes instead of touching the SSD per sample
+        self._pending += 1
+        if self._pending >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        if self._file:
+            self._file.flush()
+        self._pending = 0
+
+    def close(self):
+        if self._file:
+            self._file.flush()
+            self._file.close()
+            self._file = None
+
+
+# --- Reader ---
+def list_segments(directory, prefix="power"):
+    return sorted(glob.glob(os.path.join(directory, f"{prefix}-*{SEGMENT_SUFFIX}")))
+
+
+def read_header(path):
+    with open(path, "rb") as f:
+        raw = f.read(HEADER_SIZE)
+        magic, version, _, header_size = _PREAMBLE.unpack_from(raw)
+        if header_size > len(raw):
+            raw += f.read(header_size - len(raw))
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a telemetry log segment")
+    if version != VERSION:
+        raise ValueError(f"{path}: unsupported telemetry log version {version}")
+    meta = json.loads(raw[_PREAMBLE.size:header_size].rstrip(b"\0").decode("utf-8"))
+    meta['header_size'] = header_size
+    return meta
+
+
+def schema_dtype(fields):
+    import numpy as np
+    return np.dtype([(name, "<" + code.replace("B", "u1")) for name, code in fields])
+
+
+def read_segment(path):
+    """Memory-maps one segment as a NumPy structured array (a torn last record is ignored)."""
+    import numpy as np
+    meta = read_header(path)
+    dtype = schema_dtype(meta['fields'])
+    count = (os.path.getsize(path) - meta['header_size']) // dtype.itemsize
+    if count <= 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", offset=meta['header_size'], shape=(count,))
+
+
+def read_log(directory, prefix="power", since=None, until=None):
+    """Concatenates all segments into one array, optionally filtered by epoch time."""
+    import numpy as np
+    arrays = []
+    for path in list_segments(directory, prefix):
+        arr = read_segment(path)
+        if since is not None or until is not None:
+            ts = arr['timestamp']
+            mask = np.ones(len(arr), dtype=bool)
+            if since is not None: mask &= ts >= since
+            if until is not None: mask &= ts < until
+            arr = arr[mask]
+        if len(arr): arrays.append(np.asarray(arr))
+    if not arrays:
+        return np.empty(0, dtype=schema_dtype(POWER_SCHEMA))
+    return np.concatenate(arrays)
+
+
+def export_csv(directory, out, prefix="power", since=None, until=None):
+    """Writes the log as CSV with the same columns as the old reduit_power.csv."""
+    arr = read_log(directory, prefix, since, until)
+    fields = list(arr.dtype.names)
+    writer = csv.writer(out)
+    writer.writerow(fields)
+    for row in arr.tolist():
+        row = list(row)
+        row[0] = datetime.fromtimestamp(row[0]).isoformat()
+        if 'lid_open' in fields:
+            idx = fields.index('lid_open')
+            row[idx] = bool(row[idx])
+        writer.writerow(row)
+    return len(arr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the Le Reduit binary telemetry log to CSV.")
+    parser.add_argument("directory", nargs="?", default=os.getenv("TELEMETRY_LOG_DIR", "/var/log/reduit_power"))
+    parser.add_argument("--prefix", default="power")
+    parser.add_argument("--since", type=float, help="Start time (epoch seconds)")
+    parser.add_argument("--until", type=float, help="End time (epoch seconds)")
+    args = parser.parse_args()
+    export_csv(args.directory, sys.stdout, args.prefix, args.since, args.until)
+
+
+if __name__ == "__main__":
+    main()